@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from quiz.models import Question, User, Test, Option, Shop, Subjects, UserConfirmation
+from quiz.models import Question, User, Test, Option, Shop, Subjects, UserConfirmation, Purchase, Attempt, Job
 
 # Register your models here.
 
@@ -10,4 +10,7 @@ admin.site.register(Option)
 admin.site.register(Shop)
 admin.site.register(Subjects)
 admin.site.register(User)
-admin.site.register(UserConfirmation)
\ No newline at end of file
+admin.site.register(UserConfirmation)
+admin.site.register(Purchase)
+admin.site.register(Attempt)
+admin.site.register(Job)
@@ -0,0 +1,80 @@
+from array import array
+from bisect import bisect_left
+
+from django.db.models import Max, Q
+
+from quiz.cache import VersionedKeys
+from quiz.models import Question
+
+ANSWER_KEY_TIMEOUT = 24 * 60 * 60
+
+NO_OPTION = 0
+
+
+class AnswerKey:
+    """
+    Question id -> id of its true option for one test, as two parallel
+    packed arrays sorted by question id. `NO_OPTION` marks a question that
+    has no true option yet.
+    """
+
+    def __init__(self, questions=None, options=None):
+        self.questions = questions if questions is not None else array('q')
+        self.options = options if options is not None else array('q')
+
+    def __len__(self):
+        return len(self.questions)
+
+    def index(self, question_id):
+        i = bisect_left(self.questions, question_id)
+        if i < len(self.questions) and self.questions[i] == question_id:
+            return i
+        return None
+
+    def correct_option(self, question_id):
+        i = self.index(question_id)
+        return None if i is None or self.options[i] == NO_OPTION else self.options[i]
+
+    def grade(self, answers):
+        """Return the ids of the questions in `answers` ({question_id: option_id}) answered correctly."""
+        return {
+            question_id for question_id, option_id in answers.items()
+            if option_id is not None and self.correct_option(question_id) == option_id
+        }
+
+    def to_bytes(self):
+        return self.questions.tobytes() + self.options.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        packed = array('q')
+        packed.frombytes(data)
+        half = len(packed) // 2
+        return cls(packed[:half], packed[half:])
+
+
+answer_keys = VersionedKeys('quiz:answer-key', ANSWER_KEY_TIMEOUT)
+
+
+def build_answer_key(test_id):
+    rows = (
+        Question.objects.filter(test_id=test_id)
+        .annotate(correct=Max('options__pk', filter=Q(options__is_true=True)))
+        .order_by('pk')
+        .values_list('pk', 'correct')
+    )
+    key = AnswerKey()
+    for question_id, option_id in rows:
+        key.questions.append(question_id)
+        key.options.append(option_id or NO_OPTION)
+    return key
+
+
+def get_answer_key(test_id):
+    """Return the answer key of a test, building and caching it on first use."""
+    return AnswerKey.from_bytes(answer_keys.get(test_id, lambda: build_answer_key(test_id).to_bytes()))
+
+
+def invalidate_answer_key(test_id):
+    # Rebuilt on the next use, from rows read after the change commits.
+    answer_keys.invalidate(test_id)
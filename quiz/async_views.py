@@ -0,0 +1,111 @@
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from quiz.authentication import AsyncJWTAuthentication, AsyncStatelessJWTAuthentication, \
+    StatelessJWTAuthentication
+from quiz.cache import CatalogueCacheMixin, catalogue_cache, not_modified
+from quiz.compression import CompressionMixin
+from quiz.search import FullTextSearchFilter
+
+
+class AsyncReadView(CompressionMixin, View):
+    """
+    Native async twin of a read-only DRF list or retrieve view.
+
+    Takes its queryset, serializer, filters and pagination from `sync_view`,
+    so both variants return byte-identical JSON, and shares the catalogue
+    cache with it. Authentication and every query go through the async ORM,
+    so under ASGI no request is handed to the sync thread pool as a whole.
+    """
+    sync_view = None
+    renderer = JSONRenderer()
+
+    async def get(self, request, pk=None):
+        request = Request(request)
+        try:
+            await self.authenticate(request)
+            cached = issubclass(self.sync_view, CatalogueCacheMixin)
+            if cached:
+                models, key = self.sync_view.cache_models, request.build_absolute_uri()
+                versions, modified = await catalogue_cache.astate(models)
+                validators = catalogue_cache.validators(key, versions, modified)
+                response = not_modified(request, validators, modified)
+                if response is not None:
+                    return response
+                entry_key, data = await catalogue_cache.aget(models, key, versions)
+                if data is not None:
+                    return self.render(data, headers=validators)
+            if pk is None:
+                data = await self.list(request)
+            else:
+                data = await self.retrieve(pk)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+        if not cached:
+            return self.render(data)
+        await catalogue_cache.aset(entry_key, data)
+        return self.render(data, headers=validators)
+
+    @property
+    def authentication(self):
+        if StatelessJWTAuthentication in getattr(self.sync_view, 'authentication_classes', ()):
+            return AsyncStatelessJWTAuthentication()
+        return AsyncJWTAuthentication()
+
+    async def authenticate(self, request):
+        result = await self.authentication.aauthenticate(request)
+        if result is None:
+            raise exceptions.NotAuthenticated()
+        request.user, request.auth = result
+
+    def get_queryset(self):
+        return self.sync_view.queryset.all()
+
+    async def list(self, request):
+        queryset = self.get_queryset()
+        filterset_class = getattr(self.sync_view, 'filterset_class', None)
+        if filterset_class is not None:
+            filterset = filterset_class(request.query_params, queryset=queryset, request=request)
+            if not filterset.is_valid():
+                raise exceptions.ValidationError(filterset.errors)
+            queryset = filterset.qs
+        if FullTextSearchFilter in getattr(self.sync_view, 'filter_backends', ()):
+            queryset = FullTextSearchFilter().filter_queryset(request, queryset, self.sync_view)
+
+        paginator = self.sync_view.pagination_class()
+        values_serializer_class = getattr(self.sync_view, 'values_serializer_class', None)
+        if values_serializer_class is None:
+            page = await paginator.apaginate_queryset(queryset, request, self.sync_view)
+            return paginator.get_paginated_response(self.sync_view.serializer_class(page, many=True).data).data
+        serializer = values_serializer_class(context={'request': request})
+        queryset = serializer.values_for_view(queryset, self.sync_view)
+        page = await paginator.apaginate_queryset(queryset, request, self.sync_view)
+        related = serializer.related(page)
+        related_rows = [] if related is None else [row async for row in related]
+        return paginator.get_paginated_response(serializer.represent(page, related_rows)).data
+
+    async def retrieve(self, pk):
+        queryset = self.get_queryset()
+        try:
+            instance = await queryset.aget(pk=pk)
+        except queryset.model.DoesNotExist:
+            raise exceptions.NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+        return self.sync_view.serializer_class(instance).data
+
+    def render(self, data, status=200, headers=None):
+        return HttpResponse(self.renderer.render(data), status=status, content_type='application/json', headers=headers)
+
+    def handle_exception(self, exc):
+        # the same body and headers DRF's default exception handler produces
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {'detail': exc.detail}
+        response = self.render(data, status=exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response.status_code = 401
+            response['WWW-Authenticate'] = self.authentication.authenticate_header(None)
+        return response
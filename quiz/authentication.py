@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from quiz.cache import LRUCache
+
+# user id -> column values of the user row. Entries are dropped when the user
+# is saved or deleted in this process; `AUTH_USER_CACHE_TTL` bounds how long
+# another process can keep serving a changed row.
+user_cache = LRUCache(
+    maxsize=getattr(settings, 'AUTH_USER_CACHE_MAXSIZE', 10_000),
+    ttl=getattr(settings, 'AUTH_USER_CACHE_TTL', 30),
+)
+
+
+def invalidate_cached_user(user_id):
+    # token claims may carry the id as a string, so entries are keyed by str
+    user_cache.pop(str(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    `JWTAuthentication` that keeps recently seen users in `user_cache`, so
+    most requests authenticate without a query. Every request still gets
+    its own `User` instance.
+    """
+
+    def get_user(self, validated_token):
+        user = self.get_cached_user(validated_token)
+        if user is None:
+            user = super().get_user(validated_token)
+            self.cache_user(user)
+        return user
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    def get_cached_user(self, validated_token):
+        values = user_cache.get(str(self.get_user_id(validated_token)))
+        if values is None:
+            return None
+        fields = self.user_model._meta.concrete_fields
+        user = self.user_model.from_db(DEFAULT_DB_ALIAS, [f.attname for f in fields], values)
+        self.check_user(user, validated_token)
+        return user
+
+    def cache_user(self, user):
+        fields = self.user_model._meta.concrete_fields
+        user_cache.set(str(getattr(user, api_settings.USER_ID_FIELD)), [getattr(user, f.attname) for f in fields])
+
+    @staticmethod
+    def check_user(user, validated_token):
+        """The checks `JWTAuthentication.get_user` runs once the user is loaded."""
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    Claims-only authentication for read-only catalogue endpoints: the user is
+    a `TokenUser` built from the token and the database is never queried.
+    A deactivated user keeps access until their access token expires.
+    """
+
+
+class AsyncJWTAuthentication(CachedJWTAuthentication):
+    """`CachedJWTAuthentication` with an `aauthenticate` coroutine for async views."""
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user = self.get_cached_user(validated_token)
+        if user is not None:
+            return user
+        try:
+            user = await self.user_model.objects.aget(
+                **{api_settings.USER_ID_FIELD: self.get_user_id(validated_token)}
+            )
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+        self.check_user(user, validated_token)
+        self.cache_user(user)
+        return user
+
+
+class AsyncStatelessJWTAuthentication(StatelessJWTAuthentication):
+    """`StatelessJWTAuthentication` with an `aauthenticate` coroutine for async views."""
+
+    async def aauthenticate(self, request):
+        return self.authenticate(request)
@@ -0,0 +1,1020 @@
+import http.client
+import importlib.util
+import itertools
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import F, Sum
+
+from quiz.models import User, Subjects, Test, Question, Option, Shop, Purchase
+
+# name -> callable(rows, repeat) returning a list of result dicts
+SCENARIOS = {}
+
+
+def make_words(count, seed=0):
+    rng = random.Random(seed)
+    return [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(3, 9))) for _ in range(count)]
+
+
+WORDS = make_words(2000)
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Run the body against a throwaway test database, like the test runner does.
+
+    SQLite gets a temporary file rather than the test runner's in-memory
+    database, so that threads use real connections with the configured
+    locking behaviour.
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict['TEST']
+    old_test_name = test_settings.get('NAME')
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == 'sqlite':
+            test_settings['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings['NAME'] = old_test_name
+
+
+def measure(func, repeat):
+    """Call `func` `repeat` times and return latency statistics in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'p50_ms': round(timings[len(timings) // 2], 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+    }
+
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choices(WORDS, k=words))
+
+
+def seed_questions(rows, options=2, seed=0, batch_size=5000, subjects=1):
+    """
+    Deterministically bulk-insert `rows` questions spread over tests of 50
+    questions, the tests spread over `subjects` subjects.
+    """
+    rng = random.Random(seed)
+    subject_rows = Subjects.objects.bulk_create(
+        Subjects(name='benchmark' if subjects == 1 else f'benchmark {i}') for i in range(subjects)
+    )
+    tests = Test.objects.bulk_create(
+        Test(name=sentence(rng, 3), subject=subject_rows[i % subjects],
+             level=rng.choice(Test.LevelChoices.values), balls=10)
+        for i in range(max(1, rows // 50))
+    )
+    for start in range(0, rows, batch_size):
+        with transaction.atomic():
+            questions = Question.objects.bulk_create(
+                Question(about=sentence(rng), test=tests[i // 50 % len(tests)])
+                for i in range(start, min(rows, start + batch_size))
+            )
+            if options:
+                Option.objects.bulk_create(
+                    Option(name=rng.choice(WORDS), question=question, is_true=(j == 0))
+                    for question in questions for j in range(options)
+                )
+    return tests
+
+
+def seed_into_test(test, questions, seed=0):
+    rng = random.Random(seed)
+    created = Question.objects.bulk_create(Question(about=sentence(rng), test=test) for _ in range(questions))
+    Option.objects.bulk_create(
+        Option(name=rng.choice(WORDS), question=question, is_true=(j == 0))
+        for question in created for j in range(2)
+    )
+
+
+@scenario('search')
+def search_scenario(rows, repeat):
+    """Full-text index against `icontains` on `Question.about`."""
+    from quiz.search import full_text_search
+
+    seed_questions(rows, options=0)
+    # a frequent word, a rare word and a two-word query
+    queries = [WORDS[0], WORDS[1999][:4], f'{WORDS[10]} {WORDS[20]}']
+    results = []
+    for query in queries:
+        for backend, queryset in (
+            ('icontains', Question.objects.filter(about__icontains=query).order_by('pk')),
+            ('fts', full_text_search(Question.objects.all(), 'about', query).order_by('search_rank', 'pk')),
+        ):
+            results.append({
+                'query': query,
+                'backend': backend,
+                'first_page': measure(lambda: list(queryset[:20]), repeat),
+                'count': measure(queryset.count, repeat),
+            })
+    return results
+
+
+def run_threads(workers, target):
+    """Run `target(worker_index)` in `workers` threads started together; return wall time."""
+    barrier = threading.Barrier(workers + 1)
+
+    def run(index):
+        barrier.wait()
+        try:
+            target(index)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run, args=(i, )) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def legacy_purchase(user_id, item_id):
+    """The read-modify-write purchase `ShopBuyItemAPIView` used to do."""
+    user = User.objects.get(pk=user_id)
+    item = Shop.objects.get(pk=item_id)
+    if user.balls < item.price or item.amount <= 0:
+        return False
+    user.balls -= item.price
+    user.save()
+    item.amount -= 1
+    item.save()
+    user.gifts.add(item)
+    return True
+
+
+@scenario('purchase')
+def purchase_scenario(rows, repeat, workers=64):
+    """
+    `workers` buyers hammer one item concurrently, `repeat` attempts each,
+    with four buyers sharing every account.
+
+    Stock is smaller than demand, so the run also checks that nothing is
+    oversold: every successful purchase must be reflected exactly once in
+    the stock and the balances.
+    """
+    from quiz import shop
+
+    results = []
+    for mode in ('atomic', 'legacy'):
+        Purchase.objects.all().delete()
+        Shop.objects.all().delete()
+        User.objects.all().delete()
+        users = User.objects.bulk_create(
+            User(username=f'buyer{i}', balls=repeat * 40) for i in range(workers // 4)
+        )
+        stock = workers * repeat // 2
+        item = Shop.objects.create(name='item', about='benchmark', amount=stock, price=7)
+        succeeded = [0] * workers
+        errors = [0] * workers
+
+        def buy(index):
+            user = users[index % len(users)]
+            for attempt in range(repeat):
+                try:
+                    if mode == 'atomic':
+                        shop.purchase(user, item.pk, idempotency_key=f'{index}-{attempt}')
+                        ok = True
+                    else:
+                        ok = legacy_purchase(user.pk, item.pk)
+                except shop.PurchaseError:
+                    ok = False
+                except Exception:
+                    errors[index] += 1
+                    continue
+                succeeded[index] += ok
+
+        elapsed = run_threads(workers, buy)
+        sold = sum(succeeded)
+        item.refresh_from_db()
+        spent = len(users) * repeat * 40 - User.objects.aggregate(total=Sum('balls'))['total']
+        results.append({
+            'mode': mode,
+            'workers': workers,
+            'attempts': workers * repeat,
+            'sold': sold,
+            'errors': sum(errors),
+            'purchases_per_sec': round(sold / elapsed, 1),
+            'lost_stock_updates': sold - (stock - item.amount),
+            'lost_balance_updates': sold * 7 - spent,
+            'oversold': max(0, sold - stock),
+        })
+    return results
+
+
+def count_queries(func):
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as ctx:
+        func()
+    return len(ctx.captured_queries)
+
+
+@scenario('grading')
+def grading_scenario(rows, repeat, sizes=(10, 50, 100, 500)):
+    """Submit a whole test in one request, for tests of 10 to 500 questions."""
+    from quiz import grading
+
+    seed_questions(rows)
+    user = User.objects.create(username='student')
+    subject = Subjects.objects.first()
+    results = []
+    for size in sizes:
+        test = Test.objects.create(name=f'{size} questions', subject=subject)
+        seed_into_test(test, size)
+        answers = dict(
+            Option.objects.filter(question__test=test, is_true=True).values_list('question_id', 'pk')
+        )
+        submit = lambda: grading.submit(user, test.pk, answers)
+        results.append({
+            'questions': size,
+            'queries': count_queries(submit),
+            **measure(submit, repeat),
+        })
+    return results
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def drive(port, request, concurrency, requests_per_client, expect=None):
+    """
+    Drive a local HTTP server with `concurrency` keep-alive clients, each
+    sending `requests_per_client` requests; `request(index, i)` returns the
+    method, path, JSON body (or None) and headers of request `i` of client
+    `index`.
+
+    Returns throughput, latency percentiles, the number of errors (statuses
+    of 400 and up not in `expect`, or connection errors) and the mean SQL
+    statements per request from the `Server-Timing` header.
+    """
+    latencies = [[] for _ in range(concurrency)]
+    queries = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    expect = expect or ()
+
+    def client(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        for i in range(requests_per_client):
+            method, path, body, headers = request(index, i)
+            if body is not None:
+                body, headers = json.dumps(body), {**headers, 'Content-Type': 'application/json'}
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors[index] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                continue
+            latencies[index].append((time.perf_counter() - start) * 1000)
+            if response.status >= 400 and response.status not in expect:
+                errors[index] += 1
+            match = QUERIES.search(response.getheader('Server-Timing') or '')
+            if match:
+                queries[index].append(int(match[1]))
+        conn.close()
+
+    elapsed = run_threads(concurrency, client)
+    timings = sorted(t for client_timings in latencies for t in client_timings)
+    counts = [n for client_queries in queries for n in client_queries]
+    return {
+        'requests': len(timings),
+        'errors': sum(errors),
+        'requests_per_sec': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'queries_per_request': round(statistics.fmean(counts), 2) if counts else None,
+    }
+
+
+def load(port, paths, concurrency, requests_per_client, headers=None):
+    """`drive` with GETs cycling through `paths`, all with the same `headers`."""
+    def request(index, i):
+        return 'GET', paths[(index + i) % len(paths)], None, headers or {}
+    return drive(port, request, concurrency, requests_per_client)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve(command, port, **env):
+    """
+    Run a server process on the benchmark database, with `env` added to its
+    environment, until the body finishes. Its workers use cache keys of their
+    own, under a fresh prefix, so no entry built from another database leaks in.
+    """
+    env = dict(
+        os.environ, QUIZ_DATABASE_NAME=str(connection.settings_dict['NAME']),
+        QUIZ_CACHE_KEY_PREFIX=f'benchmark-{uuid.uuid4().hex}', **env,
+    )
+    process = subprocess.Popen(
+        command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f'server did not start: {" ".join(command)}')
+                time.sleep(0.1)
+        yield
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def access_token(user):
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    return str(RefreshToken.for_user(user).access_token)
+
+
+@scenario('asgi')
+def asgi_scenario(rows, repeat, concurrency=256, workers=os.cpu_count()):
+    """
+    Async read views under uvicorn against the sync views under gunicorn,
+    `concurrency` clients each sending `repeat` requests.
+    """
+    if connection.vendor == 'sqlite' and ':memory:' in str(connection.settings_dict['NAME']):
+        raise RuntimeError('the asgi scenario needs a file database')
+    tests = seed_questions(rows)
+    user = User.objects.create(username='loadtest')
+    headers = {'Authorization': f'Bearer {access_token(user)}'}
+    paths = ['/subjects/', '/tests/', f'/tests/{tests[0].pk}/', '/questions/', '/shop/']
+    # both servers get the same number of processes; gunicorn gets threads
+    # so it can overlap requests the way the event loop does
+    servers = [
+        ('wsgi', 'gunicorn', ['-m', 'gunicorn', 'root.wsgi:application', '--workers', str(workers),
+                              '--threads', '8', '--bind']),
+        ('asgi', 'uvicorn', ['-m', 'uvicorn', 'root.asgi:application', '--workers', str(workers),
+                             '--no-access-log', '--port']),
+    ]
+    results = []
+    for mode, module, args in servers:
+        if importlib.util.find_spec(module) is None:
+            results.append({'mode': mode, 'skipped': f'{module} is not installed'})
+            continue
+        port = free_port()
+        address = f'127.0.0.1:{port}' if module == 'gunicorn' else str(port)
+        mode_paths = paths if mode == 'wsgi' else [f'/async{path}' for path in paths]
+        with serve([sys.executable, *args, address], port):
+            load(port, mode_paths, 8, 5, headers)  # warm up every worker
+            results.append({'mode': mode, **load(port, mode_paths, concurrency, repeat, headers)})
+    return results
+
+
+@scenario('import')
+def import_scenario(rows, repeat, tests=1000):
+    """
+    `manage.py import_questions` on a generated JSONL file of `rows`
+    questions with two options each (`unique_option` allows
+    one true and one false option per question): throughput and peak Python memory,
+    which should not grow with the file.
+    """
+    import json
+    import tracemalloc
+
+    from quiz.importer import Importer
+
+    rng = random.Random(0)
+    with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+        for i in range(rows):
+            f.write(json.dumps({
+                'type': 'question', 'subject': f'subject {i % 100}', 'test': f'test {i % tests}',
+                'about': sentence(rng), 'options': [{'name': sentence(rng, 3), 'is_true': j == 0} for j in range(2)],
+            }) + '\n')
+    results = []
+    try:
+        for batch_size in (1000, 5000):
+            Subjects.objects.all().delete()
+            started = time.perf_counter()
+            counts = Importer(batch_size=batch_size).run(f.name)
+            elapsed = time.perf_counter() - started
+            # tracing slows the import down severalfold, so memory gets its own run
+            Subjects.objects.all().delete()
+            tracemalloc.start()
+            Importer(batch_size=batch_size).run(f.name)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append({
+                'batch_size': batch_size,
+                'questions': counts['questions'],
+                'options': counts['options'],
+                'seconds': round(elapsed, 2),
+                'rows_per_second': round((counts['questions'] + counts['options']) / elapsed),
+                'peak_mib': round(peak / 2 ** 20, 1),
+            })
+    finally:
+        os.remove(f.name)
+    return results
+
+
+@scenario('export')
+def export_scenario(rows, repeat):
+    """
+    The streaming export against serializing the whole bank through
+    `QuestionsSerializer(many=True)`: time and peak Python memory.
+    """
+    import tracemalloc
+
+    from rest_framework.renderers import JSONRenderer
+
+    from quiz.export import export_stream
+    from quiz.serializers import QuestionsSerializer
+
+    seed_questions(rows)
+
+    def serializer():
+        queryset = Question.objects.select_related('test').prefetch_related('options')
+        return len(JSONRenderer().render(QuestionsSerializer(queryset, many=True).data))
+
+    def stream(fmt, compress):
+        return lambda: sum(len(chunk) for chunk in export_stream(fmt, compress))
+
+    results = []
+    for name, func in (
+        ('serializer', serializer),
+        ('ndjson', stream('ndjson', False)),
+        ('csv', stream('csv', False)),
+        ('ndjson.gz', stream('ndjson', True)),
+    ):
+        started = time.perf_counter()
+        size = func()
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results.append({
+            'mode': name,
+            'seconds': round(elapsed, 2),
+            'mib': round(size / 2 ** 20, 1),
+            'peak_mib': round(peak / 2 ** 20, 1),
+        })
+    return results
+
+
+@scenario('leaderboard')
+def leaderboard_scenario(rows, repeat):
+    """
+    Rank lookups for `rows` users: `COUNT(*) WHERE balls > x` in SQL
+    against the in-memory leaderboard, plus its load and update costs.
+    """
+    from django.core.cache import cache
+
+    from quiz.leaderboard import leaderboard, record_change
+
+    rng = random.Random(0)
+    levels = [choice for choice, _ in User.LevelChoices.choices]
+    for start in range(0, rows, 10_000):
+        User.objects.bulk_create(
+            User(username=f'user{i}', level=levels[i % 3], balls=int(rng.paretovariate(1.5) * 10))
+            for i in range(start, min(start + 10_000, rows))
+        )
+    probes = [rng.choice((10, 15, 40, 200)) for _ in range(repeat)]
+    cache.clear()
+    leaderboard.clear()
+    started = time.perf_counter()
+    leaderboard.sync()
+    load = round(time.perf_counter() - started, 3)
+
+    def sql_rank(level=None):
+        users = User.objects.all() if level is None else User.objects.filter(level=level)
+        return lambda: [users.filter(balls__gt=balls).count() + 1 for balls in probes]
+
+    def memory_rank(level=None):
+        return lambda: [leaderboard.rank(balls, level) for balls in probes]
+
+    def update():
+        with transaction.atomic():
+            for balls in probes:
+                record_change((levels[0], balls), (levels[0], balls + 1))
+        leaderboard.sync()
+
+    per_probe = lambda stats: {key: round(value / len(probes), 6) for key, value in stats.items()}
+    return [
+        {'lookup': 'sql', **per_probe(measure(sql_rank(), 3))},
+        {'lookup': 'sql, one level', **per_probe(measure(sql_rank(levels[2]), 3))},
+        {'lookup': 'memory', **per_probe(measure(memory_rank(), 20))},
+        {'lookup': 'memory, one level', **per_probe(measure(memory_rank(levels[2]), 20))},
+        {'lookup': 'top 10 (sql, index)', **measure(lambda: list(User.objects.order_by('-balls', 'id')[:10]), 20)},
+        {'lookup': 'replay one change', **per_probe(measure(update, 3))},
+        {'lookup': 'load', 'seconds': load},
+    ]
+
+
+@scenario('serializers')
+def serializers_scenario(rows, repeat, page_sizes=(20, 100, 1000)):
+    """
+    Per-row cost of the list endpoints' `ModelSerializer`s against their
+    `.values()` twins: fetching a page, serializing and rendering it.
+    """
+    from rest_framework.renderers import JSONRenderer
+
+    from quiz.views import SubjectsAPIView, TestsAPIView, QuestionsAPIView, ShopGetItemsAPIView
+
+    seed_questions(rows)
+    Subjects.objects.bulk_create(Subjects(name=f'subject {i}') for i in range(max(page_sizes)))
+    Shop.objects.bulk_create(
+        Shop(name=f'item {i}', about='benchmark', amount=10, price=5, is_active=True, image=f'shop/{i}.png')
+        for i in range(min(rows, 5000))
+    )
+    renderer = JSONRenderer()
+
+    def model_serializer(view, size):
+        return lambda: renderer.render(view.serializer_class(list(view.queryset.order_by('pk')[:size]), many=True).data)
+
+    def values_serializer(view, size):
+        def run():
+            serializer = view.values_serializer_class()
+            page = list(serializer.values(view.queryset.order_by('pk'), ['pk'])[:size])
+            return renderer.render(serializer.to_representation(page))
+        return run
+
+    results = []
+    for view in (SubjectsAPIView, TestsAPIView, QuestionsAPIView, ShopGetItemsAPIView):
+        for size in page_sizes:
+            slow, fast = model_serializer(view, size), values_serializer(view, size)
+            assert slow() == fast(), view.__name__
+            slow_ms, fast_ms = measure(slow, repeat)['p50_ms'], measure(fast, repeat)['p50_ms']
+            count = view.queryset.model.objects.all()[:size].count()
+            results.append({
+                'endpoint': view.__name__,
+                'rows': count,
+                'model_us_per_row': round(slow_ms * 1000 / count, 1),
+                'values_us_per_row': round(fast_ms * 1000 / count, 1),
+                'speedup': round(slow_ms / fast_ms, 1),
+            })
+    return results
+
+
+@scenario('random')
+def random_scenario(rows, repeat, sizes=(20, 100)):
+    """
+    Drawing random questions of one subject and level: `ORDER BY RANDOM()`
+    over the joined tables against sampling the cached id pool.
+    """
+    from django.core.cache import cache
+
+    from quiz import question_pools
+
+    seed_questions(rows)
+    cache.clear()
+    subject_id = Subjects.objects.values_list('pk', flat=True).get()
+    level = Test.LevelChoices.BEGINNER
+    started = time.perf_counter()
+    question_pools.get_pools(subject_id, [level])
+    build = round(time.perf_counter() - started, 3)
+    seeds = iter(range(10 ** 9))
+
+    def order_by_random(n):
+        questions = Question.objects.filter(test__subject_id=subject_id, test__level=level)
+        return lambda: list(questions.prefetch_related('options').order_by('?')[:n])
+
+    def pool(n):
+        return lambda: question_pools.load_questions(question_pools.draw(subject_id, [level], n, next(seeds)))
+
+    results = []
+    for n in sizes:
+        results.append({'draw': f'order by random, n={n}', **measure(order_by_random(n), repeat)})
+        results.append({'draw': f'cached pool, n={n}', **measure(pool(n), repeat)})
+    results.append({'draw': 'build pool', 'seconds': build})
+    return results
+
+
+def flood_logins(port, stop, clients, counts):
+    """POST wrong-password logins from `clients` threads until `stop` is set; count statuses in `counts`."""
+    body = json.dumps({'username': 'loadtest', 'password': 'wrong'})
+
+    def client(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        while not stop.is_set():
+            try:
+                conn.request('POST', '/auth/login/', body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                continue
+            counts[response.status] = counts.get(response.status, 0) + 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i, )) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+@scenario('throttle')
+def throttle_scenario(rows, repeat, concurrency=8, flooders=16, workers=os.cpu_count()):
+    """
+    Catalogue latency under gunicorn on its own and during a flood of
+    password logins, with the auth throttles on and off.
+    """
+    if connection.vendor == 'sqlite' and ':memory:' in str(connection.settings_dict['NAME']):
+        raise RuntimeError('the throttle scenario needs a file database')
+    if importlib.util.find_spec('gunicorn') is None:
+        raise RuntimeError('the throttle scenario needs gunicorn')
+    seed_questions(rows)
+    user = User.objects.create_user(username='loadtest', password='benchmark')
+    headers = {'Authorization': f'Bearer {access_token(user)}'}
+    paths = ['/subjects/', '/tests/', '/questions/', '/shop/']
+    results = []
+    for throttling in ('on', 'off'):
+        port = free_port()
+        command = [sys.executable, '-m', 'gunicorn', 'root.wsgi:application', '--workers', str(workers),
+                   '--threads', '8', '--bind', f'127.0.0.1:{port}']
+        os.environ['QUIZ_THROTTLING'] = throttling
+        try:
+            with serve(command, port):
+                load(port, paths, 4, 5, headers)
+                quiet = load(port, paths, concurrency, repeat, headers)
+                stop, counts = threading.Event(), {}
+                threads = flood_logins(port, stop, flooders, counts)
+                time.sleep(1)
+                flooded = load(port, paths, concurrency, repeat, headers)
+                stop.set()
+                for thread in threads:
+                    thread.join()
+        finally:
+            del os.environ['QUIZ_THROTTLING']
+        results.append({'throttling': throttling, 'flood': 'no', **quiet})
+        results.append({'throttling': throttling, 'flood': 'yes', **flooded,
+                        'logins': ' '.join(f'{status}:{n}' for status, n in sorted(counts.items()))})
+    return results
+
+
+@scenario('metrics')
+def metrics_scenario(rows, repeat, rounds=5):
+    """
+    Cost of `MetricsMiddleware`: the same requests through the test client
+    with and without it, alternating rounds of `repeat` requests each.
+    """
+    from django.core.cache import cache
+    from django.test import Client, override_settings
+
+    seed_questions(rows)
+    user = User.objects.create(username='loadtest')
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {access_token(user)}', 'HTTP_HOST': 'localhost'}
+    without = [name for name in settings.MIDDLEWARE if name != 'quiz.metrics.MetricsMiddleware']
+    requests = {
+        'cached list': ('/tests/', False),
+        'uncached list': ('/questions/?test_level=begin', True),
+        'detail': (f'/questions/{Question.objects.values_list("pk", flat=True).first()}/', False),
+    }
+    results = []
+    for name, (path, clear) in requests.items():
+        timings = {'on': [], 'off': []}
+        for _ in range(rounds):
+            for mode in ('on', 'off'):
+                with override_settings(**({} if mode == 'on' else {'MIDDLEWARE': without})):
+                    client = Client(**headers)
+                    assert client.get(path).status_code == 200, path
+                    for _ in range(repeat):
+                        if clear:
+                            cache.clear()
+                        start = time.perf_counter()
+                        client.get(path)
+                        timings[mode].append(time.perf_counter() - start)
+        on, off = statistics.median(timings['on']), statistics.median(timings['off'])
+        results.append({
+            'request': name,
+            'off_ms': round(off * 1000, 3),
+            'on_ms': round(on * 1000, 3),
+            'overhead_pct': round((on - off) / off * 100, 1),
+        })
+    return results
+
+
+
+@scenario('profile')
+def profile_scenario(rows, repeat, gift_counts=(10, 100, 1000)):
+    """
+    `/profile/` of users with more and more gifts: the nested serializer it
+    used to run against the cached document, warm and right after a change.
+    """
+    from django.test import Client
+
+    from quiz.profiles import invalidate_profile
+    from quiz.serializers import ProfileUserSerializer
+
+    items = Shop.objects.bulk_create(
+        Shop(name=f'item {i}', about=sentence(random.Random(i)), amount=10, is_active=True, price=1)
+        for i in range(max(gift_counts))
+    )
+    results = []
+    for count in gift_counts:
+        user = User.objects.create(username=f'collector{count}')
+        user.gifts.set(items[:count])
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {access_token(user)}', HTTP_HOST='localhost')
+        assert client.get('/profile/').status_code == 200
+
+        def changed():
+            invalidate_profile(user.pk)
+            client.get('/profile/')
+        results.append({'gifts': count, 'profile': 'serializer',
+                        **measure(lambda: ProfileUserSerializer(User.objects.get(pk=user.pk)).data, repeat)})
+        results.append({'gifts': count, 'profile': 'cached', **measure(lambda: client.get('/profile/'), repeat)})
+        results.append({'gifts': count, 'profile': 'after change', **measure(changed, repeat)})
+    return results
+
+
+LOAD_PASSWORD = 'benchmark'
+
+
+def seed_dataset(questions, users, seed=0, batch_size=10_000):
+    """
+    Deterministically seed the whole service: `questions` questions with two
+    options each over ten subjects, a shop, and `users` users with levels
+    and balls, all with the password `LOAD_PASSWORD`. Returns the tests.
+    """
+    from django.contrib.auth.hashers import make_password
+
+    from quiz.counters import recount
+
+    if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+        # a throwaway database, nothing to lose in a crash
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous = OFF')
+    tests = seed_questions(questions, seed=seed, batch_size=batch_size, subjects=10)
+    rng = random.Random(seed)
+    # hashed once, as a million hashes would take hours; the salt is long
+    # enough that logins do not upgrade the hash
+    salt = ''.join(rng.choices(string.ascii_letters + string.digits, k=24))
+    password = make_password(LOAD_PASSWORD, salt=salt)
+    for start in range(0, users, batch_size):
+        with transaction.atomic():
+            User.objects.bulk_create(
+                User(username=f'user{i}', email=f'user{i}@example.com', password=password, is_verified=True,
+                     level=rng.choice(User.LevelChoices.values), balls=rng.randint(0, 10_000))
+                for i in range(start, min(users, start + batch_size))
+            )
+    Shop.objects.bulk_create(
+        Shop(name=f'item {i}', about=sentence(rng), amount=10 ** 9, is_active=True, price=1) for i in range(50)
+    )
+    recount()
+    return tests
+
+
+def credentials(user):
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    refresh = RefreshToken.for_user(user)
+    return {
+        'username': user.username,
+        'refresh': str(refresh),
+        'headers': {'Authorization': f'Bearer {refresh.access_token}'},
+    }
+
+
+def load_routes(tests, clients, admin):
+    """
+    `'<method> <URL pattern of root.urls>'` -> (request, expected error
+    statuses) for every route, with `request(index, i)` as `drive` takes it. Client
+    `index` acts as the user with the credentials `clients[index]`; admin
+    routes use `admin`.
+
+    Writes are real: registrations create users, purchases spend balls and
+    submissions record attempts. The password change goes back and forth,
+    so it comes last.
+    """
+    from quiz.models import Attempt
+
+    test = tests[0]
+    answers = [
+        {'question': question, 'option': option}
+        for question, option in Option.objects.filter(question__test=test, is_true=True)
+        .order_by('question_id').values_list('question_id', 'pk')
+    ]
+    question = Question.objects.filter(test=test).order_by('pk').values_list('pk', flat=True).first()
+    item = Shop.objects.order_by('pk').values_list('pk', flat=True).first()
+    attempts = Attempt.objects.bulk_create(
+        Attempt(user_id=client['pk'], test=test, answers={}, correct=0, total=0) for client in clients
+    )
+    keys = itertools.count()
+
+    def get(path, user=None):
+        return lambda index, i: ('GET', path, None, (user or clients[index])['headers']), ()
+
+    def post(path, body, expect=()):
+        return lambda index, i: ('POST', path, body(index, i), clients[index]['headers']), expect
+
+    def attempt(index, i):
+        return 'GET', f'/attempts/{attempts[index].pk}/', None, clients[index]['headers']
+
+    def buy(index, i):
+        headers = {**clients[index]['headers'], 'Idempotency-Key': f'load-{next(keys)}'}
+        return 'POST', '/shop/buy/', {'id': item}, headers
+
+    def profile(index, i):
+        return 'PUT', '/profile/', {'about': f'update {i}'}, clients[index]['headers']
+
+    def change_password(index, i):
+        old, new = LOAD_PASSWORD, f'{LOAD_PASSWORD}!'
+        body = {'current_password': old, 'new_password': new} if i % 2 == 0 else \
+            {'current_password': new, 'new_password': old}
+        return 'POST', '/change-password/', body, clients[index]['headers']
+
+    anonymous = {'headers': {}}
+    return {
+        'GET admin/': get('/admin/login/', anonymous),
+        'GET schema/': get('/schema/', anonymous),
+        'GET docs/': get('/docs/', anonymous),
+        'POST auth/register/': post('/auth/register/', lambda index, i: {
+            'username': f'registered{next(keys)}', 'email': 'registered@example.com', 'password': LOAD_PASSWORD,
+        }),
+        'POST auth/login/': post('/auth/login/', lambda index, i: {
+            'username': clients[index]['username'], 'password': LOAD_PASSWORD,
+        }),
+        'POST auth/refresh/': post('/auth/refresh/', lambda index, i: {'refresh': clients[index]['refresh']}),
+        # no code was issued for these users, so this measures the rejection
+        'POST confirm-user/': post('/confirm-user/', lambda index, i: {'code': '000000'}, expect=(400, )),
+        'GET subjects/': get('/subjects/'),
+        'GET subjects/<int:pk>/': get(f'/subjects/{test.subject_id}/'),
+        'GET tests/': get('/tests/'),
+        'GET tests/<int:pk>/': get(f'/tests/{test.pk}/'),
+        'GET tests/<int:pk>/bundle/': get(f'/tests/{test.pk}/bundle/'),
+        'POST tests/<int:pk>/submit/': post(f'/tests/{test.pk}/submit/', lambda index, i: {'answers': answers}),
+        'GET quiz/random/': get(f'/quiz/random/?subject={test.subject_id}&n=20'),
+        'GET attempts/<int:pk>/': (attempt, ()),
+        'GET questions/': get('/questions/'),
+        'GET questions/<int:pk>/': get(f'/questions/{question}/'),
+        'GET questions/export/': get(f'/questions/export/?test={quote(test.name)}', admin),
+        'GET shop/': get('/shop/'),
+        'GET shop/item/<int:pk>/': get(f'/shop/item/{item}/'),
+        'POST shop/buy/': (buy, ()),
+        'GET cache/stats/': get('/cache/stats/', admin),
+        'GET async/subjects/': get('/async/subjects/'),
+        'GET async/subjects/<int:pk>/': get(f'/async/subjects/{test.subject_id}/'),
+        'GET async/tests/': get('/async/tests/'),
+        'GET async/tests/<int:pk>/': get(f'/async/tests/{test.pk}/'),
+        'GET async/questions/': get('/async/questions/'),
+        'GET async/questions/<int:pk>/': get(f'/async/questions/{question}/'),
+        'GET async/shop/': get('/async/shop/'),
+        'GET async/shop/item/<int:pk>/': get(f'/async/shop/item/{item}/'),
+        'GET leaderboard/': get('/leaderboard/'),
+        'GET leaderboard/me/': get('/leaderboard/me/'),
+        'GET profile/': get('/profile/'),
+        'PUT profile/': (profile, ()),
+        'GET profile/gifts/': get('/profile/gifts/'),
+        'GET metrics': get('/metrics', anonymous),
+        'POST change-password/': (change_password, ()),
+    }
+
+
+def environment():
+    """What a baseline was measured on, so that only like is compared with like."""
+    import platform
+
+    import django
+
+    try:
+        revision = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'revision': revision,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'cpus': os.cpu_count(),
+    }
+
+
+def route_load(questions, users, concurrency, requests_per_client, seed=0, workers=os.cpu_count()):
+    """
+    Seed `seed_dataset`, serve it with gunicorn and drive every route of
+    `load_routes` in turn, `concurrency` clients sending
+    `requests_per_client` requests each. Returns the baseline document:
+    the environment and parameters under `meta`, the results under `routes`.
+    """
+    if connection.vendor == 'sqlite' and ':memory:' in str(connection.settings_dict['NAME']):
+        raise RuntimeError('the load test needs a file database')
+    if importlib.util.find_spec('gunicorn') is None:
+        raise RuntimeError('the load test needs gunicorn')
+    start = time.perf_counter()
+    tests = seed_dataset(questions, users, seed=seed)
+    seeded = time.perf_counter() - start
+    users_pks = list(User.objects.order_by('pk').values_list('pk', flat=True)[:concurrency])
+    if len(users_pks) < concurrency:
+        raise RuntimeError(f'{concurrency} clients need at least as many users')
+    # enough balls to buy on every request
+    User.objects.filter(pk__in=users_pks).update(balls=10 ** 6)
+    clients = [{'pk': user.pk, **credentials(user)} for user in User.objects.filter(pk__in=users_pks).order_by('pk')]
+    admin = credentials(User.objects.create_user('loadadmin', password=LOAD_PASSWORD, is_staff=True))
+    routes = load_routes(tests, clients, admin)
+
+    results = {}
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', 'root.wsgi:application', '--workers', str(workers),
+               '--threads', '8', '--bind', f'127.0.0.1:{port}']
+    with serve(command, port, QUIZ_THROTTLING='off'):
+        for route, (request, expect) in routes.items():
+            drive(port, request, concurrency, 2, expect)  # warm up caches and connections
+            results[route] = drive(port, request, concurrency, requests_per_client, expect)
+    return {
+        'meta': {
+            **environment(),
+            'questions': questions,
+            'users': users,
+            'seed': seed,
+            'seed_seconds': round(seeded, 1),
+            'concurrency': concurrency,
+            'requests_per_client': requests_per_client,
+            'server': f'gunicorn, {workers} workers x 8 threads',
+        },
+        'routes': results,
+    }
+
+
+def compare(baseline, current, tolerance=10):
+    """
+    Each route of `current` against `baseline`: the change of throughput and
+    p95 latency in percent and of queries per request. A route regressed if
+    throughput dropped or p95 grew by more than `tolerance` percent, or it
+    runs more queries.
+    """
+    def change(before, after):
+        return round((after - before) / before * 100, 1) if before else None
+
+    rows = []
+    for route, result in current['routes'].items():
+        before = baseline['routes'].get(route)
+        if before is None:
+            rows.append({'route': route, 'new': True, 'regressed': False})
+            continue
+        throughput = change(before['requests_per_sec'], result['requests_per_sec'])
+        p95 = change(before['p95_ms'], result['p95_ms'])
+        queries = round((result['queries_per_request'] or 0) - (before['queries_per_request'] or 0), 2)
+        rows.append({
+            'route': route,
+            'requests_per_sec_pct': throughput,
+            'p95_pct': p95,
+            'queries_delta': queries,
+            'regressed': (throughput or 0) < -tolerance or (p95 or 0) > tolerance or queries >= 0.5
+                         or result['errors'] > before['errors'],
+        })
+    return rows
+
+
+@scenario('routes')
+def routes_scenario(rows, repeat, concurrency=8):
+    """Every route under gunicorn, on `rows` questions and as many users."""
+    baseline = route_load(rows, rows, concurrency, repeat)
+    return [{'route': route, **result} for route, result in baseline['routes'].items()]
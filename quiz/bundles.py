@@ -0,0 +1,36 @@
+from hashlib import sha256
+
+from rest_framework.renderers import JSONRenderer
+
+from quiz.cache import VersionedKeys
+from quiz.models import Test
+from quiz.serializers import TestBundleSerializer
+
+BUNDLE_TIMEOUT = 24 * 60 * 60
+
+bundles = VersionedKeys('quiz:test-bundle', BUNDLE_TIMEOUT)
+
+
+def render_test_bundle(test_id):
+    """Serialize a test with all of its questions and options. Returns (etag, body) or None."""
+    test = (
+        Test.objects.select_related('subject')
+        .prefetch_related('questions__options')
+        .filter(pk=test_id)
+        .first()
+    )
+    if test is None:
+        return None
+    body = JSONRenderer().render(TestBundleSerializer(test).data)
+    return f'"{sha256(body).hexdigest()[:32]}"', body
+
+
+def get_test_bundle(test_id):
+    """Return the pre-rendered bundle of a test, rendering and caching it on a miss."""
+    return bundles.get(test_id, lambda: render_test_bundle(test_id))
+
+
+def invalidate_test_bundle(test_id):
+    # Once the change is visible to other connections, so a concurrent
+    # reader cannot cache the pre-change rows under the new version.
+    bundles.invalidate(test_id)
@@ -0,0 +1,309 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from hashlib import sha1
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+class LRUCache:
+    """
+    A bounded, thread-safe least-recently-used mapping with hit/miss/eviction
+    counters. With `ttl` (seconds), entries also expire after that long.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                expires, value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < time.monotonic():
+                del self.data[key]
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.data[key] = (expires, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+class VersionedCache:
+    """
+    Read-through cache in two tiers: a per-process LRU in front of Django's
+    cache framework.
+
+    Every entry is stored under the current version of each model it was
+    built from. Changing a model bumps its version counter, which makes all
+    of its old entries unreachable at once; they then age out of both tiers.
+    """
+
+    def __init__(self, prefix, maxsize, timeout):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.local = LRUCache(maxsize)
+        self.shared_hits = self.shared_misses = 0
+
+    def version_key(self, model):
+        return f'{self.prefix}:version:{model._meta.label_lower}'
+
+    def modified_key(self, model):
+        return f'{self.prefix}:modified:{model._meta.label_lower}'
+
+    def state(self, models):
+        """
+        Return `(versions, modified)` for `models` from one shared-cache read:
+        their version counters, and when the most recent of them changed.
+        """
+        version_keys = [self.version_key(model) for model in models]
+        modified_keys = [self.modified_key(model) for model in models]
+        values = cache.get_many(version_keys + modified_keys)
+        for key in version_keys:
+            if key not in values:
+                # Start from the clock rather than 1 so a counter that was
+                # evicted can never come back to a version that is still cached.
+                cache.add(key, time.time_ns())
+                values[key] = cache.get(key)
+        for key in modified_keys:
+            if key not in values:
+                # unknown, so assume it changed just now; that only costs a refetch
+                cache.add(key, time.time())
+                values[key] = cache.get(key)
+        versions = tuple(values[key] for key in version_keys)
+        return versions, max((values[key] for key in modified_keys), default=0)
+
+    def bump(self, model):
+        key = self.version_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns())
+        cache.set(self.modified_key(model), time.time())
+
+    def bump_on_commit(self, model):
+        transaction.on_commit(lambda: self.bump(model))
+
+    def entry_key(self, models, key, versions=None):
+        if versions is None:
+            versions = self.state(models)[0]
+        digest = sha1(key.encode()).hexdigest()
+        return f'{self.prefix}:{".".join(str(version) for version in versions)}:{digest}'
+
+    def validators(self, key, versions, modified):
+        """`ETag` and `Last-Modified` headers of a response built from `versions`."""
+        digest = sha1(f'{versions}:{key}'.encode()).hexdigest()[:32]
+        return {'ETag': f'W/"{digest}"', 'Last-Modified': http_date(modified)}
+
+    def get(self, models, key, versions=None):
+        entry_key = self.entry_key(models, key, versions)
+        value = self.local.get(entry_key)
+        if value is not None:
+            return entry_key, value
+        value = cache.get(entry_key)
+        if value is None:
+            self.shared_misses += 1
+        else:
+            self.shared_hits += 1
+            self.local.set(entry_key, value)
+        return entry_key, value
+
+    def set(self, entry_key, value):
+        self.local.set(entry_key, value)
+        cache.set(entry_key, value, self.timeout)
+
+    # Async variants for async views. The shared tier is another process or
+    # the disk (quiz.checks refuses LocMemCache), so it runs in the thread pool.
+
+    async def run(self, func, *args):
+        return await sync_to_async(func, thread_sensitive=False)(*args)
+
+    async def astate(self, models):
+        return await self.run(self.state, models)
+
+    async def aget(self, models, key, versions=None):
+        return await self.run(self.get, models, key, versions)
+
+    async def aset(self, entry_key, value):
+        return await self.run(self.set, entry_key, value)
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        return {
+            'local_hits': self.local.hits,
+            'local_misses': self.local.misses,
+            'local_evictions': self.local.evictions,
+            'local_size': len(self.local),
+            'local_maxsize': self.local.maxsize,
+            'shared_hits': self.shared_hits,
+            'shared_misses': self.shared_misses,
+        }
+
+
+catalogue_cache = VersionedCache(
+    'quiz:catalogue',
+    maxsize=getattr(settings, 'CATALOGUE_CACHE_MAXSIZE', 1024),
+    timeout=getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300),
+)
+
+
+class VersionedKeys:
+    """
+    Cached values of single objects, such as the bundle of one test, each
+    stored under a version counter of its object.
+
+    Invalidating bumps the counter instead of deleting the value. A reader
+    that built the value from rows read before a change then stores it under
+    the version it started from, which nobody reads any more, rather than
+    bringing the stale value back for good.
+
+    Model signals invalidate the values on every change, so `timeout` only
+    bounds how long one can stay stale after a bulk update, which sends no
+    signal.
+    """
+
+    def __init__(self, prefix, timeout):
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def version_key(self, ident):
+        return f'{self.prefix}:version:{ident}'
+
+    def keys(self, idents):
+        """{ident: key of its current value}, from one read of the counters."""
+        version_keys = {ident: self.version_key(ident) for ident in idents}
+        versions = cache.get_many(version_keys.values())
+        keys = {}
+        for ident, version_key in version_keys.items():
+            version = versions.get(version_key)
+            if version is None:
+                # Start from the clock, as in VersionedCache.state.
+                version = time.time_ns()
+                if not cache.add(version_key, version, None):
+                    version = cache.get(version_key, version)
+            keys[ident] = f'{self.prefix}:{version}:{ident}'
+        return keys
+
+    def get(self, ident, build):
+        """The value of `ident`, or `build()` cached on a miss. None is not cached."""
+        key = self.keys([ident])[ident]
+        value = cache.get(key)
+        if value is None:
+            value = build()
+            if value is not None:
+                cache.set(key, value, self.timeout)
+        return value
+
+    def get_many(self, idents, build):
+        """
+        {ident: value} for `idents`; `build(missing)` returns the values of
+        the missing ones it can build, as a dict, and they are cached.
+        """
+        keys = self.keys(idents)
+        cached = cache.get_many(keys.values())
+        values = {ident: cached[key] for ident, key in keys.items() if key in cached}
+        missing = [ident for ident in keys if ident not in values]
+        if missing:
+            built = build(missing)
+            cache.set_many({keys[ident]: value for ident, value in built.items()}, self.timeout)
+            values.update(built)
+        return values
+
+    def bump(self, ident):
+        # the clock rather than incr(), so the counter needs no atomic
+        # increment and never expires back to an older version
+        cache.set(self.version_key(ident), time.time_ns(), None)
+
+    def invalidate(self, ident):
+        """Bump the version of `ident` once the current transaction commits."""
+        transaction.on_commit(lambda: self.bump(ident))
+
+
+@contextmanager
+def shared_lock(key, timeout=5, poll=0.001):
+    """
+    Hold `key` in the shared cache as a lock, for code that reads and writes
+    cache entries other processes change too. `cache.add` succeeds for one
+    caller at a time; the key expires after `timeout` seconds, so a process
+    that dies holding it blocks the others no longer than that.
+    """
+    while not cache.add(key, True, timeout):
+        time.sleep(poll)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+def not_modified(request, validators, modified):
+    """A 304 response if the client's copy is current, else None."""
+    response = get_conditional_response(request, etag=validators['ETag'], last_modified=int(modified))
+    if response is not None:
+        for header, value in validators.items():
+            response[header] = value
+    return response
+
+
+class CatalogueCacheMixin:
+    """
+    Serve successful GET responses of a view from `catalogue_cache`, keyed by
+    URL, with validators derived from the versions of `cache_models`. A
+    conditional request for an unchanged resource gets a 304 before any
+    query runs.
+    """
+    cache_models = ()
+
+    def get(self, request, *args, **kwargs):
+        key = request.build_absolute_uri()
+        versions, modified = catalogue_cache.state(self.cache_models)
+        validators = catalogue_cache.validators(key, versions, modified)
+        response = not_modified(request, validators, modified)
+        if response is not None:
+            return response
+        entry_key, data = catalogue_cache.get(self.cache_models, key, versions)
+        if data is not None:
+            response = Response(data)
+        else:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            catalogue_cache.set(entry_key, response.data)
+        for header, value in validators.items():
+            response[header] = value
+        return response
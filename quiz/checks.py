@@ -0,0 +1,27 @@
+from django.core.cache import caches
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.checks import Error, Tags, register
+
+# backends whose add() and incr() are atomic across processes
+SHARED_BACKENDS = (RedisCache, BaseMemcachedCache)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Version counters, answer keys, verification codes, throttle buckets and
+    replica pins must be seen by every web process and by `run_workers`, and
+    their counters and locks must stay correct when those processes update
+    them at once. A per-process LocMemCache splits them, and the file and
+    database backends implement add() and incr() as a read and a write.
+    """
+    backend = caches['default']
+    if not isinstance(backend, SHARED_BACKENDS):
+        return [Error(
+            f'The default cache ({type(backend).__name__}) has no add() and incr() '
+            f'that are atomic across processes.',
+            hint='Use the Redis backend (QUIZ_REDIS_URL) or a Memcached one.',
+            id='quiz.E001',
+        )]
+    return []
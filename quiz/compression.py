@@ -0,0 +1,73 @@
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import decorator_from_middleware
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent as they are; compressing them saves
+# less than the headers and CPU cost.
+COMPRESSION_MIN_SIZE = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+
+ENCODERS = {'gzip': lambda data: gzip.compress(data, compresslevel=6, mtime=0)}
+if brotli is not None:
+    ENCODERS = {'br': lambda data: brotli.compress(data, quality=5), **ENCODERS}
+
+
+def negotiate(accept_encoding):
+    """Pick the encoding the client prefers among `ENCODERS`, brotli first on ties. None if there is none."""
+    weights = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        match = re.search(r'q=([0-9.]+)', params)
+        try:
+            weights[token.strip().lower()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            continue
+    best, best_weight = None, 0
+    for encoding in ENCODERS:
+        weight = weights.get(encoding, weights.get('*', 0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress large rendered responses with brotli or gzip, whichever the client prefers."""
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding') or response.status_code != 200:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding', ))
+        if len(response.content) < COMPRESSION_MIN_SIZE:
+            return response
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        compressed = ENCODERS[encoding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # a strong validator would promise byte-identical bodies across encodings
+        if response.has_header('ETag') and not response['ETag'].startswith('W/'):
+            response['ETag'] = f'W/{response["ETag"]}'
+        return response
+
+
+compress_response = decorator_from_middleware(CompressionMiddleware)
+
+
+class CompressionMixin:
+    """Compress the responses of a view with `CompressionMiddleware`."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return compress_response(super().as_view(**initkwargs))
@@ -0,0 +1,43 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from quiz.cache import catalogue_cache
+from quiz.models import Subjects, Test, Question
+
+# counter column -> (model, child model, foreign key of the child)
+COUNTERS = {
+    'tests_count': (Subjects, Test, 'subject'),
+    'questions_count': (Test, Question, 'test'),
+}
+
+
+def add(model, counter, pk, delta):
+    """
+    Add `delta` to one counter of one row with a single `counter = counter + delta`
+    update. A counter that has drifted below the rows it counts stops at 0.
+    """
+    if pk is not None and delta:
+        rows = model.objects.filter(pk=pk)
+        if delta < 0:
+            rows = rows.filter(**{f'{counter}__gte': -delta})
+        rows.update(**{counter: F(counter) + delta})
+        catalogue_cache.bump_on_commit(model)
+
+
+def actual_count(child, fk):
+    counts = child.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def recount():
+    """
+    Recompute every counter from the rows it counts, with one update per
+    counter. Returns {counter: number of rows that were wrong}.
+    """
+    fixed = {}
+    for counter, (model, child, fk) in COUNTERS.items():
+        wrong = model.objects.annotate(actual=actual_count(child, fk)).filter(~Q(**{counter: F('actual')}))
+        fixed[counter] = model.objects.filter(pk__in=wrong.values('pk')).update(**{counter: actual_count(child, fk)})
+        if fixed[counter]:
+            catalogue_cache.bump(model)
+    return fixed
@@ -0,0 +1,93 @@
+import csv
+import json
+import zlib
+from collections import defaultdict
+
+from quiz.importer import CSV_COLUMNS
+from quiz.models import Question, Option
+
+EXPORT_CHUNK_SIZE = 2000
+
+QUESTION_FIELDS = ('pk', 'about', 'test__name', 'test__level', 'test__balls', 'test__subject__name')
+
+
+def question_chunks(chunk_size=EXPORT_CHUNK_SIZE, queryset=None):
+    """
+    Yield the question bank as lists of records, `chunk_size` questions at a
+    time. Questions are read by primary key ranges (`pk > last`) rather than
+    one long cursor, and the options of each chunk are fetched with one
+    extra query, so memory is bounded by the chunk size.
+
+    Records use the importer's JSONL layout, so an export can be loaded back
+    with `manage.py import_questions`.
+    """
+    queryset = (queryset if queryset is not None else Question.objects.all()).order_by('pk')
+    last = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last).values_list(*QUESTION_FIELDS)[:chunk_size])
+        if not rows:
+            return
+        options = defaultdict(list)
+        for question_id, name, is_true in (
+            Option.objects.filter(question_id__in=[row[0] for row in rows])
+            .order_by('question_id', 'pk')
+            .values_list('question_id', 'name', 'is_true')
+        ):
+            options[question_id].append({'name': name, 'is_true': is_true})
+        yield [
+            {
+                'type': 'question', 'id': pk, 'subject': subject, 'test': test, 'level': level,
+                'balls': balls, 'about': about, 'options': options[pk],
+            }
+            for pk, about, test, level, balls, subject in rows
+        ]
+        last = rows[-1][0]
+
+
+def ndjson_lines(chunks):
+    for records in chunks:
+        yield ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode()
+
+
+class Echo:
+    """A file-like object that hands back what is written, for `csv.writer`."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(chunks):
+    """One row per option, in the importer's CSV layout; a question without options gets one row."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS).encode()
+    for records in chunks:
+        rows = []
+        for record in records:
+            head = [record['subject'], record['test'], record['level'], record['balls'], record['about']]
+            if not record['options']:
+                rows.append(writer.writerow([*head, '', '']))
+            for option in record['options']:
+                rows.append(writer.writerow([*head, option['name'], int(option['is_true'])]))
+        yield ''.join(rows).encode()
+
+
+FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson', 'jsonl'),
+    'csv': (csv_lines, 'text/csv', 'csv'),
+}
+
+
+def gzip_stream(chunks, level=6):
+    """Compress a stream of byte strings into one gzip member as it is produced."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(fmt='ndjson', compress=False, chunk_size=EXPORT_CHUNK_SIZE, queryset=None):
+    encode = FORMATS[fmt][0]
+    stream = encode(question_chunks(chunk_size, queryset))
+    return gzip_stream(stream) if compress else stream
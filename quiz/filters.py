@@ -1,28 +1,53 @@
 from django_filters import FilterSet, CharFilter, NumberFilter
 
 from quiz.models import Subjects, Test, Question
+from quiz.search import search_filter_method
+
+
+# Substring filters are rewritten so an index can serve them: a field with
+# choices matches as `IN` the choices that contain the value, and a filter on
+# a related row becomes `fk IN (subquery)`, driven by the foreign key index.
+
+def matching_choices(model, field, value):
+    """The choices of `model.field` that contain `value`, ignoring case."""
+    return [choice for choice, _ in model._meta.get_field(field).choices if value.lower() in choice.lower()]
 
 
 class TestFilter(FilterSet):
-    name = CharFilter(lookup_expr='icontains')
-    level = CharFilter(lookup_expr='icontains')
-    subject = CharFilter(lookup_expr='icontains', field_name='subject__name')
+    name = CharFilter(method=search_filter_method)
+    level = CharFilter(method='filter_level')
+    subject = CharFilter(method='filter_subject')
     class Meta:
         model = Test
         fields = ('name', 'level', 'subject', 'balls')
 
+    def filter_level(self, queryset, name, value):
+        return queryset.filter(level__in=matching_choices(Test, 'level', value))
+
+    def filter_subject(self, queryset, name, value):
+        return queryset.filter(subject__in=Subjects.objects.filter(name__icontains=value))
+
 class SubjectFilter(FilterSet):
-    name = CharFilter(lookup_expr='icontains')
+    name = CharFilter(method=search_filter_method)
     class Meta:
         model = Subjects
         fields = ('name',)
 
 class QuestionsFilter(FilterSet):
-    about = CharFilter(lookup_expr='icontains')
-    test = CharFilter(lookup_expr='icontains', field_name='test__name')
-    test_level = CharFilter(lookup_expr='icontains', field_name='test__level')
-    test_balls = NumberFilter(field_name='test__balls')
+    about = CharFilter(method=search_filter_method)
+    test = CharFilter(method='filter_test')
+    test_level = CharFilter(method='filter_test')
+    test_balls = NumberFilter(method='filter_test')
 
     class Meta:
         model = Question
-        fields = ('about', 'test', 'test_level', 'test_balls')
\ No newline at end of file
+        fields = ('about', 'test', 'test_level', 'test_balls')
+
+    def filter_test(self, queryset, name, value):
+        if name == 'test':
+            tests = Test.objects.filter(name__icontains=value)
+        elif name == 'test_level':
+            tests = Test.objects.filter(level__in=matching_choices(Test, 'level', value))
+        else:
+            tests = Test.objects.filter(balls=value)
+        return queryset.filter(test__in=tests)
@@ -0,0 +1,63 @@
+from django.db import transaction
+from django.db.models import F, Max
+
+from quiz.answer_keys import get_answer_key
+from quiz.authentication import invalidate_cached_user
+from quiz.leaderboard import record_balls_delta
+from quiz.models import User, Test, Attempt
+from quiz.profiles import invalidate_profile
+
+
+class TestNotFound(Exception):
+    pass
+
+
+def grade(test_id, answers):
+    """
+    Grade `answers` ({question_id: option_id}) against the test's answer key.
+
+    Returns `(correct, total)`: the ids of the correctly answered questions
+    and the number of questions in the test. An answer counts only if the
+    chosen option is the true option of that very question.
+    """
+    key = get_answer_key(test_id)
+    return key.grade(answers), len(key)
+
+
+def award(test_balls, correct, total):
+    if not total:
+        return 0
+    return test_balls * correct // total
+
+
+def submit(user, test_id, answers):
+    """
+    Grade a whole submission, record it as an `Attempt` and award balls.
+
+    The award is the share of `Test.balls` matching the score. Retaking a
+    test only pays out the improvement over the user's best attempt, so
+    balls cannot be farmed by resubmitting. Runs a fixed number of queries
+    whatever the size of the test.
+    """
+    test_balls = Test.objects.filter(pk=test_id).values_list('balls', flat=True).first()
+    if test_balls is None:
+        raise TestNotFound
+    correct, total = grade(test_id, answers)
+    earned = award(test_balls, len(correct), total)
+
+    with transaction.atomic():
+        # Lock the user first, so that concurrent submissions of one user
+        # read `best` one after the other and cannot both be paid for it.
+        User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True).get()
+        best = Attempt.objects.filter(user=user, test_id=test_id).aggregate(best=Max('balls'))['best'] or 0
+        balls = max(0, earned - best)
+        attempt = Attempt.objects.create(
+            user=user, test_id=test_id, answers={str(q): o for q, o in answers.items()},
+            correct=len(correct), total=total, balls=earned,
+        )
+        if balls:
+            User.objects.filter(pk=user.pk).update(balls=F('balls') + balls)
+            record_balls_delta(user.pk, balls)
+            transaction.on_commit(lambda: invalidate_cached_user(user.pk))
+            invalidate_profile(user.pk)
+    return attempt, correct, balls
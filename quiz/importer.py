@@ -0,0 +1,239 @@
+import csv
+import gzip
+import json
+import os
+import time
+from collections import Counter
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+
+from quiz import counters
+from quiz.answer_keys import invalidate_answer_key
+from quiz.bundles import invalidate_test_bundle
+from quiz.cache import catalogue_cache
+from quiz.models import Subjects, Test, Question, Option
+from quiz.question_pools import invalidate_pool
+
+
+class ImportFailed(Exception):
+    pass
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 't', 'y')
+
+
+def jsonl_records(lines, skip=0):
+    """
+    Turn JSONL lines into (line number, question) pairs, after the first
+    `skip` lines.
+
+    Records are objects with a `type`:
+
+    - `subject`: `{"type": "subject", "name": ...}`
+    - `test`: `{"type": "test", "subject": ..., "name": ..., "level": ..., "balls": ...}`
+    - `question`: `{"type": "question", "subject": ..., "test": ..., "about": ..., "options": [...]}`
+    - `option`: `{"type": "option", "name": ..., "is_true": ...}`, added to the
+      question before it.
+
+    A question is yielded once the record after it (or the end of the file)
+    is reached, with the number of lines fully consumed at that point.
+    """
+    question = None
+    number = skip
+    for number, line in enumerate(islice(lines, skip, None), start=skip + 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            kind = record['type']
+        except (ValueError, KeyError, TypeError):
+            raise ImportFailed(f'line {number}: expected a JSON object with a "type"')
+        if kind == 'option':
+            if question is None:
+                raise ImportFailed(f'line {number}: option without a question')
+            question['options'].append(record)
+            continue
+        if question is not None:
+            yield number - 1, question
+            question = None
+        if kind == 'question':
+            question = {**record, 'options': list(record.get('options', ()))}
+        elif kind in ('subject', 'test'):
+            yield number, record
+        else:
+            raise ImportFailed(f'line {number}: unknown record type {kind!r}')
+    if question is not None:
+        yield number, question
+
+
+CSV_COLUMNS = ('subject', 'test', 'level', 'balls', 'question', 'option', 'is_true')
+
+
+def csv_records(lines, skip=0):
+    """
+    Turn CSV rows into (row number, question) pairs, after the first `skip`
+    rows. Every row is one option; consecutive rows with the same subject,
+    test and question text form one question. Columns: subject, test, level,
+    balls, question, option, is_true.
+
+    Rows are counted after parsing, since a quoted field may span lines.
+    """
+    reader = csv.DictReader(lines)
+    missing = set(CSV_COLUMNS) - set(reader.fieldnames or ()) - {'level', 'balls'}
+    if missing:
+        raise ImportFailed(f'missing CSV columns: {", ".join(sorted(missing))}')
+    question = None
+    number = skip
+    for number, row in enumerate(islice(reader, skip, None), start=skip + 1):
+        ident = (row['subject'], row['test'], row['question'])
+        if question is not None and question['ident'] != ident:
+            yield number - 1, question
+            question = None
+        if question is None:
+            question = {
+                'type': 'question', 'ident': ident, 'subject': row['subject'], 'test': row['test'],
+                'level': row.get('level') or None, 'balls': row.get('balls') or None,
+                'about': row['question'], 'options': [],
+            }
+        if row['option']:
+            question['options'].append({'name': row['option'], 'is_true': row['is_true']})
+    if question is not None:
+        yield number, question
+
+
+class Importer:
+    """
+    Streams subjects, tests, questions and options into the database.
+
+    Subjects and tests are resolved by name through in-memory id maps that
+    are preloaded from the database, so only the pending batch of questions
+    is held in memory. Each batch is written with `bulk_create` in its own
+    transaction, after which the number of consumed input records (JSONL
+    lines or CSV rows) is written to the checkpoint file; a rerun skips that
+    many records.
+    """
+
+    def __init__(self, batch_size=5000, checkpoint=None, progress=None):
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.subjects = dict(Subjects.objects.values_list('name', 'pk'))
+        self.tests = {
+            (subject_id, name): pk for pk, subject_id, name in Test.objects.values_list('pk', 'subject_id', 'name')
+        }
+        self.pending = []
+        self.touched_tests = set()
+        self.counts = {'subjects': 0, 'tests': 0, 'questions': 0, 'options': 0}
+        self.started = time.monotonic()
+
+    def run(self, path, fmt=None):
+        fmt = fmt or ('csv' if '.csv' in os.path.basename(path) else 'jsonl')
+        skip = self.read_checkpoint()
+        with open_text(path) as stream:
+            records = (csv_records if fmt == 'csv' else jsonl_records)(stream, skip)
+            consumed = skip
+            for consumed, record in records:
+                self.add(record)
+                if len(self.pending) >= self.batch_size:
+                    self.flush(consumed)
+            self.flush(consumed)
+        self.finish()
+        return self.counts
+
+    def read_checkpoint(self):
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as f:
+                return json.load(f)['records']
+        return 0
+
+    def write_checkpoint(self, records):
+        if self.checkpoint:
+            temporary = f'{self.checkpoint}.tmp'
+            with open(temporary, 'w') as f:
+                json.dump({'records': records, 'counts': self.counts}, f)
+            os.replace(temporary, self.checkpoint)
+
+    def subject_id(self, name):
+        if not name:
+            raise ImportFailed('a subject name is required')
+        if name not in self.subjects:
+            self.subjects[name] = Subjects.objects.create(name=name).pk
+            self.counts['subjects'] += 1
+        return self.subjects[name]
+
+    def test_id(self, record):
+        subject_id = self.subject_id(record.get('subject'))
+        name = record.get('test') if record['type'] != 'test' else record.get('name')
+        if not name:
+            raise ImportFailed('a test name is required')
+        if (subject_id, name) not in self.tests:
+            level = record.get('level') or Test.LevelChoices.BEGINNER
+            balls = record.get('balls')
+            # bulk_create skips Test.save, so the given balls are stored as-is
+            test = Test(
+                name=name, subject_id=subject_id, level=level,
+                balls=int(balls) if balls not in (None, '') else Test.LEVEL_BALLS.get(level, 0),
+            )
+            with transaction.atomic():
+                Test.objects.bulk_create([test])
+                counters.add(Subjects, 'tests_count', subject_id, 1)
+            self.tests[subject_id, name] = test.pk
+            self.counts['tests'] += 1
+        return self.tests[subject_id, name]
+
+    def add(self, record):
+        if record['type'] == 'subject':
+            self.subject_id(record.get('name'))
+        elif record['type'] == 'test':
+            self.test_id(record)
+        else:
+            test_id = self.test_id(record)
+            self.touched_tests.add(test_id)
+            self.pending.append((Question(about=record['about'], test_id=test_id), record['options']))
+
+    def flush(self, consumed):
+        if self.pending:
+            try:
+                with transaction.atomic():
+                    questions = Question.objects.bulk_create([question for question, _ in self.pending])
+                    options = Option.objects.bulk_create([
+                        Option(question_id=question.pk, name=option['name'], is_true=parse_bool(option.get('is_true')))
+                        for question, (_, question_options) in zip(questions, self.pending)
+                        for option in question_options
+                    ])
+                    for test_id, count in Counter(question.test_id for question in questions).items():
+                        counters.add(Test, 'questions_count', test_id, count)
+            except IntegrityError as e:
+                raise ImportFailed(f'batch ending at record {consumed}: {e}') from e
+            self.counts['questions'] += len(questions)
+            self.counts['options'] += len(options)
+            self.pending = []
+        self.write_checkpoint(consumed)
+        if self.progress:
+            elapsed = time.monotonic() - self.started
+            rows = self.counts['questions'] + self.counts['options']
+            self.progress(f'{consumed} records, {self.counts["questions"]} questions, '
+                          f'{self.counts["options"]} options ({rows / max(elapsed, 1e-9):,.0f} rows/s)')
+
+    def finish(self):
+        # bulk_create sends no signals, so drop what the model signals would have
+        for model in (Subjects, Test, Question, Option):
+            catalogue_cache.bump(model)
+        for test_id in self.touched_tests:
+            invalidate_test_bundle(test_id)
+            invalidate_answer_key(test_id)
+        pools = Test.objects.filter(pk__in=self.touched_tests).values_list('subject_id', 'level').distinct()
+        for pool_id in pools:
+            invalidate_pool(pool_id)
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
@@ -0,0 +1,150 @@
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils.timezone import now
+
+from quiz.models import Job
+
+logger = logging.getLogger(__name__)
+
+# seconds a worker may hold a job before another worker takes it over
+JOB_LEASE = getattr(settings, 'JOB_LEASE', 300)
+# seconds before the first retry; doubles on every further failure
+JOB_RETRY_DELAY = getattr(settings, 'JOB_RETRY_DELAY', 10)
+JOB_RETRY_MAX_DELAY = 60 * 60
+
+# job name -> (function, attempts before the job is dead)
+registry = {}
+
+
+def job(name=None, max_attempts=5):
+    """
+    Register a function, called with the keyword arguments given to `enqueue`,
+    as a job. It runs outside any transaction; a job that writes opens its
+    own short atomic blocks, rather than holding SQLite's write lock while it
+    sends mail or waits on another service.
+    """
+    def register(func):
+        registry[name or func.__name__] = (func, max_attempts)
+        return func
+    return register
+
+
+def enqueue(name, delay=0, **payload):
+    """
+    Queue a job. The row is part of the current transaction, so a job only
+    becomes visible to workers if the work that queued it commits.
+    """
+    func, max_attempts = registry[name]
+    return Job.objects.create(
+        name=name, payload=payload, max_attempts=max_attempts,
+        run_after=now() + timedelta(seconds=delay),
+    )
+
+
+def retry_delay(attempts):
+    return min(JOB_RETRY_DELAY * 2 ** (attempts - 1), JOB_RETRY_MAX_DELAY)
+
+
+def claim(limit):
+    """
+    Lease up to `limit` due jobs, queued ones and running ones whose worker
+    let the lease expire. Each job is taken with a conditional update, so
+    concurrent workers never run the same job twice within a lease.
+    """
+    due = (
+        Job.objects.filter(
+            status__in=(Job.StatusChoices.QUEUED, Job.StatusChoices.RUNNING), run_after__lte=now(),
+        )
+        .order_by('run_after', 'pk')
+        .values_list('pk', 'run_after')[:limit]
+    )
+    claimed = []
+    for pk, run_after in due:
+        taken = Job.objects.filter(pk=pk, run_after=run_after).exclude(
+            status__in=(Job.StatusChoices.DONE, Job.StatusChoices.DEAD)
+        ).update(
+            status=Job.StatusChoices.RUNNING,
+            run_after=now() + timedelta(seconds=JOB_LEASE),
+            attempts=F('attempts') + 1,
+        )
+        if taken:
+            claimed.append(pk)
+    return list(Job.objects.filter(pk__in=claimed).order_by('pk'))
+
+
+def run(job):
+    """Run one claimed job and record its outcome."""
+    try:
+        func, _ = registry[job.name]
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        dead = job.attempts >= job.max_attempts
+        logger.warning('Job %s failed (attempt %s of %s)', job, job.attempts, job.max_attempts, exc_info=True)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.StatusChoices.DEAD if dead else Job.StatusChoices.QUEUED,
+            run_after=now() + timedelta(seconds=retry_delay(job.attempts)),
+            last_error=error,
+        )
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.StatusChoices.DONE, last_error='')
+    return True
+
+
+def run_pending(limit=100):
+    """Run the due jobs in this thread until there are none left. Returns how many ran."""
+    count = 0
+    while jobs := claim(limit):
+        for job in jobs:
+            run(job)
+        count += len(jobs)
+    return count
+
+
+def retry_dead(pks=None):
+    """Queue dead jobs (all of them, or those in `pks`) again with fresh attempts."""
+    dead = Job.objects.filter(status=Job.StatusChoices.DEAD)
+    if pks is not None:
+        dead = dead.filter(pk__in=pks)
+    return dead.update(status=Job.StatusChoices.QUEUED, attempts=0, run_after=now())
+
+
+class WorkerPool:
+    """
+    `threads` threads running due jobs. The pool polls the queue every
+    `poll` seconds while it is idle and stops when `stop` is set.
+    """
+
+    def __init__(self, threads=4, poll=1.0):
+        self.threads = threads
+        self.poll = poll
+        self.stop = threading.Event()
+
+    def run_one(self, job):
+        close_old_connections()
+        try:
+            run(job)
+        finally:
+            close_old_connections()
+
+    def serve(self, once=False):
+        with ThreadPoolExecutor(self.threads, thread_name_prefix='quiz-job') as pool:
+            while not self.stop.is_set():
+                jobs = claim(self.threads)
+                if not jobs:
+                    if once:
+                        return
+                    self.stop.wait(self.poll)
+                    continue
+                if self.threads == 1:
+                    # no hand-off: the job runs on the connection that claimed it
+                    run(jobs[0])
+                else:
+                    list(pool.map(self.run_one, jobs))
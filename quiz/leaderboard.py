@@ -0,0 +1,173 @@
+import threading
+import time
+from array import array
+from bisect import bisect_right, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+from quiz.models import User
+
+SEQUENCE_KEY = 'quiz:leaderboard:sequence'
+
+# Changes are kept in the shared cache for this long; a process that falls
+# further behind reloads its scores instead of replaying them.
+CHANGE_TIMEOUT = 10 * 60
+
+# Balls changed by bulk updates send no signal, so every process also
+# reloads its scores once they are this old.
+MAX_AGE = getattr(settings, 'LEADERBOARD_MAX_AGE', 15 * 60)
+
+
+def change_key(sequence):
+    return f'quiz:leaderboard:change:{sequence}'
+
+
+def current_sequence():
+    # start from the clock, so a lost counter never reuses a number
+    cache.add(SEQUENCE_KEY, time.time_ns())
+    return cache.get(SEQUENCE_KEY)
+
+
+def record_change(old, new):
+    """
+    Publish a balls change, once the current transaction commits. `old` and
+    `new` are `(level, balls)` pairs; `old` is None for a new user and `new`
+    is None for a deleted one.
+    """
+    if old == new:
+        return
+
+    def publish():
+        # incr() is atomic on the backends quiz.E001 accepts (Redis INCR), so
+        # every change gets a number of its own
+        try:
+            sequence = cache.incr(SEQUENCE_KEY)
+        except ValueError:
+            current_sequence()
+            sequence = cache.incr(SEQUENCE_KEY)
+        if not cache.add(change_key(sequence), (old, new), CHANGE_TIMEOUT):
+            # The number was handed out twice anyway. Rather than overwrite
+            # the other change, drop the counter: every process then reloads.
+            cache.delete(SEQUENCE_KEY)
+    transaction.on_commit(publish)
+
+
+def record_balls_delta(user_id, delta):
+    """
+    Publish the change of a `balls = balls + delta` update of one user.
+    Call it inside the transaction of the update, which holds the row lock,
+    so the balls read back are the ones the update produced.
+    """
+    level, balls = User.objects.filter(pk=user_id).values_list('level', 'balls').get()
+    record_change((level, balls - delta), (level, balls))
+
+
+class Leaderboard:
+    """
+    The balls of every user, per level and overall, as sorted packed arrays.
+
+    A rank is the number of users with more balls plus one, found with a
+    binary search. Every process loads the arrays once and then replays the
+    changes other processes published to the shared cache, in order. Later
+    reloads run in a background thread; requests keep the arrays they have
+    meanwhile instead of waiting for every user to be read.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.scores = None
+        self.sequence = None
+        self.loaded = self.synced = 0
+        self.reloading = None
+
+    def clear(self):
+        with self.lock:
+            self.scores = None
+
+    @staticmethod
+    def read():
+        # A change committed between reading the sequence and the users is
+        # replayed on top of the new arrays too; MAX_AGE bounds that drift.
+        sequence = current_sequence()
+        scores = {None: array('q')}
+        for level, balls in User.objects.values_list('level', 'balls').order_by('balls').iterator(chunk_size=10_000):
+            scores[None].append(balls)
+            scores.setdefault(level, array('q')).append(balls)
+        return sequence, scores
+
+    def install(self, sequence, scores):
+        # called with the lock held
+        self.scores, self.sequence = scores, sequence
+        self.loaded = self.synced = time.monotonic()
+
+    def reload_in_background(self):
+        # called with the lock held
+        if self.reloading is None:
+            self.reloading = threading.Thread(target=self.reload, name='leaderboard-reload', daemon=True)
+            self.reloading.start()
+
+    def reload(self):
+        try:
+            sequence, scores = self.read()
+            with self.lock:
+                self.install(sequence, scores)
+        finally:
+            self.reloading = None
+            # the reload thread's own connection
+            connections.close_all()
+
+    def sync(self):
+        with self.lock:
+            if self.scores is None:
+                # nothing to serve yet
+                self.install(*self.read())
+                return
+            if time.monotonic() - self.loaded > MAX_AGE:
+                self.reload_in_background()
+            sequence = cache.get(SEQUENCE_KEY)
+            if sequence == self.sequence:
+                self.synced = time.monotonic()
+                return
+            if (sequence is None or sequence < self.sequence or sequence - self.sequence > 10_000
+                    or time.monotonic() - self.synced > CHANGE_TIMEOUT / 2):
+                # the counter was lost, or the oldest changes may have expired
+                self.reload_in_background()
+                return
+            keys = [change_key(number) for number in range(self.sequence + 1, sequence + 1)]
+            changes = cache.get_many(keys)
+            for key in keys:
+                if key not in changes:
+                    # counted but not written yet; the rest is replayed next time
+                    break
+                self.apply(*changes[key])
+                self.sequence += 1
+            self.synced = time.monotonic()
+
+    def apply(self, old, new):
+        if old is not None:
+            for scores in (self.scores[None], self.scores.get(old[0])):
+                if scores is not None:
+                    i = bisect_right(scores, old[1]) - 1
+                    if i >= 0 and scores[i] == old[1]:
+                        del scores[i]
+        if new is not None:
+            insort(self.scores[None], new[1])
+            insort(self.scores.setdefault(new[0], array('q')), new[1])
+
+    def rank(self, balls, level=None):
+        return self.ranks([balls], level)[0]
+
+    def ranks(self, balls, level=None):
+        """The ranks of each of `balls`, after a single sync."""
+        self.sync()
+        scores = self.scores.get(level, ())
+        return [len(scores) - bisect_right(scores, value) + 1 for value in balls]
+
+    def size(self, level=None):
+        self.sync()
+        return len(self.scores.get(level, ()))
+
+
+leaderboard = Leaderboard()
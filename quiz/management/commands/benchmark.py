@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.benchmarks import SCENARIOS, benchmark_database
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and run benchmark scenarios against it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='Scenarios to run (default: all).')
+        parser.add_argument('--rows', type=int, default=100_000, help='Dataset size to seed.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed repetitions per measurement.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}. '
+                               f'Available: {", ".join(SCENARIOS)}.')
+        report = {}
+        for name in names:
+            self.stderr.write(f'Running {name}...')
+            with benchmark_database():
+                report[name] = SCENARIOS[name](options['rows'], options['repeat'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, results in report.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for result in results:
+                self.stdout.write('  ' + '  '.join(f'{key}={value}' for key, value in result.items()))
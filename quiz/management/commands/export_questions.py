@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from quiz.export import EXPORT_CHUNK_SIZE, FORMATS, export_stream
+
+
+class Command(BaseCommand):
+    help = 'Stream the question bank with its options as NDJSON or CSV, in the import_questions layout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file (default: stdout).')
+        parser.add_argument('--format', choices=list(FORMATS), help='Output format (default: from the file name).')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output (implied by a .gz path).')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Questions read per query.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if '.csv' in path else 'ndjson')
+        compress = options['gzip'] or path.endswith('.gz')
+        stream = export_stream(fmt, compress, options['chunk_size'])
+        if path == '-':
+            out = sys.stdout.buffer
+            for chunk in stream:
+                out.write(chunk)
+            out.flush()
+            return
+        with open(path, 'wb') as out:
+            for chunk in stream:
+                out.write(chunk)
+        self.stderr.write(f'Wrote {path}.')
@@ -0,0 +1,32 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.importer import Importer, ImportFailed
+
+
+class Command(BaseCommand):
+    help = 'Stream subjects, tests, questions and options from a JSONL or CSV file (optionally gzipped).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file (.jsonl, .csv, optionally .gz).')
+        parser.add_argument('--format', choices=('jsonl', 'csv'), help='Input format (default: from the file name).')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Questions written per transaction.')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint).')
+        parser.add_argument('--no-checkpoint', action='store_true', help='Do not record or resume progress.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist.')
+        checkpoint = None if options['no_checkpoint'] else (options['checkpoint'] or f'{path}.checkpoint')
+        if checkpoint and os.path.exists(checkpoint):
+            self.stderr.write(f'Resuming from {checkpoint}.')
+        importer = Importer(batch_size=options['batch_size'], checkpoint=checkpoint, progress=self.stderr.write)
+        try:
+            counts = importer.run(path, options['format'])
+        except ImportFailed as e:
+            raise CommandError(f'{e} (committed batches are kept; rerun to resume)')
+        self.stdout.write(self.style.SUCCESS(
+            'Imported ' + ', '.join(f'{count} {name}' for name, count in counts.items()) + '.'
+        ))
@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.benchmarks import benchmark_database, compare, route_load
+
+# preset -> (questions, users)
+SCALES = {
+    'small': (1_000, 1_000),
+    'medium': (100_000, 100_000),
+    'large': (1_000_000, 1_000_000),
+}
+
+
+def count(value):
+    """`'100k'` -> 100000, `'1m'` -> 1000000."""
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(value[-1:].lower(), 1)
+    return int(value[:-1] if multiplier > 1 else value) * multiplier
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database at scale, drive every route under gunicorn with concurrent '
+            'authenticated clients and write a JSON baseline; optionally compare it with an earlier one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='medium',
+                            help='Dataset preset: small (1k questions, 1k users), medium (100k, 100k) '
+                                 'or large (1M, 1M).')
+        parser.add_argument('--questions', type=count, help='Questions to seed, e.g. 1k, 100k or 1m.')
+        parser.add_argument('--users', type=count, help='Users to seed, e.g. 1m.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients, one user each.')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per client and route.')
+        parser.add_argument('--output', help='Write the baseline to this file instead of stdout.')
+        parser.add_argument('--compare', metavar='BASELINE', help='Compare with an earlier baseline.')
+        parser.add_argument('--tolerance', type=float, default=10,
+                            help='Percent of throughput or p95 latency a route may lose before it counts '
+                                 'as a regression.')
+
+    def handle(self, *args, **options):
+        questions, users = SCALES[options['scale']]
+        questions = options['questions'] or questions
+        users = options['users'] or users
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        self.stderr.write(f'Seeding {questions} questions and {users} users...')
+        with benchmark_database():
+            report = route_load(questions, users, options['concurrency'], options['requests'], seed=options['seed'])
+        document = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(document + '\n')
+        else:
+            self.stdout.write(document)
+
+        if baseline is None:
+            return
+        if {key: baseline['meta'].get(key) for key in ('questions', 'users', 'concurrency', 'requests_per_client')} != \
+                {key: report['meta'][key] for key in ('questions', 'users', 'concurrency', 'requests_per_client')}:
+            self.stderr.write(self.style.WARNING('The baseline was measured with other parameters.'))
+        rows = compare(baseline, report, options['tolerance'])
+        for row in rows:
+            line = '  '.join(f'{key}={value}' for key, value in row.items() if key != 'regressed')
+            self.stderr.write(self.style.ERROR(line) if row['regressed'] else line)
+        regressed = [row['route'] for row in rows if row['regressed']]
+        if regressed:
+            raise CommandError(f'{len(regressed)} routes regressed: {", ".join(regressed)}')
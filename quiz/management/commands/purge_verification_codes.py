@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from quiz.models import UserConfirmation
+
+
+class Command(BaseCommand):
+    help = 'Delete expired, unspent verification codes from UserConfirmation, in batches. ' \
+           'Confirmed rows, the record of verified accounts, are kept.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=0, metavar='DAYS',
+                            help='Keep rows that expired less than DAYS days ago.')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        cutoff = now() - timedelta(days=options['older_than'])
+        deleted = 0
+        # one condition per pass, so each batch is read from the expire_time index
+        unspent = UserConfirmation.objects.filter(is_confirmed=False)
+        for stale in (unspent.filter(expire_time__lt=cutoff), unspent.filter(expire_time__isnull=True)):
+            while batch := list(stale.values_list('pk', flat=True)[:options['batch_size']]):
+                deleted += UserConfirmation.objects.filter(pk__in=batch).delete()[0]
+        self.stdout.write(f'{deleted} verification codes deleted')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from quiz.counters import recount
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized counters (Subjects.tests_count, Test.questions_count) in bulk.'
+
+    def handle(self, *args, **options):
+        for counter, fixed in recount().items():
+            self.stdout.write(f'{counter}: {fixed} rows fixed')
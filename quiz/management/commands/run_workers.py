@@ -0,0 +1,58 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from quiz.jobs import WorkerPool, retry_dead
+from quiz.models import Job
+
+
+def serve(threads, poll, once):
+    pool = WorkerPool(threads=threads, poll=poll)
+    signal.signal(signal.SIGTERM, lambda *args: pool.stop.set())
+    try:
+        pool.serve(once=once)
+    except KeyboardInterrupt:
+        pool.stop.set()
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs (quiz.jobs) with a pool of worker threads, optionally in several processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads per process.')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes.')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between polls of an idle queue.')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due.')
+        parser.add_argument('--list-dead', action='store_true', help='List the dead-letter jobs and exit.')
+        parser.add_argument('--retry-dead', nargs='*', type=int, metavar='ID',
+                            help='Queue dead jobs again (all of them if no id is given) and exit.')
+
+    def handle(self, *args, **options):
+        if options['list_dead']:
+            for job in Job.objects.filter(status=Job.StatusChoices.DEAD).order_by('pk'):
+                error = job.last_error.strip().splitlines()[-1:] or ['']
+                self.stdout.write(f'{job.pk}\t{job.name}\t{job.attempts} attempts\t{error[0]}')
+            return
+        if options['retry_dead'] is not None:
+            count = retry_dead(options['retry_dead'] or None)
+            self.stdout.write(f'{count} dead jobs queued again')
+            return
+
+        worker_args = (options['threads'], options['poll'], options['once'])
+        if options['processes'] <= 1:
+            serve(*worker_args)
+            return
+        # forked children must not share the parent's database connections
+        connections.close_all()
+        processes = [multiprocessing.Process(target=serve, args=worker_args) for _ in range(options['processes'])]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+                process.join()
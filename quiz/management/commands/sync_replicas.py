@@ -0,0 +1,41 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from quiz.routers import DATABASE_REPLICAS
+
+
+def sync(source, target):
+    """Copy the SQLite database file `source` into `target` with the online backup API."""
+    src, dst = sqlite3.connect(source, timeout=20), sqlite3.connect(target, timeout=20)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database into the files of DATABASE_REPLICAS, once or every --interval '
+            'seconds. Other databases replicate on their own.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep syncing, every this many seconds.')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Only SQLite replicas are synced by copying; use the replication of your database.')
+        if not DATABASE_REPLICAS:
+            raise CommandError('No DATABASE_REPLICAS are configured.')
+        targets = [connections[alias].settings_dict['NAME'] for alias in DATABASE_REPLICAS]
+        while True:
+            start = time.perf_counter()
+            for target in targets:
+                sync(primary['NAME'], target)
+            self.stdout.write(f'Synced {len(targets)} replicas in {time.perf_counter() - start:.2f}s')
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
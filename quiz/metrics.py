@@ -0,0 +1,260 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+# requests slower than this are logged with their slowest statements
+METRICS_SLOW_REQUEST_MS = getattr(settings, 'METRICS_SLOW_REQUEST_MS', 500)
+METRICS_SLOW_TOP_SQL = getattr(settings, 'METRICS_SLOW_TOP_SQL', 5)
+METRICS_ALLOWED_IPS = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class Histogram:
+    """
+    Log-linear histogram in the manner of HdrHistogram. Each power of two
+    range is split into 2**`sub_bits` equal buckets, so a value is recorded
+    with a relative error below 1 / 2**`sub_bits` (about 3% by default) and
+    memory grows with the dynamic range, not with the number of values.
+    Values are integers, e.g. microseconds.
+    """
+
+    def __init__(self, sub_bits=5):
+        self.sub_bits = sub_bits
+        self.counts = defaultdict(int)  # lower bound of a bucket -> count
+        self.count = 0
+        self.sum = 0
+
+    def bucket(self, value):
+        shift = max(0, value.bit_length() - self.sub_bits - 1)
+        return value >> shift << shift, 1 << shift
+
+    def record(self, value):
+        value = max(0, int(value))
+        self.counts[self.bucket(value)[0]] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """The middle of the bucket holding the `q` quantile, or 0 when empty."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for lower in sorted(self.counts):
+            seen += self.counts[lower]
+            if seen >= rank:
+                low, width = self.bucket(lower)
+                return low + (width - 1) / 2
+        return 0
+
+
+class Registry:
+    """Per-process aggregates of every request, keyed by (route, method)."""
+
+    histograms = ('duration', 'db', 'serialize', 'render')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.requests = defaultdict(int)  # (route, method, status) -> count
+            self.queries = defaultdict(int)
+            self.bytes = defaultdict(int)
+            self.timings = defaultdict(lambda: {name: Histogram() for name in self.histograms})
+
+    def observe(self, route, method, status, record, total, size):
+        key = (route, method)
+        with self.lock:
+            self.requests[(route, method, status)] += 1
+            self.queries[key] += len(record.queries)
+            self.bytes[key] += size
+            timings = self.timings[key]
+            timings['duration'].record(total * 1e6)
+            timings['db'].record(record.db_time * 1e6)
+            timings['serialize'].record(record.spans.get('serialize', 0) * 1e6)
+            timings['render'].record(record.spans.get('render', 0) * 1e6)
+
+    def prometheus(self):
+        """The aggregates in the Prometheus text exposition format."""
+        lines = []
+
+        def labels(route, method, **extra):
+            pairs = {'view': route, 'method': method, **extra}
+            return ','.join(f'{name}="{escape(value)}"' for name, value in pairs.items())
+
+        with self.lock:
+            lines += ['# HELP quiz_requests_total Requests served.', '# TYPE quiz_requests_total counter']
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f'quiz_requests_total{{{labels(route, method, status=str(status))}}} {count}')
+            for name, values, help_text in (
+                ('quiz_db_queries_total', self.queries, 'SQL statements run.'),
+                ('quiz_response_bytes_total', self.bytes, 'Response body bytes sent.'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (route, method), value in sorted(values.items()):
+                    lines.append(f'{name}{{{labels(route, method)}}} {value}')
+            for histogram in self.histograms:
+                name = f'quiz_request_{histogram}_seconds'
+                lines += [f'# HELP {name} Time per request spent in {histogram}.', f'# TYPE {name} summary']
+                for (route, method), timings in sorted(self.timings.items()):
+                    values = timings[histogram]
+                    for q in QUANTILES:
+                        lines.append(f'{name}{{{labels(route, method, quantile=str(q))}}} {values.quantile(q) / 1e6:.6f}')
+                    lines.append(f'{name}_sum{{{labels(route, method)}}} {values.sum / 1e6:.6f}')
+                    lines.append(f'{name}_count{{{labels(route, method)}}} {values.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+registry = Registry()
+
+
+class RequestRecord:
+    """The statements and timed spans of one request."""
+
+    def __init__(self):
+        self.queries = []  # (seconds, sql)
+        self.db_time = 0.0
+        self.spans = defaultdict(float)
+
+
+current_record = ContextVar('quiz_request_record', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """A database execute_wrapper adding each statement to the current request's record."""
+    record = current_record.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        record.db_time += elapsed
+        record.queries.append((elapsed, sql))
+
+
+@receiver(connection_created)
+def wrap_connection(sender, connection, **kwargs):
+    # Connections are per thread, and the ORM calls of an async view run in
+    # a worker thread of their own; the record follows them there in the
+    # context, so every connection is wrapped once, whoever opens it.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed(span):
+    """Add the time spent in the body to `span` of the current request, if it is measured."""
+    record = current_record.get()
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.spans[span] += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Measure every request: SQL statements and their time on every database
+    connection, the `serialize` and `render` spans, total time
+    and body size. Adds a `Server-Timing` header, aggregates per route into
+    `registry` and logs slow requests with their slowest statements.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        record = RequestRecord()
+        token = current_record.set(record)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_record.reset(token)
+        return self.finish(request, response, record, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        record = RequestRecord()
+        token = current_record.set(record)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_record.reset(token)
+        return self.finish(request, response, record, time.perf_counter() - start)
+
+    @staticmethod
+    def finish(request, response, record, total):
+        size = 0 if response.streaming else len(response.content)
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        registry.observe(route, request.method, response.status_code, record, total, size)
+        response['Server-Timing'] = server_timing(record, total)
+        if total * 1000 >= METRICS_SLOW_REQUEST_MS:
+            log_slow_request(request, response, record, total)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns
+        record = current_record.get()
+        if record is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                record.spans['render'] += time.perf_counter() - start
+            response.add_post_render_callback(rendered)
+        return response
+
+
+def server_timing(record, total):
+    metrics = [f'db;dur={record.db_time * 1000:.2f};desc="{len(record.queries)} queries"']
+    metrics += [f'{span};dur={seconds * 1000:.2f}' for span, seconds in record.spans.items()]
+    metrics.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(metrics)
+
+
+def log_slow_request(request, response, record, total):
+    slowest = sorted(record.queries, key=lambda query: query[0], reverse=True)[:METRICS_SLOW_TOP_SQL]
+    logger.warning(
+        'Slow request %s %s: %.1f ms, status %s, %d queries in %.1f ms\n%s',
+        request.method, request.get_full_path(), total * 1000, response.status_code,
+        len(record.queries), record.db_time * 1000,
+        '\n'.join(f'  {seconds * 1000:.1f} ms  {sql[:500]}' for seconds, sql in slowest),
+    )
+
+
+def metrics_view(request):
+    """The aggregates of this process for Prometheus, to scrapers on `METRICS_ALLOWED_IPS`."""
+    if request.META.get('REMOTE_ADDR') not in METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
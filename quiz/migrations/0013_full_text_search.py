@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# (table, indexed column) pairs; kept in step with quiz.search.SEARCH_FIELDS.
+INDEXED = (
+    ('quiz_question', 'about'),
+    ('quiz_test', 'name'),
+    ('quiz_subjects', 'name'),
+)
+
+
+def sqlite_forward(table, column):
+    fts = f'{table}_fts'
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({column}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def sqlite_backward(table, column):
+    fts = f'{table}_fts'
+    return [
+        f'DROP TRIGGER IF EXISTS {fts}_ai',
+        f'DROP TRIGGER IF EXISTS {fts}_ad',
+        f'DROP TRIGGER IF EXISTS {fts}_au',
+        f'DROP TABLE IF EXISTS {fts}',
+    ]
+
+
+def postgresql_forward(table, column):
+    return [f"CREATE INDEX {table}_{column}_fts ON {table} USING GIN (to_tsvector('simple', {column}))"]
+
+
+def postgresql_backward(table, column):
+    return [f'DROP INDEX IF EXISTS {table}_{column}_fts']
+
+
+STATEMENTS = {
+    'sqlite': (sqlite_forward, sqlite_backward),
+    'postgresql': (postgresql_forward, postgresql_backward),
+}
+
+
+def run(direction):
+    def apply(apps, schema_editor):
+        builders = STATEMENTS.get(schema_editor.connection.vendor)
+        if builders is None:
+            return
+        for table, column in INDEXED:
+            for sql in builders[direction](table, column):
+                schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0012_alter_user_gifts'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(0), run(1)),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:13
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(child, fk):
+    counts = child.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+# The search index triggers of 0013_full_text_search, as they were created
+# there; a migration must not import another one, which may change later.
+SEARCH_TRIGGERS = (
+    ('quiz_test', 'name'),
+    ('quiz_subjects', 'name'),
+)
+
+
+def restore_full_text_search(apps, schema_editor):
+    # Adding or removing a column with a CHECK constraint makes SQLite rebuild
+    # the table, which drops the triggers that keep its search index in sync.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, column in SEARCH_TRIGGERS:
+        fts = f'{table}_fts'
+        for sql in (
+            f'DROP TRIGGER IF EXISTS {fts}_ai',
+            f'DROP TRIGGER IF EXISTS {fts}_ad',
+            f'DROP TRIGGER IF EXISTS {fts}_au',
+            f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+            f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+            f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+            f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ):
+            schema_editor.execute(sql)
+
+
+def backfill(apps, schema_editor):
+    Subjects, Test, Question = (apps.get_model('quiz', name) for name in ('Subjects', 'Test', 'Question'))
+    Subjects.objects.update(tests_count=count(Test, 'subject'))
+    Test.objects.update(questions_count=count(Question, 'test'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0016_user_balls_indexes'),
+    ]
+
+    operations = [
+        # unapplied last, after the columns are removed again
+        migrations.RunPython(migrations.RunPython.noop, restore_full_text_search),
+        migrations.AddField(
+            model_name='subjects',
+            name='tests_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='questions_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(restore_full_text_search, migrations.RunPython.noop),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
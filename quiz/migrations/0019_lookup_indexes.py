@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0018_jobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['name'], name='shop_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subjects',
+            index=models.Index(fields=['name'], name='subject_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['level', 'balls', 'id'], name='test_level_balls_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['balls', 'id'], name='test_balls_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userconfirmation',
+            index=models.Index(fields=['user', 'code', 'is_confirmed', 'expire_time'], name='confirmation_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userconfirmation',
+            index=models.Index(fields=['expire_time'], name='confirmation_expire_idx'),
+        ),
+    ]
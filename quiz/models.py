@@ -1,6 +1,4 @@
 import datetime
-from datetime import timedelta
-from random import choices
 from time import timezone
 
 from django.contrib.auth.models import AbstractUser
@@ -32,18 +30,21 @@ class User(AbstractUser):
     is_verified = models.BooleanField(default=False)
     # status = models.CharField(max_length=100, choices=UserStatus.choices, default=UserStatus.INACTIVE)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['-balls', 'id'], name='user_balls_idx'),
+            models.Index(fields=['level', '-balls', 'id'], name='user_level_balls_idx'),
+        ]
+
     @property
     def create_verification_code(self):
-        code = "".join(choices("0123456789", k=4))
-        UserConfirmation.objects.create(
-            user_id=self.id,
-            code=code,
-            expire_time=now() + timedelta(minutes=5),
-        )
-        return code
+        from quiz.verification import code_store
+
+        return code_store().issue(self.id)
 
 
 class UserConfirmation(models.Model):
+    """Verification codes of `quiz.verification.DatabaseCodeStore`, or the audit log of the cache store."""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='code')
     code = models.IntegerField()
     expire_time = models.DateTimeField(null=True, blank=True)
@@ -56,6 +57,12 @@ class UserConfirmation(models.Model):
     def __str__(self):
         return f'{self.user.username}: {self.code}'
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'code', 'is_confirmed', 'expire_time'], name='confirmation_lookup_idx'),
+            models.Index(fields=['expire_time'], name='confirmation_expire_idx'),
+        ]
+
 
 class Shop(models.Model):
     name = models.CharField(max_length=100)
@@ -76,13 +83,58 @@ class Shop(models.Model):
             self.is_active = True
         return super().save(*args, **kwargs)
 
-class Subjects(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='shop_name_idx'),
+        ]
+
+class Purchase(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='purchases')
+    item = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='purchases')
+    price = models.IntegerField()
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.user.username}: {self.item.name}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_purchase_idempotency_key')
+        ]
+
+class CountersMixin:
+    """
+    Keep a plain `save()` of an existing row from writing back the counter
+    columns it loaded, which other transactions update in place.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Subjects(CountersMixin, models.Model):
     name = models.CharField(max_length=100)
+    # maintained by quiz.counters
+    tests_count = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ('tests_count', )
 
     def __str__(self):
         return self.name
 
-class Test(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='subject_name_idx'),
+        ]
+
+class Test(CountersMixin, models.Model):
     class LevelChoices(models.TextChoices):
         BEGINNER = 'beginner', 'Beginner'
         INTERMEDIATE = 'intermediate', 'Intermediate'
@@ -92,19 +144,33 @@ class Test(models.Model):
     subject = models.ForeignKey(Subjects, on_delete=models.CASCADE, related_name='tests')
     level = models.CharField(max_length=100, choices=LevelChoices.choices, default=LevelChoices.BEGINNER)
     balls = models.IntegerField(default=0)
+    # maintained by quiz.counters
+    questions_count = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ('questions_count', )
+
+    # balls a new test earns on top of the ones it is created with
+    LEVEL_BALLS = {
+        LevelChoices.BEGINNER: 10,
+        LevelChoices.INTERMEDIATE: 20,
+        LevelChoices.ADVANCED: 30,
+    }
 
     def save(self, *args, **kwargs):
-        if self.level == self.LevelChoices.BEGINNER:
-            self.balls += 10
-        elif self.level == self.LevelChoices.INTERMEDIATE:
-            self.balls += 20
-        elif self.level == self.LevelChoices.ADVANCED:
-            self.balls += 30
+        # only on creation, so that re-saving a test does not inflate its balls
+        if self._state.adding:
+            self.balls += self.LEVEL_BALLS.get(self.level, 0)
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['level', 'balls', 'id'], name='test_level_balls_idx'),
+            models.Index(fields=['balls', 'id'], name='test_balls_idx'),
+        ]
+
 class Question(models.Model):
     about = models.TextField()
     test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='questions')
@@ -125,4 +191,40 @@ class Option(models.Model):
             models.UniqueConstraint(fields=['question', 'is_true'], name='unique_option')
         ]
 
+class Attempt(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attempts')
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='attempts')
+    answers = models.JSONField(default=dict)
+    correct = models.IntegerField()
+    total = models.IntegerField()
+    balls = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.user.username}: {self.test.name} {self.correct}/{self.total}'
+
+class Job(models.Model):
+    """A unit of background work for `quiz.jobs`; failed jobs are retried, then kept as dead letters."""
+    class StatusChoices(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        DEAD = 'dead', 'Dead'
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=StatusChoices.choices, default=StatusChoices.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # when a queued job may run, or when the lease of a running one expires
+    run_after = models.DateTimeField(default=now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
@@ -0,0 +1,203 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import and_, or_
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from quiz.search import RANK_ANNOTATION
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the ordering columns instead of using OFFSET.
+
+    The primary key is always the last ordering column, so every position is
+    unique. Views may allow extra sort keys with `keyset_ordering_fields`; the
+    client picks them with `?ordering=-balls,name`. Full-text search results
+    are ordered by relevance unless the client asks otherwise. The cursor
+    stores the values of every ordering column of the boundary row, so
+    fetching any page is a single indexed range query of `page_size + 1` rows.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.page_queryset(queryset, request, view)])
+
+    def page_queryset(self, queryset, request, view):
+        """Return the (unevaluated) query fetching the requested page plus one row."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request, queryset)
+        self.reverse = self.cursor is not None and self.cursor['reverse']
+        ordering = [(field, not desc) if self.reverse else (field, desc) for field, desc in self.ordering]
+
+        queryset = queryset.order_by(*[f'-{field}' if desc else field for field, desc in ordering])
+        if self.cursor is not None:
+            queryset = queryset.filter(self.seek(ordering, self.cursor['values']))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+
+        self.page = rows
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = self.cursor is not None and (has_more if self.reverse else True)
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        allowed = getattr(view, 'keyset_ordering_fields', ())
+        ordering = []
+        param = request.query_params.get(self.ordering_query_param, '')
+        for term in param.split(','):
+            field = term.strip().lstrip('-')
+            if field in allowed and field not in [f for f, _ in ordering]:
+                ordering.append((field, term.strip().startswith('-')))
+        if not ordering and RANK_ANNOTATION in queryset.query.annotations:
+            ordering.append((RANK_ANNOTATION, False))
+        ordering.append(('pk', False))
+        return ordering
+
+    @staticmethod
+    def seek(ordering, values):
+        # (a, b, pk) > (x, y, z)  ==  a > x OR (a = x AND b > y) OR (a = x AND b = y AND pk > z)
+        branches = []
+        for i, (field, desc) in enumerate(ordering):
+            equal = [Q(**{prev: value}) for (prev, _), value in zip(ordering[:i], values)]
+            lookup = f'{field}__lt' if desc else f'{field}__gt'
+            branches.append(reduce(and_, equal, Q(**{lookup: values[i]})))
+        return reduce(or_, branches)
+
+    @staticmethod
+    def model_field(queryset, field):
+        """The model field (or annotation output field) that `field` orders by."""
+        if field in queryset.query.annotations:
+            return queryset.query.annotations[field].output_field
+        opts = queryset.model._meta
+        return opts.pk if field == 'pk' else opts.get_field(field)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            fields = [field for field, _ in self.ordering]
+            if cursor['fields'] != fields or len(cursor['values']) != len(fields):
+                raise ValueError
+            # the values go into the seek filter, so they must be valid for their
+            # columns here rather than fail as a database error
+            cursor['values'] = [
+                self.model_field(queryset, field).to_python(value)
+                for field, value in zip(fields, cursor['values'])
+            ]
+            if None in cursor['values']:
+                raise ValueError
+            cursor['reverse'] = bool(cursor['reverse'])
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, ValidationError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, row, reverse):
+        cursor = {
+            'fields': [field for field, _ in self.ordering],
+            'values': [self.field_value(row, field) for field, _ in self.ordering],
+            'reverse': reverse,
+        }
+        encoded = urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    @staticmethod
+    def field_value(row, field):
+        if isinstance(row, dict):
+            return row[field]
+        for attr in field.split('__'):
+            row = getattr(row, attr)
+        return row
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results to return per page (at most {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.ordering_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Comma separated sort keys, prefixed with "-" for descending. '
+                               'Allowed: ' + (', '.join(getattr(view, 'keyset_ordering_fields', ())) or 'none') + '.',
+                'schema': {'type': 'string'},
+            },
+        ]
@@ -0,0 +1,86 @@
+import json
+from hashlib import sha256
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from quiz.cache import VersionedKeys
+from quiz.models import User, Shop
+from quiz.pagination import KeysetPagination
+from quiz.serializers import ProfileFieldsSerializer, ShopItemSerializer
+
+# gifts shown in the profile itself; the rest are paged at `/profile/gifts/`
+PROFILE_GIFTS = getattr(settings, 'PROFILE_GIFTS', 20)
+PROFILE_CACHE_TIMEOUT = getattr(settings, 'PROFILE_CACHE_TIMEOUT', 60 * 60)
+
+# the columns the profile shows; saving only other ones keeps it
+PROFILE_FIELDS = set(ProfileFieldsSerializer.Meta.fields)
+
+renderer = JSONRenderer()
+
+# Changes bump a version rather than delete, so a reader that rendered the
+# pre-change rows cannot store them for the next one.
+profiles = VersionedKeys('quiz:profile', PROFILE_CACHE_TIMEOUT)
+gifts = VersionedKeys('quiz:profile:gift', PROFILE_CACHE_TIMEOUT)
+
+
+def render_profile(user_id):
+    """
+    The cached part of a profile: `(fields, gift ids, gift count)`, with the
+    user's own fields pre-rendered as a JSON object. Returns None for an
+    unknown user.
+    """
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return None
+    fields = renderer.render(ProfileFieldsSerializer(user).data)
+    gifts = User.gifts.through.objects.filter(user_id=user_id).order_by('shop_id')
+    ids = list(gifts.values_list('shop_id', flat=True)[:PROFILE_GIFTS + 1])
+    count = len(ids) if len(ids) <= PROFILE_GIFTS else gifts.count()
+    return fields, ids[:PROFILE_GIFTS], count
+
+
+def get_gifts(ids):
+    """The pre-rendered gift items of `ids`, rendering and caching the missing ones in one query."""
+    rendered = gifts.get_many(ids, lambda missing: {
+        item.pk: renderer.render(ShopItemSerializer(item).data)
+        for item in Shop.objects.filter(pk__in=missing)
+    })
+    # an item deleted since the profile was cached is left out
+    return [rendered[item_id] for item_id in ids if item_id in rendered]
+
+
+def get_profile(user_id, gifts_url, refresh=False):
+    """
+    The profile document of a user as `(etag, body)`, or None. It is put
+    together from cached pieces, so an unchanged profile costs no query;
+    `gifts_url` is where the gifts continue when there are more than fit.
+    `refresh` renders the user's part again, e.g. right after a change.
+    """
+    if refresh:
+        profile = render_profile(user_id)
+    else:
+        profile = profiles.get(user_id, lambda: render_profile(user_id))
+    if profile is None:
+        return None
+    fields, ids, count = profile
+    gifts_next = None
+    if count > len(ids):
+        paginator = KeysetPagination()
+        paginator.ordering, paginator.base_url = [('pk', False)], gifts_url
+        gifts_next = paginator.encode_cursor({'pk': ids[-1]}, reverse=False)
+    body = b''.join([
+        fields[:-1],
+        b',"gifts":[', b','.join(get_gifts(ids)), b'],',
+        b'"gifts_count":', str(count).encode(),
+        b',"gifts_next":', json.dumps(gifts_next).encode(), b'}',
+    ])
+    return f'"{sha256(body).hexdigest()[:32]}"', body
+
+
+def invalidate_profile(user_id):
+    profiles.invalidate(user_id)
+
+
+def invalidate_gift(item_id):
+    gifts.invalidate(item_id)
@@ -0,0 +1,91 @@
+import random
+from collections import defaultdict
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+from quiz.cache import VersionedKeys
+from quiz.models import Test, Question, Option
+
+POOL_TIMEOUT = 24 * 60 * 60
+
+pools = VersionedKeys('quiz:question-pool', POOL_TIMEOUT)
+
+
+def pool_ident(subject_id, level):
+    return f'{subject_id}:{level}'
+
+
+def test_pool(test_id):
+    """The (subject id, level) pool the questions of a test belong to, or None."""
+    return Test.objects.filter(pk=test_id).values_list('subject_id', 'level').first()
+
+
+def build_pool(subject_id, level):
+    pool = array('q')
+    pool.extend(
+        Question.objects.filter(test__subject_id=subject_id, test__level=level)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+        .iterator(chunk_size=10_000)
+    )
+    return pool
+
+
+def get_pools(subject_id, levels):
+    """
+    Return the sorted question id arrays of a subject at each of `levels`,
+    building and caching the missing ones. Costs one query per missing pool.
+    """
+    idents = {pool_ident(subject_id, level): level for level in levels}
+    cached = pools.get_many(idents, lambda missing: {
+        ident: build_pool(subject_id, idents[ident]).tobytes() for ident in missing
+    })
+    result = []
+    for level in levels:
+        pool = array('q')
+        pool.frombytes(cached[pool_ident(subject_id, level)])
+        result.append(pool)
+    return result
+
+
+def invalidate_pool(pool_id):
+    """Rebuild the `(subject id, level)` pool on its next use, once the current transaction commits."""
+    if pool_id is not None:
+        pools.invalidate(pool_ident(*pool_id))
+
+
+def draw(subject_id, levels, n, seed):
+    """
+    Pick up to `n` distinct question ids of a subject at `levels`, uniformly,
+    without reading the question table. The same seed gives the same draw
+    for as long as the pools do not change.
+    """
+    pools = get_pools(subject_id, levels)
+    offsets = list(accumulate(len(pool) for pool in pools))
+    total = offsets[-1] if offsets else 0
+    picks = random.Random(seed).sample(range(total), min(n, total))
+    ids = []
+    for index in picks:
+        i = bisect_left(offsets, index + 1)
+        ids.append(pools[i][index - (offsets[i - 1] if i else 0)])
+    return ids
+
+
+def load_questions(ids):
+    """
+    The questions with `ids`, in that order, each with its test id and
+    options, read with two queries whatever the number of questions.
+    """
+    questions = {
+        row['id']: row
+        for row in Question.objects.filter(pk__in=ids).values('id', 'about', 'test')
+    }
+    options = defaultdict(list)
+    rows = Option.objects.filter(question_id__in=ids).order_by('pk').values('id', 'name', 'question_id')
+    for row in rows:
+        options[row.pop('question_id')].append(row)
+    return [
+        {**questions[question_id], 'options': options[question_id]}
+        for question_id in ids if question_id in questions
+    ]
@@ -0,0 +1,144 @@
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# aliases of read-only copies of `default`
+DATABASE_REPLICAS = getattr(settings, 'DATABASE_REPLICAS', [])
+# seconds a replica may trail the primary: a model changed more recently,
+# or a user who wrote more recently, is read from the primary
+REPLICA_LAG = getattr(settings, 'REPLICA_LAG', 5)
+
+# the catalogue; everything else, users and auth included, stays on the primary
+REPLICA_MODELS = {'quiz.subjects', 'quiz.test', 'quiz.question', 'quiz.option', 'quiz.shop'}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def pin_key(user_id):
+    return f'quiz:replicas:pin:{user_id}'
+
+
+def in_transaction(alias=DEFAULT_DB_ALIAS):
+    return connections[alias].in_atomic_block
+
+
+class RequestState:
+    """Where the catalogue reads of one request may go, decided on its first read."""
+
+    def __init__(self, request):
+        self.request = request
+        self.safe = request.method in SAFE_METHODS
+        self.wrote = False
+        self.replica = None
+        self.fresh = None  # label -> may be read from a replica
+
+    def user_id(self):
+        user = getattr(self.request, 'user', None)
+        return user.pk if user is not None and user.is_authenticated else None
+
+    def pinned_user_id(self):
+        """The user to read from the primary for a while, as they just wrote."""
+        return self.user_id() if self.wrote else None
+
+    def replica_for(self, label):
+        if self.fresh is None:
+            self.fresh = self.check()
+        return self.replica if self.fresh.get(label) else None
+
+    def check(self):
+        from quiz.cache import catalogue_cache
+
+        models = {label: apps.get_model(label) for label in REPLICA_MODELS}
+        keys = {label: catalogue_cache.modified_key(model) for label, model in models.items()}
+        user_id = self.user_id()
+        pin = pin_key(user_id) if user_id is not None else None
+        values = cache.get_many([*keys.values(), pin] if pin else list(keys.values()))
+        if pin in values:
+            # this user wrote within the lag
+            return {}
+        self.replica = random.choice(DATABASE_REPLICAS)
+        now = time.time()
+        # a model without a known change time counts as just changed
+        return {label: now - values.get(key, now) >= REPLICA_LAG for label, key in keys.items()}
+
+
+current_state = ContextVar('quiz_replica_state', default=None)
+
+
+class ReplicaMiddleware:
+    """
+    Let the catalogue reads of safe requests go to `DATABASE_REPLICAS`, and
+    pin a user who wrote to the primary for `REPLICA_LAG` seconds so that
+    they read their own writes.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestState(request)
+        token = current_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_state.reset(token)
+        user_id = state.pinned_user_id()
+        if user_id is not None:
+            cache.set(pin_key(user_id), True, REPLICA_LAG)
+        return response
+
+    async def __acall__(self, request):
+        state = RequestState(request)
+        token = current_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_state.reset(token)
+        user_id = state.pinned_user_id()
+        if user_id is not None:
+            await cache.aset(pin_key(user_id), True, REPLICA_LAG)
+        return response
+
+
+class ReplicaRouter:
+    """
+    Reads of `REPLICA_MODELS` made by a safe request outside of a
+    transaction go to a replica, unless the model changed or the user wrote
+    within `REPLICA_LAG` seconds. Everything else, writes and code running
+    outside of a request, uses `default`.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = current_state.get()
+        if not DATABASE_REPLICAS or state is None or not state.safe or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if model._meta.label_lower not in REPLICA_MODELS or in_transaction():
+            return DEFAULT_DB_ALIAS
+        return state.replica_for(model._meta.label_lower) or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = current_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copied from the primary, schema included
+        return db not in DATABASE_REPLICAS
@@ -0,0 +1,103 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from quiz.models import Subjects, Test, Question
+
+# Models with a full-text index, and the column that is indexed.
+SEARCH_FIELDS = {
+    Question: 'about',
+    Test: 'name',
+    Subjects: 'name',
+}
+
+# Name of the annotation holding the relevance of a search hit.
+# Lower is more relevant on every backend, so results sort ascending.
+RANK_ANNOTATION = 'search_rank'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def is_indexed(model, field):
+    return SEARCH_FIELDS.get(model) == field and connection.vendor in ('sqlite', 'postgresql')
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(query))
+
+
+def full_text_search(queryset, field, query):
+    """
+    Filter `queryset` to rows whose `field` matches `query` and annotate them
+    with `search_rank`.
+
+    Uses the FTS5 table on SQLite and the GIN `to_tsvector` index on
+    PostgreSQL. Other backends, and fields without an index, fall back to
+    `icontains`.
+    """
+    model = queryset.model
+    if not is_indexed(model, field):
+        return queryset.filter(**{f'{field}__icontains': query})
+
+    table = model._meta.db_table
+    pk = f'"{table}"."{model._meta.pk.column}"'
+    if connection.vendor == 'sqlite':
+        match = match_expression(query)
+        if not match:
+            return queryset.none()
+        fts = fts_table(model)
+        if RANK_ANNOTATION in queryset.query.annotations:
+            # already joined to the FTS table for an earlier search term
+            return queryset.filter(RawSQL(
+                f'{pk} IN (SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s)',
+                (match, ), output_field=BooleanField(),
+            ))
+        # Join the FTS table so MATCH runs once and `rank` comes with each hit.
+        queryset = queryset.extra(
+            tables=[fts],
+            where=[f'"{fts}".rowid = {pk}', f'"{fts}" MATCH %s'],
+            params=[match],
+        )
+        return queryset.annotate(**{RANK_ANNOTATION: RawSQL(f'"{fts}".rank', (), output_field=FloatField())})
+
+    column = f'"{table}"."{model._meta.get_field(field).column}"'
+    document = f"to_tsvector('simple', {column})"
+    queryset = queryset.filter(RawSQL(
+        f"{document} @@ websearch_to_tsquery('simple', %s)",
+        (query, ), output_field=BooleanField(),
+    ))
+    if RANK_ANNOTATION in queryset.query.annotations:
+        return queryset
+    return queryset.annotate(**{RANK_ANNOTATION: RawSQL(
+        f"-ts_rank({document}, websearch_to_tsquery('simple', %s))",
+        (query, ), output_field=FloatField(),
+    )})
+
+
+def search_filter_method(queryset, name, value):
+    """`method=` callback for django-filter fields backed by a full-text index."""
+    if not value:
+        return queryset
+    return full_text_search(queryset, name, value)
+
+
+class FullTextSearchFilter(SearchFilter):
+    """`?search=` backed by the full-text index of the view's first search field."""
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        query = request.query_params.get(self.search_param, '').strip()
+        if not search_fields or not query:
+            return queryset
+        field = search_fields[0]
+        if not is_indexed(queryset.model, field):
+            return super().filter_queryset(request, queryset, view)
+        return full_text_search(queryset, field, query)
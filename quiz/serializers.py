@@ -1,8 +1,11 @@
+from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from quiz.models import User, Test, Subjects, Question, Shop
+from quiz.authentication import invalidate_cached_user
+from quiz.jobs import enqueue
+from quiz.models import User, Test, Subjects, Question, Shop, Option
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -12,14 +15,20 @@ class RegisterSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'email', 'password']
 
+    def validate_password(self, value):
+        # hashed here, in is_valid(), so the slow hash does not run inside
+        # the transaction of save(), which holds SQLite's write lock
+        return make_password(value)
+
     def create(self, validated_data):
-        user = User.objects.create(
+        user = User(
             username=validated_data['username'],
             email=validated_data.get('email'),
+            password=validated_data['password'],
         )
-        user.set_password(validated_data['password'])
         user.save()
-        user.create_verification_code
+        # issued here, where ConfirmUser will look for it; only the email waits for a worker
+        enqueue('send_verification_code', user_id=user.pk, code=user.create_verification_code)
         return user
 
 class LoginSerializer(serializers.Serializer):
@@ -27,7 +36,8 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
 
 class ConfSerializer(serializers.Serializer):
-    code = serializers.CharField(max_length=4, write_only=True)
+    # ASCII digits only: str.isdigit() also accepts the likes of '²'
+    code = serializers.RegexField(r'^[0-9]{4}$', write_only=True)
 
 class RefreshTokenSerializer(serializers.Serializer):
     refresh = serializers.CharField()
@@ -55,7 +65,7 @@ class TestsSerializer(serializers.ModelSerializer):
     subject = serializers.CharField(source='subject.name', read_only=True)
     class Meta:
         model = Test
-        fields = ('name', 'subject', 'level', 'balls')
+        fields = ('name', 'subject', 'level', 'balls', 'questions_count')
 
 class QuestionsSerializer(serializers.ModelSerializer):
     test = serializers.CharField(source='test.name')
@@ -75,15 +85,66 @@ class QuestionsSerializer(serializers.ModelSerializer):
             for option in object.options.all()
         ]
 
+class BundleOptionSerializer(serializers.ModelSerializer):
+    # no is_true: the answers stay on the server, which grades submissions
+    class Meta:
+        model = Option
+        fields = ('id', 'name')
+
+class BundleQuestionSerializer(serializers.ModelSerializer):
+    options = BundleOptionSerializer(many=True, read_only=True)
+    class Meta:
+        model = Question
+        fields = ('id', 'about', 'options')
+
+class TestBundleSerializer(serializers.ModelSerializer):
+    subject = serializers.CharField(source='subject.name', read_only=True)
+    questions = BundleQuestionSerializer(many=True, read_only=True)
+    class Meta:
+        model = Test
+        fields = ('id', 'name', 'subject', 'level', 'balls', 'questions')
+
+class RandomQuizQuerySerializer(serializers.Serializer):
+    subject = serializers.CharField(help_text="Id or name of the subject.")
+    level = serializers.ChoiceField(choices=Test.LevelChoices.choices, required=False)
+    n = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    seed = serializers.IntegerField(min_value=0, required=False)
+
+class RandomQuestionSerializer(BundleQuestionSerializer):
+    test = serializers.IntegerField(read_only=True)
+    class Meta(BundleQuestionSerializer.Meta):
+        fields = ('id', 'about', 'test', 'options')
+
+class RandomQuizSerializer(serializers.Serializer):
+    seed = serializers.IntegerField()
+    questions = RandomQuestionSerializer(many=True)
+
+class AnswerSerializer(serializers.Serializer):
+    question = serializers.IntegerField()
+    option = serializers.IntegerField()
+
+class SubmitAnswersSerializer(serializers.Serializer):
+    answers = AnswerSerializer(many=True, allow_empty=False)
+
+    def validate_answers(self, answers):
+        questions = [answer['question'] for answer in answers]
+        if len(set(questions)) != len(questions):
+            raise ValidationError("Each question can only be answered once.")
+        return {answer['question']: answer['option'] for answer in answers}
+
 class ShopSerializer(serializers.ModelSerializer):
     class Meta:
         model = Shop
         fields = '__all__'
 
-class BuyItemInShopSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Shop
-        fields = ('name', )
+class BuyItemInShopSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False)
+    name = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        if 'id' not in attrs and 'name' not in attrs:
+            raise ValidationError("Either id or name of the item is required.")
+        return attrs
 
 class ShopItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -103,6 +164,45 @@ class ProfileUserSerializer(serializers.ModelSerializer):
             'level', 'balls', 'gifts', 'is_verified'
         )
 
+    def update(self, instance, validated_data):
+        # `instance` may be a cached, stale request.user: write back only the
+        # fields sent, not e.g. balls awarded since it was loaded
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+class ProfileFieldsSerializer(ProfileUserSerializer):
+    """The user's own fields of the profile, cached apart from the gifts."""
+    gifts = None
+
+    class Meta(ProfileUserSerializer.Meta):
+        fields = tuple(field for field in ProfileUserSerializer.Meta.fields if field != 'gifts')
+
+class ProfileSerializer(ProfileUserSerializer):
+    """The profile document: the first gifts inline, the rest paged at `gifts_next`."""
+    gifts_count = serializers.IntegerField(read_only=True)
+    gifts_next = serializers.URLField(read_only=True, allow_null=True)
+
+    class Meta(ProfileUserSerializer.Meta):
+        fields = ProfileUserSerializer.Meta.fields + ('gifts_count', 'gifts_next')
+
+class LeaderboardQuerySerializer(serializers.Serializer):
+    level = serializers.ChoiceField(choices=User.LevelChoices.choices, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+class LeaderboardEntrySerializer(serializers.Serializer):
+    rank = serializers.IntegerField()
+    id = serializers.IntegerField()
+    username = serializers.CharField()
+    level = serializers.CharField()
+    balls = serializers.IntegerField()
+
+class LeaderboardRankSerializer(serializers.Serializer):
+    rank = serializers.IntegerField()
+    balls = serializers.IntegerField()
+    total = serializers.IntegerField()
+
 class ChangePasswordSerializer(serializers.ModelSerializer):
     current_password = serializers.CharField(write_only=True)
     new_password = serializers.CharField(write_only=True)
@@ -128,5 +228,7 @@ class ChangePasswordSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         new_password = self.validated_data['new_password']
         user.set_password(new_password)
-        user.save()
+        # request.user may be stale, so only the password is written
+        user.save(update_fields=['password'])
+        invalidate_cached_user(user.pk)
         return user
\ No newline at end of file
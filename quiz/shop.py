@@ -0,0 +1,104 @@
+from math import ceil
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+
+from quiz.authentication import invalidate_cached_user
+from quiz.cache import catalogue_cache
+from quiz.leaderboard import record_balls_delta
+from quiz.models import User, Shop, Purchase
+from quiz.profiles import invalidate_gift, invalidate_profile
+
+
+class PurchaseError(Exception):
+    message = 'Purchase failed.'
+
+
+class ItemNotFound(PurchaseError):
+    message = 'Item not found.'
+
+
+class OutOfStock(PurchaseError):
+    message = 'Item is out of stock.'
+
+
+class NotEnoughBalls(PurchaseError):
+    message = 'Not enough balls to buy the item.'
+
+
+class InvalidIdempotencyKey(PurchaseError):
+    message = 'Idempotency-Key is too long.'
+
+
+class IdempotencyKeyReused(PurchaseError):
+    message = 'Idempotency-Key was already used to buy another item.'
+
+
+IDEMPOTENCY_KEY_MAX_LENGTH = Purchase._meta.get_field('idempotency_key').max_length
+
+
+def item_cost(price):
+    # balls are whole numbers; a fractional price rounds up
+    return ceil(price)
+
+
+def replay(existing, item_id):
+    """The result of a repeated purchase: `existing`, if it was of the same item."""
+    if existing.item_id != item_id:
+        raise IdempotencyKeyReused
+    return existing, False
+
+
+def purchase(user, item_id, idempotency_key=None):
+    """
+    Buy one unit of a shop item for `user`. Returns `(purchase, created)`.
+
+    The balance and the stock are changed with conditional single-statement
+    updates (`balls >= cost`, `amount > 0`), so concurrent buyers can neither
+    overdraw an account nor oversell an item, and no row is read and written
+    back. Repeating a call with the same `idempotency_key` returns the first
+    purchase without charging again; reusing it for another item raises
+    `IdempotencyKeyReused`.
+    """
+    if idempotency_key and len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        # refused up front; the column would not hold it
+        raise InvalidIdempotencyKey
+    if idempotency_key:
+        existing = Purchase.objects.filter(user=user, idempotency_key=idempotency_key).first()
+        if existing is not None:
+            return replay(existing, item_id)
+
+    price = Shop.objects.filter(pk=item_id).values_list('price', flat=True).first()
+    if price is None:
+        raise ItemNotFound
+    cost = item_cost(price)
+
+    try:
+        with transaction.atomic():
+            # The item row is the one every buyer contends on, so it is
+            # updated last to hold its lock for the shortest time.
+            if not User.objects.filter(pk=user.pk, balls__gte=cost).update(balls=F('balls') - cost):
+                raise NotEnoughBalls
+            record_balls_delta(user.pk, -cost)
+            stock = Shop.objects.filter(pk=item_id, amount__gt=0).update(
+                amount=F('amount') - 1,
+                is_active=Case(When(amount__gt=1, then=Value(True)), default=Value(False)),
+            )
+            if not stock:
+                raise OutOfStock
+            created = Purchase.objects.create(
+                user=user, item_id=item_id, price=cost, idempotency_key=idempotency_key or None,
+            )
+            user.gifts.add(item_id)
+    except IntegrityError:
+        # a concurrent retry with the same key won the race
+        if not idempotency_key:
+            raise
+        return replay(Purchase.objects.get(user=user, idempotency_key=idempotency_key), item_id)
+
+    catalogue_cache.bump_on_commit(Shop)
+    transaction.on_commit(lambda: invalidate_cached_user(user.pk))
+    # the balance changed, and the stock of the item by an update that sends no signal
+    invalidate_profile(user.pk)
+    invalidate_gift(item_id)
+    return created, True
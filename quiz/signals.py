@@ -0,0 +1,217 @@
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, pre_delete, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from quiz.answer_keys import invalidate_answer_key
+from quiz.authentication import invalidate_cached_user
+from quiz.bundles import invalidate_test_bundle
+from quiz import counters
+from quiz.cache import catalogue_cache
+from quiz.leaderboard import record_change
+from quiz.models import User, Subjects, Test, Question, Option, Shop
+from quiz.profiles import PROFILE_FIELDS, invalidate_gift, invalidate_profile
+from quiz.question_pools import test_pool, invalidate_pool
+
+
+def option_test_id(**lookup):
+    return Question.objects.filter(**lookup).values_list('test_id', flat=True).first()
+
+
+def cascaded(instance, origin):
+    """
+    True if `instance` is deleted in the cascade from another model's rows,
+    whose own delete receivers cover it once for all of its rows. Receivers
+    skip their per-row work there, which would cost queries per row.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin is not None and model._meta.concrete_model is not instance._meta.concrete_model
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def profile_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or PROFILE_FIELDS & set(update_fields):
+        invalidate_profile(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.gifts.through)
+def gifts_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_profile(instance.pk)
+        return
+    # the holders of a shop item changed
+    if action == 'pre_clear':
+        pk_set = User.gifts.through.objects.filter(shop_id=instance.pk).values_list('user_id', flat=True)
+    for user_id in pk_set:
+        invalidate_profile(user_id)
+
+
+@receiver([post_save, post_delete], sender=Shop)
+def gift_changed(sender, instance, **kwargs):
+    invalidate_gift(instance.pk)
+
+
+@receiver(pre_delete, sender=Shop)
+def gift_deleting(sender, instance, **kwargs):
+    # the cascade takes the item from its holders without an m2m signal
+    for user_id in User.gifts.through.objects.filter(shop_id=instance.pk).values_list('user_id', flat=True):
+        invalidate_profile(user_id)
+
+
+LEADERBOARD_FIELDS = {'level', 'balls'}
+
+
+@receiver(pre_save, sender=User)
+def user_score_changing(sender, instance, update_fields=None, **kwargs):
+    instance._previous_score = None
+    if instance.pk is not None and (update_fields is None or LEADERBOARD_FIELDS & set(update_fields)):
+        instance._previous_score = User.objects.filter(pk=instance.pk).values_list('level', 'balls').first()
+
+
+@receiver(post_save, sender=User)
+def user_score_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        record_change(None, (instance.level, instance.balls))
+    elif getattr(instance, '_previous_score', None) is not None:
+        # a partial save keeps the stored value of the fields it left out
+        level, balls = instance._previous_score
+        if update_fields is None or 'level' in update_fields:
+            level = instance.level
+        if update_fields is None or 'balls' in update_fields:
+            balls = instance.balls
+        record_change(instance._previous_score, (level, balls))
+
+
+@receiver(post_delete, sender=User)
+def user_score_deleted(sender, instance, **kwargs):
+    record_change((instance.level, instance.balls), None)
+
+
+@receiver([post_save, post_delete], sender=Subjects)
+@receiver([post_save, post_delete], sender=Shop)
+@receiver([post_save, post_delete], sender=Question)
+@receiver([post_save, post_delete], sender=Option)
+def catalogue_changed(sender, instance, origin=None, **kwargs):
+    if not cascaded(instance, origin):
+        catalogue_cache.bump_on_commit(sender)
+
+
+@receiver(post_save, sender=Subjects)
+def subject_renamed(sender, instance, **kwargs):
+    # bundles embed the subject name
+    for test_id in instance.tests.values_list('pk', flat=True):
+        invalidate_test_bundle(test_id)
+
+
+@receiver([post_save, post_delete], sender=Test)
+def test_changed(sender, instance, **kwargs):
+    catalogue_cache.bump_on_commit(sender)
+    invalidate_test_bundle(instance.pk)
+
+
+@receiver(pre_delete, sender=Test)
+def test_deleting(sender, instance, origin=None, **kwargs):
+    # once for the test and the questions and options deleted with it
+    invalidate_answer_key(instance.pk)
+    invalidate_pool((instance.subject_id, instance.level))
+    catalogue_cache.bump_on_commit(Question)
+    catalogue_cache.bump_on_commit(Option)
+    if not cascaded(instance, origin):
+        counters.add(Subjects, 'tests_count', instance.subject_id, -1)
+
+
+@receiver(pre_save, sender=Test)
+def test_moving(sender, instance, **kwargs):
+    instance._previous_subject_id = None
+    if instance.pk is not None:
+        previous = test_pool(instance.pk)
+        if previous is None:
+            return
+        subject_id, level = previous
+        if subject_id != instance.subject_id:
+            instance._previous_subject_id = subject_id
+        if previous != (instance.subject_id, instance.level):
+            # the questions of the test change pools all at once
+            invalidate_pool(previous)
+            invalidate_pool((instance.subject_id, instance.level))
+
+
+@receiver(post_save, sender=Test)
+def test_counted(sender, instance, created, **kwargs):
+    if created or getattr(instance, '_previous_subject_id', None) is not None:
+        counters.add(Subjects, 'tests_count', instance.subject_id, 1)
+        counters.add(Subjects, 'tests_count', getattr(instance, '_previous_subject_id', None), -1)
+
+
+@receiver(pre_save, sender=Question)
+def question_moving(sender, instance, **kwargs):
+    # the question may be moving to another test; the old test changes too
+    instance._previous_test_id = None
+    if instance.pk is not None:
+        test_id = Question.objects.filter(pk=instance.pk).values_list('test_id', flat=True).first()
+        if test_id is not None and test_id != instance.test_id:
+            instance._previous_test_id = test_id
+            invalidate_test_bundle(test_id)
+            invalidate_answer_key(test_id)
+            invalidate_pool(test_pool(test_id))
+
+
+@receiver(post_save, sender=Question)
+def question_saved(sender, instance, created, **kwargs):
+    invalidate_test_bundle(instance.test_id)
+    if created:
+        invalidate_answer_key(instance.test_id)
+        invalidate_pool(test_pool(instance.test_id))
+        counters.add(Test, 'questions_count', instance.test_id, 1)
+    elif getattr(instance, '_previous_test_id', None) is not None:
+        invalidate_answer_key(instance.test_id)
+        invalidate_pool(test_pool(instance.test_id))
+        counters.add(Test, 'questions_count', instance.test_id, 1)
+        counters.add(Test, 'questions_count', instance._previous_test_id, -1)
+
+
+@receiver(pre_delete, sender=Question)
+def question_deleting(sender, instance, origin=None, **kwargs):
+    # once for the question and its options; nothing when its test goes too
+    if cascaded(instance, origin):
+        return
+    invalidate_test_bundle(instance.test_id)
+    invalidate_answer_key(instance.test_id)
+    invalidate_pool(test_pool(instance.test_id))
+    catalogue_cache.bump_on_commit(Option)
+    counters.add(Test, 'questions_count', instance.test_id, -1)
+
+
+@receiver(pre_save, sender=Option)
+def option_moving(sender, instance, **kwargs):
+    if instance.pk is not None:
+        previous = Option.objects.filter(pk=instance.pk).values('question_id', 'is_true', 'question__test_id').first()
+        if previous is not None:
+            invalidate_test_bundle(previous['question__test_id'])
+            if previous['is_true']:
+                invalidate_answer_key(previous['question__test_id'])
+
+
+@receiver(post_save, sender=Option)
+def option_saved(sender, instance, **kwargs):
+    test_id = option_test_id(pk=instance.question_id)
+    if test_id is not None:
+        invalidate_test_bundle(test_id)
+        if instance.is_true:
+            invalidate_answer_key(test_id)
+
+
+@receiver(post_delete, sender=Option)
+def option_deleted(sender, instance, origin=None, **kwargs):
+    if cascaded(instance, origin):
+        return
+    test_id = option_test_id(pk=instance.question_id)
+    if test_id is not None:
+        invalidate_test_bundle(test_id)
+        invalidate_answer_key(test_id)
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.mail import send_mail
+
+from quiz.jobs import job
+from quiz.models import User
+
+
+@job()
+def send_verification_code(user_id, code):
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None and user.email:
+        send_mail(
+            'Your verification code',
+            f'Your verification code is {code}.',
+            settings.DEFAULT_FROM_EMAIL,
+            [user.email],
+        )
+
+
+@job()
+def send_account_verified(user_id):
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None and user.email:
+        send_mail(
+            'Your account is verified',
+            f'Hello {user.username}, your account is verified.',
+            settings.DEFAULT_FROM_EMAIL,
+            [user.email],
+        )
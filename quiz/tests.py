@@ -1,3 +1,1615 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from base64 import urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import timedelta
+from io import StringIO
+from itertools import combinations
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection, router, transaction
+from django.http import HttpResponse
+from django.utils.timezone import now
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from quiz.answer_keys import answer_keys, build_answer_key, get_answer_key
+from quiz.authentication import user_cache
+from quiz.benchmarks import LOAD_PASSWORD, compare, credentials, load_routes, seed_dataset
+from quiz.bundles import bundles, render_test_bundle
+from quiz.cache import catalogue_cache
+from quiz.checks import check_shared_cache
+from quiz.compression import ENCODERS, negotiate
+from quiz import jobs
+from quiz.leaderboard import MAX_AGE, current_sequence, leaderboard
+from quiz.metrics import Histogram, MetricsMiddleware, registry
+from quiz.models import User, Subjects, Test, Question, Option, Shop, Purchase, Attempt, UserConfirmation, Job
+from quiz.management.commands.sync_replicas import sync
+from quiz.profiles import profiles, render_profile
+from quiz.question_pools import build_pool, get_pools, pool_ident, pools
+from quiz.routers import ReplicaMiddleware, pin_key
+from quiz.throttling import TokenBucket, local_buckets
+from quiz.verification import AuditLog, CacheCodeStore, audit_log, code_store
+from quiz.views import SubjectsAPIView, TestsAPIView, QuestionsAPIView, ShopGetItemsAPIView
+
+# Row counts the query-count suite is run at. The default keeps the run short;
+# set e.g. QUIZ_QUERY_COUNT_SCALES=10,100000 to check the full range.
+QUERY_COUNT_SCALES = [
+    int(n) for n in os.environ.get('QUIZ_QUERY_COUNT_SCALES', '10,500').split(',')
+]
+
+
+def seed_catalogue(rows):
+    """Bulk-create `rows` subjects, tests, questions (2 options each) and shop items."""
+    subjects = Subjects.objects.bulk_create(
+        Subjects(name=f'subject {i}') for i in range(rows)
+    )
+    tests = Test.objects.bulk_create(
+        Test(name=f'test {i}', subject=subjects[i], level=Test.LevelChoices.BEGINNER, balls=10)
+        for i in range(rows)
+    )
+    questions = Question.objects.bulk_create(
+        Question(about=f'question {i}', test=tests[i]) for i in range(rows)
+    )
+    Option.objects.bulk_create(
+        Option(name=f'option {i}{j}', question=question, is_true=(j == 0))
+        for i, question in enumerate(questions) for j in range(2)
+    )
+    Shop.objects.bulk_create(
+        Shop(name=f'item {i}', about='about', amount=10, is_active=True, price=5)
+        for i in range(rows)
+    )
+
+
+def first_ids():
+    """URL prefix of every detail view -> pk of the first row it can show."""
+    return {
+        'subjects': Subjects.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'tests': Test.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'questions': Question.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'shop/item': Shop.objects.order_by('pk').values_list('pk', flat=True).first(),
+    }
+
+
+# A cache of the tests' own, so clearing it never touches the configured one.
+# Its add() and incr() hold a lock, so they are atomic within the test process.
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'quiz-tests'}}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QuizAPITestCase(APITestCase):
+    def setUp(self):
+        self.clear_caches()
+        # password hashing alone makes some requests "slow"; test_slow_request_log lowers it
+        patcher = mock.patch('quiz.metrics.METRICS_SLOW_REQUEST_MS', float('inf'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='john', password='1111')
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def clear_caches():
+        cache.clear()
+        catalogue_cache.clear()
+        user_cache.clear()
+        leaderboard.clear()
+        local_buckets.clear()
+        registry.clear()
+
+
+class QueryCountTests(QuizAPITestCase):
+    list_urls = ('/subjects/', '/tests/', '/questions/', '/shop/')
+
+    def count_queries(self, url):
+        self.clear_caches()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(ctx.captured_queries)
+
+    def measure(self):
+        counts = {url: self.count_queries(url) for url in self.list_urls}
+        for prefix, pk in first_ids().items():
+            url = f'/{prefix}/{pk}/'
+            counts[url.replace(str(pk), '<pk>')] = self.count_queries(url)
+        counts['/tests/<pk>/bundle/'] = self.count_queries(f'/tests/{first_ids()["tests"]}/bundle/')
+        self.user.gifts.set(Shop.objects.all()[:10])
+        counts['/profile/'] = self.count_queries('/profile/')
+        return counts
+
+    def test_query_count_is_independent_of_row_count(self):
+        seeded = 0
+        baseline = None
+        for rows in QUERY_COUNT_SCALES:
+            seed_catalogue(rows - seeded)
+            seeded = rows
+            counts = self.measure()
+            if baseline is None:
+                baseline = counts
+                continue
+            for url, count in counts.items():
+                self.assertEqual(count, baseline[url], f'{url} at {rows} rows')
+
+    def test_questions_list_is_eager_loaded(self):
+        seed_catalogue(20)
+        # one query each for the questions (joined with their test) and the options
+        self.assertEqual(self.count_queries('/questions/'), 2)
+        self.assertEqual(self.count_queries('/tests/'), 1)
+
+
+class KeysetPaginationTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        seed_catalogue(45)
+
+    def walk(self, url):
+        names, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            names += [row['name'] for row in response.data['results']]
+            url = response.data['next']
+            pages += 1
+        return names, pages
+
+    def test_walks_every_row_once(self):
+        names, pages = self.walk('/tests/?page_size=10')
+        self.assertEqual(pages, 5)
+        self.assertEqual(names, list(Test.objects.order_by('pk').values_list('name', flat=True)))
+
+    def test_secondary_sort_keys(self):
+        Shop.objects.filter(pk__in=Shop.objects.order_by('pk')[:20].values('pk')).update(price=1)
+        names, _ = self.walk('/shop/?page_size=7&ordering=-price,name')
+        expected = list(Shop.objects.order_by('-price', 'name', 'pk').values_list('name', flat=True))
+        self.assertEqual(names, expected)
+
+    def test_previous_link_returns_the_same_page(self):
+        first = self.client.get('/subjects/?page_size=10').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(back['results'], first['results'])
+
+    def test_page_size_is_capped(self):
+        seed_catalogue(100)
+        response = self.client.get('/questions/?page_size=1000')
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/subjects/?cursor=garbage').status_code, 404)
+        next_url = self.client.get('/shop/?page_size=5&ordering=price').data['next']
+        cursor = parse_qs(urlparse(next_url).query)['cursor'][0]
+        # a cursor is only valid for the ordering it was issued for
+        self.assertEqual(self.client.get(f'/shop/?cursor={cursor}').status_code, 404)
+        # values that do not fit their columns
+        for values in (['x', 'abc'], [1.5, [1]], [None, 1], [{'a': 1}, 1]):
+            forged = urlsafe_b64encode(json.dumps(
+                {'fields': ['price', 'pk'], 'values': values, 'reverse': False}).encode()).decode()
+            self.assertEqual(self.client.get(f'/shop/?ordering=price&cursor={forged}').status_code, 404)
+
+
+def filter_combinations(values):
+    """Every non-empty subset of the query parameters in `values`."""
+    return [
+        {name: values[name] for name in names}
+        for size in range(1, len(values) + 1) for names in combinations(values, size)
+    ]
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+class QueryPlanTests(QuizAPITestCase):
+    """
+    Every filter the API exposes has to be served by an index. A substring
+    match on the name of a related row (`subject`, `test`) may scan that
+    related table in its subquery, never the table being listed.
+    """
+    # filter -> the related table its substring match may scan
+    name_substring_filters = {'subject': 'quiz_subjects', 'test': 'quiz_test'}
+
+    def setUp(self):
+        super().setUp()
+        seed_catalogue(50)
+
+    def full_scans(self, run, params=()):
+        with CaptureQueriesContext(connection) as ctx:
+            run()
+        allowed = {self.name_substring_filters[param] for param in params if param in self.name_substring_filters}
+        scans = []
+        for query in ctx.captured_queries:
+            if not query['sql'].startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            # the plan names a table by its alias, e.g. `"quiz_test" U0` in a subquery
+            aliases = dict((alias, table) for table, alias in re.findall(r'"(\w+)" (U\d+)\b', query['sql']))
+            for step in plan:
+                if not step.startswith('SCAN ') or 'VIRTUAL TABLE' in step:
+                    continue
+                name = step.split()[1]
+                if aliases.get(name, name) in allowed:
+                    continue
+                scans.append(f'{step}: {query["sql"]}')
+        return scans
+
+    def assertFiltersUseIndexes(self, url, values, required=None):
+        for params in filter_combinations(values):
+            params = {**(required or {}), **params}
+            with self.subTest(url=url, **params):
+                self.clear_caches()
+                response = []
+                self.assertEqual(self.full_scans(lambda: response.append(self.client.get(url, params)), params), [])
+                self.assertEqual(response[0].status_code, 200)
+
+    def test_tests_filters(self):
+        self.assertFiltersUseIndexes('/tests/', {'level': 'begin', 'subject': 'subject', 'balls': 20, 'name': 'test'})
+        self.assertFiltersUseIndexes('/tests/', {'level': 'advanced', 'search': 'test'})
+
+    def test_questions_filters(self):
+        self.assertFiltersUseIndexes('/questions/', {
+            'test_level': 'begin', 'test': 'test', 'test_balls': 20, 'about': 'question',
+        })
+        self.assertFiltersUseIndexes('/questions/', {'test_level': 'advanced', 'search': 'question'})
+
+    def test_subjects_and_random_quiz(self):
+        self.assertFiltersUseIndexes('/subjects/', {'name': 'subject', 'search': 'subject'})
+        self.assertFiltersUseIndexes('/quiz/random/', {'level': 'beginner', 'n': 5}, required={'subject': 'subject 1'})
+
+    def test_lookups(self):
+        item = Shop.objects.first()
+        self.user.balls = 100
+        self.user.save()
+        self.assertEqual(self.full_scans(lambda: self.client.post('/shop/buy/', {'name': item.name})), [])
+        with override_settings(VERIFICATION_CODE_STORE='quiz.verification.DatabaseCodeStore'):
+            code = self.user.create_verification_code
+            self.assertEqual(self.full_scans(lambda: self.client.post('/confirm-user/', {'code': code})), [])
+        self.assertEqual(self.full_scans(lambda: call_command('purge_verification_codes', stdout=StringIO())), [])
+
+
+class FullTextSearchTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        subject = Subjects.objects.create(name='Mathematics')
+        self.test = Test.objects.create(name='Algebra basics', subject=subject)
+        self.questions = Question.objects.bulk_create([
+            Question(about='What is a prime number?', test=self.test),
+            Question(about='Is 7 a prime? Prime numbers have two divisors, prime.', test=self.test),
+            Question(about='Solve the linear equation', test=self.test),
+        ])
+
+    def abouts(self, url):
+        return [row['about'] for row in self.client.get(url).data['results']]
+
+    def test_filter_and_search_parameters_use_the_index(self):
+        self.assertEqual(len(self.abouts('/questions/?about=prime')), 2)
+        self.assertEqual(len(self.abouts('/questions/?search=prim')), 2)
+        self.assertEqual(self.abouts('/questions/?about=linear equation'), ['Solve the linear equation'])
+        self.assertEqual(self.abouts('/questions/?search="*'), [])
+        response = self.client.get('/tests/?name=algebra')
+        self.assertEqual([row['name'] for row in response.data['results']], ['Algebra basics'])
+        response = self.client.get('/subjects/?search=math')
+        self.assertEqual([row['name'] for row in response.data['results']], ['Mathematics'])
+
+    def test_results_are_ordered_by_relevance(self):
+        self.assertEqual(self.abouts('/questions/?search=prime')[0], self.questions[1].about)
+        abouts = self.abouts('/questions/?search=prime&ordering=test_id')
+        self.assertEqual(abouts[0], self.questions[0].about)
+
+    def test_relevance_ordering_paginates(self):
+        first = self.client.get('/questions/?search=prime&page_size=1').data
+        second = self.client.get(first['next']).data
+        self.assertEqual(
+            [first['results'][0]['about'], second['results'][0]['about']],
+            [self.questions[1].about, self.questions[0].about],
+        )
+        self.assertIsNone(second['next'])
+
+    def test_index_follows_updates_and_deletes(self):
+        question = self.questions[2]
+        question.about = 'Factor the polynomial'
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+        self.assertEqual(self.abouts('/questions/?search=linear'), [])
+        self.assertEqual(self.abouts('/questions/?search=polynomial'), ['Factor the polynomial'])
+        with self.captureOnCommitCallbacks(execute=True):
+            question.delete()
+        self.assertEqual(self.abouts('/questions/?search=polynomial'), [])
+
+
+class TestBundleTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        seed_catalogue(3)
+        self.test = Test.objects.order_by('pk').first()
+        self.url = f'/tests/{self.test.pk}/bundle/'
+
+    def test_bundle_contains_questions_and_options(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        bundle = response.json()
+        self.assertEqual(bundle['name'], self.test.name)
+        self.assertEqual(len(bundle['questions']), 1)
+        self.assertEqual(len(bundle['questions'][0]['options']), 2)
+        # the answers are not given away
+        self.assertEqual(set(bundle['questions'][0]['options'][0]), {'id', 'name'})
+        self.assertEqual(self.client.get('/tests/999999/bundle/').status_code, 404)
+
+    def test_repeated_fetch_is_served_from_cache_and_revalidates(self):
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_changes_invalidate_the_bundle(self):
+        etag = self.client.get(self.url)['ETag']
+        option = Option.objects.filter(question__test=self.test).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            option.name = 'renamed'
+            option.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('renamed', response.content.decode())
+
+        etag = response['ETag']
+        question = self.test.questions.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            question.test = Test.objects.exclude(pk=self.test.pk).first()
+            question.save()
+        self.assertEqual(self.client.get(self.url).json()['questions'], [])
+
+    def test_late_reader_cannot_restore_a_stale_bundle(self):
+        # a reader that rendered before a change commits stores it afterwards
+        key, stale = bundles.keys([self.test.pk])[self.test.pk], render_test_bundle(self.test.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test.name = 'renamed'
+            self.test.save()
+        cache.set(key, stale, None)
+        self.assertEqual(self.client.get(self.url).json()['name'], 'renamed')
+
+
+class CatalogueCacheTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        seed_catalogue(3)
+
+    def test_repeated_reads_skip_the_database(self):
+        pk = Shop.objects.values_list('pk', flat=True).first()
+        for url in ('/subjects/', '/tests/', '/shop/', f'/shop/item/{pk}/'):
+            first = self.client.get(url).data
+            with CaptureQueriesContext(connection) as ctx:
+                second = self.client.get(url).data
+            self.assertEqual(len(ctx.captured_queries), 0, url)
+            self.assertEqual(first, second)
+
+    def test_saves_bump_the_model_version(self):
+        self.client.get('/tests/')
+        subject = Subjects.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            subject.name = 'renamed'
+            subject.save()
+        subjects = [row['subject'] for row in self.client.get('/tests/').data['results']]
+        self.assertIn('renamed', subjects)
+
+        self.client.get('/shop/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Shop.objects.first().delete()
+        self.assertEqual(len(self.client.get('/shop/').data['results']), 2)
+
+    def test_local_tier_is_bounded(self):
+        local = catalogue_cache.local
+        maxsize, local.maxsize = local.maxsize, 2
+        self.addCleanup(setattr, local, 'maxsize', maxsize)
+        evictions = local.evictions
+        for url in ('/subjects/', '/tests/', '/shop/'):
+            self.client.get(url)
+        self.assertEqual(len(local), 2)
+        self.assertEqual(local.evictions, evictions + 1)
+
+    def test_stats_are_admin_only(self):
+        self.assertEqual(self.client.get('/cache/stats/').status_code, 403)
+        self.client.force_authenticate(User.objects.create_superuser(username='admin', password='1111'))
+        self.assertIn('local_evictions', self.client.get('/cache/stats/').data)
+
+    def test_caches_without_atomic_counters_are_refused(self):
+        for backend, errors in (
+            ('redis.RedisCache', []),
+            ('locmem.LocMemCache', ['quiz.E001']),
+            ('filebased.FileBasedCache', ['quiz.E001']),
+            ('db.DatabaseCache', ['quiz.E001']),
+        ):
+            caches_setting = {'default': {'BACKEND': f'django.core.cache.backends.{backend}', 'LOCATION': 'localhost'}}
+            with self.subTest(backend=backend), override_settings(CACHES=caches_setting):
+                self.assertEqual([error.id for error in check_shared_cache(None)], errors)
+
+
+class ShopPurchaseTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        User.objects.filter(pk=self.user.pk).update(balls=20)
+        self.item = Shop.objects.create(name='sticker', about='about', amount=2, price=7.5)
+
+    def buy(self, key=None, **data):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post('/shop/buy/', data or {'id': self.item.pk}, **headers)
+
+    def test_purchase_updates_balance_stock_and_gifts(self):
+        response = self.buy()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['price'], 8)
+        self.user.refresh_from_db()
+        self.item.refresh_from_db()
+        self.assertEqual(self.user.balls, 12)
+        self.assertEqual(self.item.amount, 1)
+        self.assertEqual(list(self.user.gifts.all()), [self.item])
+
+    def test_stock_and_balance_are_checked(self):
+        self.assertEqual(self.buy().status_code, 200)
+        self.assertEqual(self.buy().status_code, 200)
+        self.assertEqual(self.buy().data['error'], 'Not enough balls to buy the item.')
+        User.objects.filter(pk=self.user.pk).update(balls=100)
+        self.assertEqual(self.buy().data['error'], 'Item is out of stock.')
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.amount, self.item.is_active), (0, False))
+        # the failed purchase was rolled back
+        self.assertEqual(User.objects.get(pk=self.user.pk).balls, 100)
+
+    def test_retry_with_idempotency_key_is_a_no_op(self):
+        first = self.buy(key='abc')
+        second = self.buy(key='abc')
+        self.assertEqual(first.data['purchase'], second.data['purchase'])
+        self.assertEqual(Purchase.objects.count(), 1)
+        self.assertEqual(User.objects.get(pk=self.user.pk).balls, 12)
+
+    def test_idempotency_key_reused_for_another_item_is_refused(self):
+        other = Shop.objects.create(name='badge', about='about', amount=2, price=3)
+        self.assertEqual(self.buy(key='abc').status_code, 200)
+        response = self.buy(key='abc', id=other.pk)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.data['error'], 'Idempotency-Key was already used to buy another item.')
+        self.assertEqual(Purchase.objects.get().item_id, self.item.pk)
+
+    def test_overlong_idempotency_key_is_refused(self):
+        response = self.buy(key='k' * 101)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Idempotency-Key is too long.')
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(User.objects.get(pk=self.user.pk).balls, 20)
+        self.assertEqual(self.buy(key='k' * 100).status_code, 200)
+
+    def test_lookup_by_name_and_missing_item(self):
+        self.assertEqual(self.buy(name='sticker').status_code, 200)
+        self.assertEqual(self.buy(name='nothing').status_code, 404)
+        self.assertEqual(self.buy(id=999999).status_code, 404)
+
+
+class RandomQuizTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.subject = Subjects.objects.create(name='math')
+        self.tests = {
+            level: Test.objects.create(name=level, subject=self.subject, level=level)
+            for level in Test.LevelChoices.values
+        }
+        for level, test in self.tests.items():
+            questions = Question.objects.bulk_create(
+                Question(about=f'{level} {i}', test=test) for i in range(20)
+            )
+            Option.objects.bulk_create(
+                Option(name=f'option {j}', question=question, is_true=(j == 0))
+                for question in questions for j in range(2)
+            )
+
+    def draw(self, **params):
+        return self.client.get('/quiz/random/', {'subject': self.subject.pk, **params})
+
+    def assertPoolIsFresh(self, test):
+        pool, = get_pools(test.subject_id, [test.level])
+        self.assertEqual(list(pool), list(build_pool(test.subject_id, test.level)))
+
+    def test_draw(self):
+        response = self.draw(level='advanced', n=5)
+        self.assertEqual(response.status_code, 200)
+        questions = response.data['questions']
+        self.assertEqual(len({question['id'] for question in questions}), 5)
+        self.assertTrue(all(question['test'] == self.tests['advanced'].pk for question in questions))
+        self.assertTrue(all(len(question['options']) == 2 for question in questions))
+        self.assertEqual(len(self.draw(n=100).data['questions']), 60)
+        self.assertEqual(self.draw(subject='math', n=3).status_code, 200)
+        self.assertEqual(self.draw(subject='history').status_code, 404)
+        self.assertEqual(self.draw(n=101).status_code, 400)
+
+    def test_seed_repeats_the_draw(self):
+        first = self.draw(n=10).data
+        self.assertEqual(self.draw(n=10, seed=first['seed']).data, first)
+        self.assertNotEqual(self.draw(n=10, seed=first['seed'] + 1).data['questions'], first['questions'])
+
+    def test_query_count_is_bounded(self):
+        self.draw(n=1)
+        for n in (1, 50):
+            # subject, questions and options; the pools come from the cache
+            with self.assertNumQueries(3):
+                self.assertEqual(len(self.draw(n=n).data['questions']), n)
+
+    def test_late_reader_cannot_restore_a_stale_pool(self):
+        beginner = self.tests['beginner']
+        key = pools.keys([pool_ident(self.subject.pk, beginner.level)]).popitem()[1]
+        stale = build_pool(self.subject.pk, beginner.level)
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.create(about='added', test=beginner)
+        cache.set(key, stale.tobytes(), None)
+        self.assertPoolIsFresh(beginner)
+
+    def test_pools_follow_changes(self):
+        beginner, advanced = self.tests['beginner'], self.tests['advanced']
+        get_pools(self.subject.pk, Test.LevelChoices.values)
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Question.objects.create(about='added', test=beginner)
+        self.assertPoolIsFresh(beginner)
+        with self.captureOnCommitCallbacks(execute=True):
+            added.test = advanced
+            added.save()
+        self.assertPoolIsFresh(beginner)
+        self.assertPoolIsFresh(advanced)
+        with self.captureOnCommitCallbacks(execute=True):
+            added.delete()
+        self.assertPoolIsFresh(advanced)
+        with self.captureOnCommitCallbacks(execute=True):
+            beginner.level = Test.LevelChoices.ADVANCED
+            beginner.save()
+        self.assertPoolIsFresh(advanced)
+        self.assertEqual(len(get_pools(self.subject.pk, [Test.LevelChoices.BEGINNER])[0]), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            advanced.delete()
+        self.assertPoolIsFresh(beginner)
+
+
+class SubmitTestCase(QuizAPITestCase):
+    """A test of three questions, with the true and a false option of each in `options`."""
+
+    def setUp(self):
+        super().setUp()
+        seed_catalogue(1)
+        Test.objects.update(balls=30)
+        self.test = Test.objects.get()
+        questions = Question.objects.bulk_create(
+            Question(about=f'extra {i}', test=self.test) for i in range(2)
+        )
+        Option.objects.bulk_create(
+            Option(name=f'{question.pk} {j}', question=question, is_true=(j == 0))
+            for question in questions for j in range(2)
+        )
+        self.options = {
+            question: (true, false) for question, true, false in (
+                (q.pk, q.options.get(is_true=True).pk, q.options.get(is_true=False).pk)
+                for q in self.test.questions.all()
+            )
+        }
+
+    def submit(self, correct, test=None):
+        answers = [
+            {'question': question, 'option': options[0] if i < correct else options[1]}
+            for i, (question, options) in enumerate(self.options.items())
+        ]
+        return self.client.post(f'/tests/{test or self.test.pk}/submit/', {'answers': answers}, format='json')
+
+
+class TestSubmitTests(SubmitTestCase):
+    def test_grades_and_awards_balls(self):
+        response = self.submit(correct=2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['correct'], response.data['total'], response.data['balls']), (2, 3, 20))
+        self.assertEqual(sum(response.data['results'].values()), 2)
+        self.assertEqual(User.objects.get(pk=self.user.pk).balls, 20)
+
+    def test_resubmitting_only_pays_the_improvement(self):
+        self.submit(correct=2)
+        self.assertEqual(self.submit(correct=1).data['balls'], 0)
+        self.assertEqual(self.submit(correct=3).data['balls'], 10)
+        self.assertEqual(User.objects.get(pk=self.user.pk).balls, 30)
+        self.assertEqual(Attempt.objects.filter(user=self.user).count(), 3)
+
+    def test_user_is_locked_before_the_best_attempt_is_read(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.submit(correct=1)
+        sql = [query['sql'] for query in ctx.captured_queries]
+        lock = next(i for i, query in enumerate(sql) if query.startswith('SELECT "quiz_user"."id" AS "pk" FROM "quiz_user"'))
+        best = next(i for i, query in enumerate(sql) if 'MAX("quiz_attempt"."balls")' in query)
+        self.assertLess(lock, best)
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', sql[lock])
+
+    def test_options_of_other_questions_do_not_count(self):
+        (q1, (t1, _)), (q2, (t2, _)) = list(self.options.items())[:2]
+        answers = [{'question': q1, 'option': t2}, {'question': q2, 'option': t1}]
+        response = self.client.post(f'/tests/{self.test.pk}/submit/', {'answers': answers}, format='json')
+        self.assertEqual(response.data['correct'], 0)
+
+    def test_query_count_does_not_depend_on_test_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.submit(correct=3)
+        self.clear_caches()
+        extra = Question.objects.bulk_create(Question(about=f'more {i}', test=self.test) for i in range(50))
+        Option.objects.bulk_create(Option(name='yes', question=q, is_true=True) for q in extra)
+        options = Option.objects.filter(question__in=extra).order_by('question_id').values_list('pk', flat=True)
+        self.options.update({q.pk: (o, o) for q, o in zip(extra, options)})
+        self.client.force_authenticate(User.objects.create_user(username='jane', password='1111'))
+        with CaptureQueriesContext(connection) as large:
+            self.submit(correct=53)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_validation(self):
+        url = f'/tests/{self.test.pk}/submit/'
+        self.assertEqual(self.client.post(url, {'answers': []}, format='json').status_code, 400)
+        duplicate = [{'question': 1, 'option': 1}, {'question': 1, 'option': 2}]
+        self.assertEqual(self.client.post(url, {'answers': duplicate}, format='json').status_code, 400)
+        self.assertEqual(self.submit(correct=1, test=999999).status_code, 404)
+
+
+class AnswerKeyTests(SubmitTestCase):
+    def assertKeyIsFresh(self):
+        cached = get_answer_key(self.test.pk)
+        rebuilt = build_answer_key(self.test.pk)
+        self.assertEqual(list(cached.questions), list(rebuilt.questions))
+        self.assertEqual(list(cached.options), list(rebuilt.options))
+
+    def test_warm_grading_does_not_touch_options(self):
+        self.submit(correct=1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.submit(correct=2)
+        self.assertFalse(any('quiz_option' in query['sql'] for query in ctx.captured_queries))
+
+    def test_key_follows_changes(self):
+        get_answer_key(self.test.pk)
+        question = self.test.questions.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            question.options.get(is_true=True).delete()
+        self.assertKeyIsFresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            Option.objects.create(name='new', question=question, is_true=True)
+        self.assertKeyIsFresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            false = question.options.get(is_true=False)
+            question.options.filter(is_true=True).delete()
+            false.is_true = True
+            false.save()
+        self.assertKeyIsFresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Question.objects.create(about='added', test=self.test)
+        self.assertKeyIsFresh()
+        other = Test.objects.create(name='other', subject=self.test.subject)
+        get_answer_key(other.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            question.test = other
+            question.save()
+            added.delete()
+        self.assertKeyIsFresh()
+        self.assertEqual(list(get_answer_key(other.pk).questions), [question.pk])
+
+    def test_cascade_deletes_cost_no_queries_per_row(self):
+        def delete_test(questions):
+            test = Test.objects.create(name='deleted', subject=self.test.subject)
+            created = Question.objects.bulk_create(Question(about=f'{i}', test=test) for i in range(questions))
+            Option.objects.bulk_create(Option(name='yes', question=q, is_true=True) for q in created)
+            get_answer_key(test.pk)
+            with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+                test.delete()
+            self.assertEqual(len(get_answer_key(test.pk)), 0)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(delete_test(1), delete_test(50))
+        get_answer_key(self.test.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test.questions.first().delete()
+        self.assertKeyIsFresh()
+
+    def test_late_reader_cannot_restore_a_stale_key(self):
+        key, stale = answer_keys.keys([self.test.pk])[self.test.pk], build_answer_key(self.test.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.create(about='added', test=self.test)
+        cache.set(key, stale.to_bytes(), None)
+        self.assertKeyIsFresh()
+
+    def test_review(self):
+        attempt = self.submit(correct=2).data['attempt']
+        review = self.client.get(f'/attempts/{attempt}/').data
+        self.assertEqual([row['is_correct'] for row in review['questions']], [True, True, False])
+        self.client.force_authenticate(User.objects.create_user(username='jane', password='1111'))
+        self.assertEqual(self.client.get(f'/attempts/{attempt}/').status_code, 404)
+
+
+class AsyncReadViewTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        seed_catalogue(30)
+        self.client.force_authenticate(None)
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_responses_match_the_sync_views(self):
+        ids = first_ids()
+        urls = [
+            '/subjects/?page_size=5', '/tests/?ordering=-balls&level=beg', '/questions/?search=question',
+            '/shop/', '/questions/?about=nothing',
+        ] + [f'/{prefix}/{pk}/' for prefix, pk in ids.items()] + ['/tests/999999/']
+        for url in urls:
+            self.clear_caches()
+            sync = self.client.get(url)
+            asynchronous = self.client.get(f'/async{url}')
+            self.assertEqual(asynchronous.status_code, sync.status_code, url)
+            self.assertEqual(
+                asynchronous.content.replace(b'/async/', b'/'), sync.content, url
+            )
+
+    async def test_middleware_stack_stays_async(self):
+        async def view(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(MetricsMiddleware(ReplicaMiddleware(view))))
+        response = await self.async_client.get('/async/subjects/', headers={'authorization': f'Bearer {self.token}'})
+        self.assertEqual(response.status_code, 200)
+        # the queries run in a worker thread are still counted
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    def test_authentication_is_required(self):
+        self.client.credentials()
+        response = self.client.get('/async/subjects/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer garbage')
+        self.assertEqual(self.client.get('/async/subjects/').json()['code'], 'token_not_valid')
+
+
+class CachedAuthenticationTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+        self.login(self.user)
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    def user_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        return [query for query in ctx.captured_queries if 'FROM "quiz_user"' in query['sql']]
+
+    def test_user_is_loaded_once(self):
+        # authentication, and the profile document rendered from the current row
+        self.assertEqual(len(self.user_queries('/profile/')), 2)
+        self.assertEqual(len(self.user_queries('/profile/')), 0)
+
+    def test_saves_and_password_changes_invalidate(self):
+        self.client.get('/profile/')
+        self.user.about = 'changed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get('/profile/').json()['about'], 'changed')
+        response = self.client.post('/change-password/', {'current_password': '1111', 'new_password': 'n3w-pass!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(str(self.user.pk), user_cache.data)
+
+    def test_inactive_users_are_rejected_from_the_cache(self):
+        self.client.get('/profile/')
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/profile/').status_code, 200)  # until the entry expires
+        key = str(self.user.pk)
+        user_cache.data[key] = (0, user_cache.data[key][1])
+        self.assertEqual(self.client.get('/profile/').status_code, 401)
+
+    def test_catalogue_is_served_from_token_claims(self):
+        seed_catalogue(3)
+        for url in ('/subjects/', '/tests/', '/shop/'):
+            self.assertEqual(self.user_queries(url), [], url)
+            self.assertEqual(self.client.get(f'/async{url}').status_code, 200)
+
+
+class VerificationCodeTests(QuizAPITestCase):
+    def confirm(self, code):
+        return self.client.post('/confirm-user/', {'code': code})
+
+    def test_code_is_spent_once(self):
+        code = self.user.create_verification_code
+        self.assertEqual(self.confirm(f'{(int(code) + 1) % 10000:04}').status_code, 400)
+        # the update and the queued notification, in one savepoint
+        with self.assertNumQueries(4):
+            self.assertEqual(self.confirm(code).data['status'], 'Success')
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_verified)
+        self.assertEqual(self.confirm(code).status_code, 400)
+        self.assertFalse(UserConfirmation.objects.exists())
+
+    def test_malformed_code_is_rejected(self):
+        for code in ('²²²²', '１２３４', '123', '12345', 'abcd'):
+            with self.subTest(code=code):
+                response = self.confirm(code)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['status'], 'Fail')
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_verified)
+
+    def test_expired_code_is_rejected(self):
+        code = self.user.create_verification_code
+        with mock.patch('quiz.verification.now', return_value=now() + timedelta(seconds=301)):
+            self.assertFalse(code_store().consume(self.user.pk, code))
+
+    @override_settings(VERIFICATION_CODE_STORE='quiz.verification.DatabaseCodeStore')
+    def test_database_store(self):
+        code = self.user.create_verification_code
+        self.assertEqual(self.confirm(code).status_code, 200)
+        self.assertEqual(self.confirm(code).status_code, 400)
+        self.assertTrue(UserConfirmation.objects.get(user=self.user).is_confirmed)
+
+    @override_settings(VERIFICATION_CODE_AUDIT=True)
+    def test_audit_log_is_written_in_bulk(self):
+        store = CacheCodeStore()
+        with self.assertNumQueries(0):
+            codes = [store.issue(self.user.pk) for _ in range(3)]
+            store.consume(self.user.pk, codes[0])
+        with self.assertNumQueries(1):
+            audit_log.flush()
+        self.assertEqual(UserConfirmation.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(UserConfirmation.objects.filter(is_confirmed=True).count(), 1)
+
+    def test_audit_log_is_written_within_its_interval(self):
+        log = AuditLog(batch_size=100, interval=0.01)
+        written = threading.Event()
+        with mock.patch.object(log, 'write', side_effect=lambda rows: written.set()) as write, \
+                mock.patch('quiz.verification.connections'):
+            log.record(self.user.pk, '1234', now(), is_confirmed=False)
+            self.assertTrue(written.wait(5))
+        self.assertEqual(len(write.call_args.args[0]), 1)
+        self.assertEqual((log.pending, log.timer), ([], None))
+
+    def test_purge(self):
+        UserConfirmation.objects.bulk_create([
+            UserConfirmation(user=self.user, code=1, expire_time=now() - timedelta(days=10)),
+            UserConfirmation(user=self.user, code=2, expire_time=now() - timedelta(minutes=1)),
+            UserConfirmation(user=self.user, code=3, expire_time=now() + timedelta(minutes=1)),
+            # the audit log of a spent code
+            UserConfirmation(user=self.user, code=4, expire_time=now() - timedelta(days=10), is_confirmed=True),
+        ])
+        call_command('purge_verification_codes', older_than=1, stdout=StringIO())
+        self.assertEqual(sorted(UserConfirmation.objects.values_list('code', flat=True)), [2, 3, 4])
+        call_command('purge_verification_codes', batch_size=1, stdout=StringIO())
+        self.assertEqual(sorted(UserConfirmation.objects.values_list('code', flat=True)), [3, 4])
+
+
+class JobQueueTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        jobs.job('flaky', max_attempts=2)(self.flaky)
+        self.addCleanup(jobs.registry.pop, 'flaky')
+
+    def flaky(self, fail):
+        self.calls.append(fail)
+        if fail:
+            raise RuntimeError('flaky')
+
+    # a store whose codes can be counted
+    @override_settings(VERIFICATION_CODE_STORE='quiz.verification.DatabaseCodeStore')
+    def test_registration_side_effects_run_in_a_worker(self):
+        response = self.client.post('/auth/register/', {'username': 'jane', 'email': 'jane@example.com', 'password': '1234'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        # the code is issued by the request, the worker only sends it
+        self.assertEqual(UserConfirmation.objects.filter(user__username='jane').count(), 1)
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(UserConfirmation.objects.filter(user__username='jane').count(), 1)
+        code = mail.outbox[0].body.split()[-1].rstrip('.')
+        self.client.force_authenticate(User.objects.get(username='jane'))
+        self.assertEqual(self.client.post('/confirm-user/', {'code': code}).status_code, 200)
+        jobs.WorkerPool(threads=1).serve(once=True)
+        self.assertEqual(mail.outbox[1].subject, 'Your account is verified')
+        self.assertFalse(Job.objects.exclude(status=Job.StatusChoices.DONE).exists())
+
+    def test_registration_hashes_the_password_before_its_transaction(self):
+        depths = []
+
+        def hash_password(password):
+            depths.append(len(connection.atomic_blocks))
+            return make_password(password)
+
+        with mock.patch('quiz.serializers.make_password', hash_password):
+            response = self.client.post('/auth/register/', {'username': 'jane', 'email': 'jane@example.com', 'password': '1234'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(depths, [len(connection.atomic_blocks)])
+        self.assertTrue(User.objects.get(username='jane').check_password('1234'))
+
+    def test_failed_job_is_retried_then_dead(self):
+        job = jobs.enqueue('flaky', fail=True)
+        with self.assertLogs('quiz.jobs', 'WARNING'):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.StatusChoices.QUEUED, 1))
+        self.assertIn('RuntimeError: flaky', job.last_error)
+        # not due before its retry delay
+        self.assertEqual(jobs.run_pending(), 0)
+        Job.objects.update(run_after=now())
+        with self.assertLogs('quiz.jobs', 'WARNING'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.StatusChoices.DEAD, 2))
+        out = StringIO()
+        call_command('run_workers', list_dead=True, stdout=out)
+        self.assertIn('flaky', out.getvalue())
+        Job.objects.filter(pk=job.pk).update(payload={'fail': False})
+        call_command('run_workers', retry_dead=[], stdout=StringIO())
+        call_command('run_workers', once=True, threads=1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.StatusChoices.DONE)
+        self.assertEqual(self.calls, [True, True, False])
+
+    def test_job_runs_outside_a_transaction(self):
+        depths = []
+        jobs.job('probe')(lambda: depths.append(len(connection.atomic_blocks)))
+        self.addCleanup(jobs.registry.pop, 'probe')
+        jobs.enqueue('probe')
+        jobs.run_pending()
+        # only the test case's own blocks are open
+        self.assertEqual(depths, [len(connection.atomic_blocks)])
+
+    def test_job_is_claimed_once(self):
+        jobs.enqueue('flaky', fail=False)
+        self.assertEqual(len(jobs.claim(10)), 1)
+        self.assertEqual(jobs.claim(10), [])
+        # a worker that died lets its lease expire
+        Job.objects.update(run_after=now())
+        self.assertEqual(len(jobs.claim(10)), 1)
+
+
+class ThrottlingTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+
+    def login(self, username='john', password='wrong', ip='10.0.0.1'):
+        return self.client.post('/auth/login/', {'username': username, 'password': password}, REMOTE_ADDR=ip)
+
+    def test_login_is_throttled_by_username_and_ip(self):
+        for _ in range(5):
+            self.assertEqual(self.login().status_code, 401)
+        response = self.login(password='1111')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 12)
+        self.assertEqual(self.login(username='jane').status_code, 401)
+        self.assertEqual(self.login(ip='10.0.0.2').status_code, 429)
+        # 30/min per address, whatever the username
+        statuses = [self.login(username=f'user{i}').status_code for i in range(40)]
+        self.assertEqual(statuses[-1], 429)
+        self.assertEqual(self.login(username='other', ip='10.0.0.3').status_code, 401)
+
+    def test_scopes_have_their_own_buckets(self):
+        for _ in range(5):
+            self.login()
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/change-password/', {'current_password': '1111', 'new_password': 'n3w-pass!'},
+                                    REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 200)
+
+    def test_bucket_refills(self):
+        bucket = TokenBucket('quiz:throttle:test', capacity=2, rate=1)
+        with mock.patch('quiz.throttling.time.time', return_value=1000.0):
+            self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 1])
+        with mock.patch('quiz.throttling.time.time', return_value=1000.5):
+            self.assertEqual(bucket.take(), 0.5)
+        with mock.patch('quiz.throttling.time.time', return_value=1001.0):
+            self.assertEqual([bucket.take() for _ in range(2)], [0, 1])
+        with mock.patch('quiz.throttling.time.time', return_value=1100.0):
+            self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 1])
+
+    def test_concurrent_requests_spend_at_most_the_capacity(self):
+        bucket = TokenBucket('quiz:throttle:test', capacity=5, rate=5 / (24 * 60 * 60))
+        barrier = threading.Barrier(16)
+
+        def client():
+            barrier.wait()
+            # straight to the shared bucket, as from 16 separate processes
+            return sum(bucket.shared_take(time.time()) >= 0 for _ in range(10))
+
+        get = LocMemCache.get
+
+        def slow_get(backend, *args, **kwargs):
+            # widen the gap between reading the bucket and writing it back
+            time.sleep(0.001)
+            return get(backend, *args, **kwargs)
+
+        threads = ThreadPoolExecutor(16)
+        self.addCleanup(threads.shutdown)
+        with mock.patch.object(LocMemCache, 'get', slow_get):
+            self.assertEqual(sum(threads.map(lambda _: client(), range(16))), 5)
+
+    def test_empty_local_bucket_skips_the_cache(self):
+        bucket = TokenBucket('quiz:throttle:test', capacity=2, rate=0.1)
+        bucket.take(), bucket.take()
+        with mock.patch.object(TokenBucket, 'shared_take') as shared_take:
+            self.assertGreater(bucket.take(), 0)
+        shared_take.assert_not_called()
+        # another process, with an empty local view, still sees the shared bucket
+        local_buckets.clear()
+        self.assertGreater(bucket.take(), 0)
+
+
+class MetricsTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        seed_catalogue(5)
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/questions/')
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timing)
+        for metric in ('db;dur=', 'serialize;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+    def test_prometheus_endpoint(self):
+        self.client.get('/tests/')
+        self.client.get('/tests/')
+        self.client.get(f'/tests/{Test.objects.first().pk}/')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('quiz_requests_total{view="tests/",method="GET",status="200"} 2', body)
+        self.assertIn('quiz_requests_total{view="tests/<int:pk>/",method="GET",status="200"} 1', body)
+        self.assertIn('quiz_request_duration_seconds{view="tests/",method="GET",quantile="0.99"}', body)
+        self.assertIn('quiz_request_db_seconds_count{view="tests/",method="GET"} 2', body)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    def test_slow_request_log(self):
+        with mock.patch('quiz.metrics.METRICS_SLOW_REQUEST_MS', 0), self.assertLogs('quiz.metrics') as logs:
+            self.client.get('/subjects/')
+        self.assertIn('Slow request GET /subjects/', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_histogram_error_is_bounded(self):
+        histogram = Histogram()
+        for value in range(1, 100_001):
+            histogram.record(value)
+        for q in (0.5, 0.9, 0.99):
+            self.assertAlmostEqual(histogram.quantile(q) / (q * 100_000), 1, delta=1 / 32)
+        self.assertLess(len(histogram.counts), 600)
+
+
+def send(client, request):
+    """Send a request of `quiz.benchmarks.drive` through the test client."""
+    method, path, body, headers = request
+    extra = {f'HTTP_{name.upper().replace("-", "_")}': value for name, value in headers.items()}
+    return getattr(client, method.lower())(path, body, format='json', **extra)
+
+
+class LoadTestTests(QuizAPITestCase):
+    def test_seed_dataset(self):
+        tests = seed_dataset(questions=100, users=20)
+        self.assertEqual(len(tests), 2)
+        self.assertEqual(Question.objects.count(), 100)
+        self.assertEqual(Option.objects.filter(is_true=True).count(), 100)
+        self.assertEqual(User.objects.filter(username__startswith='user').count(), 20)
+        self.assertTrue(User.objects.get(username='user0').check_password(LOAD_PASSWORD))
+        self.assertEqual(Test.objects.get(pk=tests[0].pk).questions_count, 50)
+
+    def test_routes_cover_every_url(self):
+        from root.urls import urlpatterns
+
+        tests = seed_dataset(questions=100, users=2)
+        clients = [{'pk': user.pk, **credentials(user)} for user in User.objects.filter(username__startswith='user')]
+        admin = credentials(User.objects.create_user('admin', password=LOAD_PASSWORD, is_staff=True))
+        routes = load_routes(tests, clients, admin)
+        self.assertEqual({route.split(' ', 1)[1] for route in routes}, {str(url.pattern) for url in urlpatterns})
+
+        self.client.force_authenticate(None)
+        responses = {route: send(self.client, request(0, 0)) for route, (request, _) in routes.items()}
+        for route, (_, expect) in routes.items():
+            status = responses[route].status_code
+            self.assertTrue(status < 400 or status in expect, (route, status))
+
+    def test_compare(self):
+        def baseline(rps, p95, queries, errors=0):
+            return {'routes': {'GET tests/': {
+                'requests_per_sec': rps, 'p95_ms': p95, 'queries_per_request': queries, 'errors': errors,
+            }}}
+
+        before = baseline(1000, 10, 1)
+        for after, regressed in (
+            (baseline(950, 10.5, 1), False),
+            (baseline(800, 10, 1), True),
+            (baseline(1000, 12, 1), True),
+            (baseline(1000, 10, 2), True),
+            (baseline(1000, 10, 1, errors=3), True),
+        ):
+            [row] = compare(before, after, tolerance=10)
+            self.assertEqual(row['regressed'], regressed, after)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReplicaRouterTests(APITransactionTestCase):
+    # not a TestCase, whose transaction would send every read to the primary
+    def setUp(self):
+        QuizAPITestCase.clear_caches()
+        self.user = User.objects.create_user(username='john', password='1111')
+        patcher = mock.patch('quiz.routers.DATABASE_REPLICAS', ['replica0'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # the catalogue last changed long ago
+        for model in (Subjects, Test, Question, Option, Shop):
+            cache.set(catalogue_cache.modified_key(model), time.time() - 60)
+
+    def request(self, method='get', user=None, write=False):
+        """The databases `Test` and `User` are read from during a request through `ReplicaMiddleware`."""
+        seen = {}
+
+        def view(request):
+            request.user = user or self.user  # as DRF authentication does
+            if write:
+                router.db_for_write(Shop)
+            seen.update(test=router.db_for_read(Test), user=router.db_for_read(User))
+            return HttpResponse()
+
+        ReplicaMiddleware(view)(getattr(RequestFactory(), method)('/'))
+        return seen
+
+    def test_catalogue_reads_of_safe_requests_go_to_replicas(self):
+        self.assertEqual(self.request(), {'test': 'replica0', 'user': 'default'})
+        self.assertEqual(self.request('post')['test'], 'default')
+        self.assertEqual(router.db_for_read(Test), 'default')
+        with transaction.atomic():
+            self.assertEqual(self.request()['test'], 'default')
+
+    def test_read_your_writes(self):
+        other = User.objects.create_user(username='jane', password='1111')
+        self.assertEqual(self.request(write=True)['test'], 'default')
+        self.assertEqual(self.request()['test'], 'default')
+        self.assertEqual(self.request(user=other)['test'], 'replica0')
+        cache.delete(pin_key(self.user.pk))
+        self.assertEqual(self.request()['test'], 'replica0')
+
+    def test_changed_models_are_read_from_the_primary(self):
+        # committed at once, so the on_commit bumps run
+        Test.objects.create(name='new', subject=Subjects.objects.create(name='subject'), balls=10)
+        self.assertEqual(self.request()['test'], 'default')
+        cache.set(catalogue_cache.modified_key(Test), time.time() - 60)
+        self.assertEqual(self.request()['test'], 'replica0')
+
+    def test_sync_replicas(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        primary, replica = os.path.join(directory, 'primary.sqlite3'), os.path.join(directory, 'replica.sqlite3')
+        with closing(sqlite3.connect(primary)) as db, db:
+            db.execute('CREATE TABLE t (x INTEGER)')
+            db.executemany('INSERT INTO t VALUES (?)', [(1, ), (2, )])
+        sync(primary, replica)
+        with closing(sqlite3.connect(replica)) as db:
+            self.assertEqual(db.execute('SELECT SUM(x) FROM t').fetchone(), (3, ))
+
+
+class ProfileDocumentTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        User.objects.filter(pk=self.user.pk).update(balls=100)
+        self.items = Shop.objects.bulk_create(
+            Shop(name=f'item {i}', about='about', amount=10, is_active=True, price=1) for i in range(5)
+        )
+
+    def profile(self, url='/profile/'):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(ctx.captured_queries)
+
+    def test_document_is_cached(self):
+        self.user.gifts.set(self.items[:2])
+        data, queries = self.profile()
+        self.assertEqual(data['username'], 'john')
+        self.assertEqual([gift['name'] for gift in data['gifts']], ['item 0', 'item 1'])
+        self.assertEqual((data['gifts_count'], data['gifts_next']), (2, None))
+        self.assertGreater(queries, 0)
+        self.assertEqual(self.profile(), (data, 0))
+        etag = self.client.get('/profile/')['ETag']
+        self.assertEqual(self.client.get('/profile/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_only_profile_fields_invalidate(self):
+        self.profile()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.last_login = now()
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.profile()[1], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/profile/', {'about': 'changed'})
+        self.assertEqual(response.json()['about'], 'changed')
+        self.assertEqual(self.profile()[0]['about'], 'changed')
+
+    def test_stale_request_user_does_not_revert_other_fields(self):
+        # self.user was loaded before setUp awarded the balls, like a cached request.user
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put('/profile/', {'about': 'changed', 'level': 'advanced'})
+            self.client.post('/change-password/', {'current_password': '1111', 'new_password': '2222'})
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.about, user.level, user.balls), ('changed', 'advanced', 100))
+        self.assertTrue(user.check_password('2222'))
+        self.assertEqual(self.profile()[0]['balls'], 100)
+
+    def test_late_reader_cannot_restore_a_stale_profile(self):
+        key, stale = profiles.keys([self.user.pk])[self.user.pk], render_profile(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put('/profile/', {'about': 'changed'})
+        cache.set(key, stale, None)
+        self.assertEqual(self.profile()[0]['about'], 'changed')
+
+    def test_purchases_invalidate(self):
+        self.profile()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/shop/buy/', {'id': self.items[0].pk})
+        data, _ = self.profile()
+        self.assertEqual((data['balls'], [gift['id'] for gift in data['gifts']]), (99, [self.items[0].pk]))
+
+    def test_gifted_item_changes_invalidate(self):
+        self.user.gifts.set(self.items[:2])
+        self.profile()
+        with self.captureOnCommitCallbacks(execute=True):
+            Shop.objects.filter(pk=self.items[0].pk).first().save()  # unrelated fields stay cached
+        item = Shop.objects.get(pk=self.items[1].pk)
+        item.name = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        data, queries = self.profile()
+        self.assertEqual(data['gifts'][1]['name'], 'renamed')
+        self.assertEqual(queries, 1)  # only the changed items are rendered again
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.profile()[0]['gifts_count'], 1)
+
+    def test_large_gift_lists_are_paged(self):
+        self.user.gifts.set(self.items)
+        with mock.patch('quiz.profiles.PROFILE_GIFTS', 2):
+            data, _ = self.profile()
+        self.assertEqual([gift['id'] for gift in data['gifts']], [item.pk for item in self.items[:2]])
+        self.assertEqual(data['gifts_count'], 5)
+        page, _ = self.profile(data['gifts_next'])
+        self.assertEqual([gift['id'] for gift in page['results']], [item.pk for item in self.items[2:]])
+        self.assertIsNone(page['next'])
+
+
+class ImportQuestionsTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def import_questions(self, path, *args):
+        call_command('import_questions', path, *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_jsonl(self):
+        Subjects.objects.create(name='Math')
+        path = self.write('data.jsonl', [
+            json.dumps({'type': 'test', 'subject': 'Math', 'name': 'Algebra', 'level': 'advanced'}),
+            json.dumps({'type': 'question', 'subject': 'Math', 'test': 'Algebra', 'about': '2 + 2',
+                        'options': [{'name': '4', 'is_true': True}, {'name': '5', 'is_true': False}]}),
+            json.dumps({'type': 'question', 'subject': 'History', 'test': 'Rome', 'about': 'Founded in'}),
+            json.dumps({'type': 'option', 'name': '753 BC', 'is_true': True}),
+        ])
+        self.import_questions(path, '--batch-size', '1')
+        self.assertEqual(Subjects.objects.count(), 2)
+        self.assertEqual(Test.objects.get(name='Algebra').balls, 30)
+        self.assertEqual(Test.objects.get(name='Algebra').questions_count, 1)
+        self.assertEqual(Subjects.objects.get(name='History').tests_count, 1)
+        self.assertEqual(Question.objects.count(), 2)
+        self.assertEqual(Option.objects.get(is_true=True, question__about='Founded in').name, '753 BC')
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_csv_resumes_from_checkpoint(self):
+        rows = ['subject,test,level,balls,question,option,is_true']
+        for i in range(6):
+            # a quoted field spanning two lines, so rows and lines differ
+            question = f'"q{i}\nwhich one?"'
+            rows += [f'Math,Algebra,beginner,5,{question},a{i},1', f'Math,Algebra,beginner,5,{question},b{i},0']
+        path = self.write('data.csv', rows)
+        with open(f'{path}.checkpoint', 'w') as f:
+            json.dump({'records': 4}, f)  # the first two questions were committed before
+        self.import_questions(path, '--batch-size', '2')
+        self.assertEqual(list(Question.objects.order_by('pk').values_list('about', flat=True)),
+                         [f'q{i}\nwhich one?' for i in range(2, 6)])
+        self.assertEqual(Option.objects.count(), 8)
+        self.assertEqual(Test.objects.get().balls, 5)
+
+    def test_queries_are_batched(self):
+        lines = [json.dumps({'type': 'question', 'subject': 'S', 'test': 'T', 'about': f'q{i}',
+                             'options': [{'name': 'a', 'is_true': True}]}) for i in range(50)]
+        path = self.write('data.jsonl', lines)
+        with CaptureQueriesContext(connection) as ctx:
+            self.import_questions(path, '--batch-size', '25', '--no-checkpoint')
+        self.assertEqual(Option.objects.count(), 50)
+        self.assertLess(len(ctx.captured_queries), 20)
+
+    def test_resaving_a_test_keeps_its_balls(self):
+        test = Test.objects.create(name='T', subject=Subjects.objects.create(name='S'), level='intermediate')
+        test.save()
+        test.refresh_from_db()
+        self.assertEqual(test.balls, 20)
+
+
+class ExportQuestionsTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        seed_catalogue(5)
+        self.user.is_staff = True
+        self.user.save()
+
+    def export(self, query=''):
+        response = self.client.get(f'/questions/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        records = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[0]['test'], 'test 0')
+        self.assertEqual(records[0]['options'], [{'name': 'option 00', 'is_true': True},
+                                                 {'name': 'option 01', 'is_true': False}])
+
+    def test_csv_and_gzip(self):
+        body = gzip.decompress(self.export('?output=csv&gzip=1&test=test 3'))
+        rows = list(csv.DictReader(StringIO(body.decode())))
+        self.assertEqual([row['option'] for row in rows], ['option 30', 'option 31'])
+        self.assertEqual(self.client.get('/questions/export/?output=xml').status_code, 400)
+
+    def test_queries_per_chunk_and_round_trip(self):
+        with CaptureQueriesContext(connection) as ctx:
+            with tempfile.NamedTemporaryFile(suffix='.jsonl.gz') as f:
+                call_command('export_questions', f.name, '--chunk-size', '2', stderr=StringIO())
+                # 3 chunks of questions and options, and the query that finds no more
+                self.assertEqual(len(ctx.captured_queries), 7)
+                Question.objects.all().delete()
+                call_command('import_questions', f.name, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Question.objects.count(), 5)
+        self.assertEqual(Option.objects.filter(is_true=True).count(), 5)
+
+    def test_admin_only(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get('/questions/export/').status_code, 403)
+
+
+class LeaderboardTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        User.objects.filter(pk=self.user.pk).update(balls=50)
+        for name, level, balls in (('ann', 'advanced', 90), ('bob', 'beginner', 50), ('cid', 'advanced', 10)):
+            User.objects.create(username=name, level=level, balls=balls)
+
+    def rank(self, query=''):
+        return self.client.get(f'/leaderboard/me/{query}').data
+
+    def test_top_and_ties(self):
+        response = self.client.get('/leaderboard/?limit=3')
+        self.assertEqual([(e['username'], e['rank']) for e in response.data], [('ann', 1), ('john', 2), ('bob', 2)])
+        response = self.client.get('/leaderboard/?level=advanced')
+        self.assertEqual([(e['username'], e['rank']) for e in response.data], [('ann', 1), ('cid', 2)])
+        self.assertEqual(self.client.get('/leaderboard/?level=expert').status_code, 400)
+
+    def test_my_rank(self):
+        self.assertEqual(self.rank(), {'rank': 2, 'balls': 50, 'total': 4})
+        self.assertEqual(self.rank('?level=advanced'), {'rank': 2, 'balls': 50, 'total': 2})
+
+    def test_balls_changes_are_replayed_without_reloading(self):
+        self.rank()
+        item = Shop.objects.create(name='item', about='about', amount=5, price=45)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/shop/buy/', {'id': item.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create(username='dan', balls=70)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(username='ann').delete()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.rank(), {'rank': 4, 'balls': 5, 'total': 4})
+        self.assertEqual(len(ctx.captured_queries), 1)  # the balls of the user
+
+    def test_old_scores_are_reloaded_in_the_background(self):
+        self.rank()
+        leaderboard.loaded -= MAX_AGE + 1
+        User.objects.filter(username='ann').update(balls=5)  # a bulk update publishes nothing
+        with mock.patch('quiz.leaderboard.threading.Thread') as thread, CaptureQueriesContext(connection) as ctx:
+            # served from the arrays at hand meanwhile
+            self.assertEqual(self.rank()['rank'], 2)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        thread.return_value.start.assert_called_once_with()
+        with mock.patch('quiz.leaderboard.connections'):
+            thread.call_args.kwargs['target']()
+        self.assertEqual(self.rank()['rank'], 1)
+
+    def test_a_sequence_number_handed_out_twice_forces_a_reload(self):
+        self.rank()
+        sequence = current_sequence() + 1
+
+        def incr(backend, key, delta=1):
+            # both publishers read the counter before either wrote it back
+            backend.set(key, sequence)
+            return sequence
+
+        with mock.patch.object(LocMemCache, 'incr', incr):
+            for name in ('dan', 'eve'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    User.objects.create(username=name, balls=70)
+        with mock.patch('quiz.leaderboard.threading.Thread') as thread:
+            self.rank()
+        thread.return_value.start.assert_called_once_with()
+        with mock.patch('quiz.leaderboard.connections'):
+            thread.call_args.kwargs['target']()
+        self.assertEqual(self.rank(), {'rank': 4, 'balls': 50, 'total': 6})
+
+    def test_top_syncs_once(self):
+        with mock.patch.object(leaderboard, 'sync', wraps=leaderboard.sync) as sync:
+            self.assertEqual(len(self.client.get('/leaderboard/').data), 4)
+        sync.assert_called_once_with()
+
+    def test_level_changes_move_users(self):
+        self.rank()
+        bob = User.objects.get(username='bob')
+        bob.level = 'advanced'
+        with self.captureOnCommitCallbacks(execute=True):
+            bob.save()
+        self.assertEqual(leaderboard.size('advanced'), 3)
+        self.assertEqual(leaderboard.size('beginner'), 1)
+
+
+class CounterTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.subject = Subjects.objects.create(name='Math')
+        self.test = Test.objects.create(name='Algebra', subject=self.subject)
+
+    def counts(self):
+        self.subject.refresh_from_db()
+        self.test.refresh_from_db()
+        return self.subject.tests_count, self.test.questions_count
+
+    def test_create_move_and_delete(self):
+        questions = [Question.objects.create(about=f'q{i}', test=self.test) for i in range(3)]
+        other = Test.objects.create(name='Geometry', subject=self.subject)
+        self.assertEqual(self.counts(), (2, 3))
+        questions[0].test = other
+        questions[0].save()
+        questions[1].delete()
+        self.assertEqual(self.counts(), (2, 1))
+        other.refresh_from_db()
+        self.assertEqual(other.questions_count, 1)
+        other.subject = Subjects.objects.create(name='Shapes')
+        other.save()
+        self.assertEqual(self.counts(), (1, 1))
+
+    def test_saving_a_stale_instance_keeps_the_counters(self):
+        stale = Test.objects.get(pk=self.test.pk)
+        Question.objects.create(about='q', test=self.test)
+        stale.name = 'Renamed'
+        stale.save()
+        self.assertEqual(self.counts(), (1, 1))
+
+    def test_exposed_without_aggregation(self):
+        Question.objects.create(about='q', test=self.test)
+        with CaptureQueriesContext(connection) as ctx:
+            subjects = self.client.get('/subjects/').data['results']
+            tests = self.client.get('/tests/').data['results']
+        self.assertEqual(subjects[0]['tests_count'], 1)
+        self.assertEqual(tests[0]['questions_count'], 1)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+
+    def test_recount(self):
+        Question.objects.bulk_create(Question(about=f'q{i}', test=self.test) for i in range(4))
+        Subjects.objects.update(tests_count=7)
+        out = StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn('tests_count: 1 rows fixed', out.getvalue())
+        self.assertEqual(self.counts(), (1, 4))
+
+
+class ValuesSerializerTests(QuizAPITestCase):
+    views = {
+        '/subjects/': SubjectsAPIView,
+        '/tests/': TestsAPIView,
+        '/questions/': QuestionsAPIView,
+        '/shop/': ShopGetItemsAPIView,
+    }
+
+    def setUp(self):
+        super().setUp()
+        seed_catalogue(30)
+        Shop.objects.filter(pk__in=Shop.objects.order_by('pk').values('pk')[:3]).update(
+            image='shop/images/ring.png', is_active=None, discount=2.5,
+        )
+        Question.objects.create(about='no options', test=Test.objects.first())
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def get(self, url):
+        self.clear_caches()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def test_output_is_byte_identical(self):
+        queries = ('', '?page_size=7', '?ordering=-price', '?ordering=-balls,name', '?search=1', '?name=subject 1')
+        for url, view in self.views.items():
+            for query in queries:
+                fast = self.get(url + query)
+                with mock.patch.object(view, 'values_serializer_class', None):
+                    slow = self.get(url + query)
+                self.assertEqual(fast, slow, url + query)
+                # the async twins differ only in their links
+                results = json.loads(self.get(f'/async{url}{query}'))['results']
+                self.assertEqual(results, json.loads(slow)['results'], f'/async{url}{query}')
+
+    def test_next_pages_match(self):
+        for url, view in self.views.items():
+            fast = json.loads(self.get(f'{url}?page_size=4'))
+            with mock.patch.object(view, 'values_serializer_class', None):
+                slow = json.loads(self.get(f'{url}?page_size=4'))
+            self.assertEqual(self.get(fast['next']), self.get(slow['next']))
+
+
+class ConditionalGetTests(QuizAPITestCase):
+    urls = ('/subjects/', '/tests/', '/questions/', '/shop/')
+
+    def setUp(self):
+        super().setUp()
+        seed_catalogue(40)
+
+    def test_unchanged_resources_are_not_modified_without_queries(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertTrue(response['ETag'].startswith('W/"'), url)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(ctx.captured_queries, [], url)
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_changes_produce_a_new_etag(self):
+        etag = self.client.get('/questions/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Option.objects.filter(pk=Option.objects.first().pk).delete()
+            Option.objects.first().save()
+        response = self.client.get('/questions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertNotEqual(self.client.get('/questions/?page_size=5')['ETag'], response['ETag'])
+
+    def test_large_bodies_are_compressed(self):
+        for url in self.urls:
+            plain = self.client.get(url)
+            self.assertIn('Accept-Encoding', plain['Vary'], url)
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=1.0, identity;q=0.5')
+            self.assertEqual(response['Content-Encoding'], 'gzip', url)
+            self.assertEqual(gzip.decompress(response.content), plain.content, url)
+        self.assertFalse(self.client.get('/subjects/?page_size=1', HTTP_ACCEPT_ENCODING='gzip').has_header(
+            'Content-Encoding'))
+        response = self.client.get('/async/questions/', HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_negotiation(self):
+        self.assertIsNone(negotiate(''))
+        self.assertIsNone(negotiate('gzip;q=0, identity'))
+        self.assertEqual(negotiate('deflate, *;q=0.1'), next(iter(ENCODERS)))
+        self.assertEqual(negotiate('gzip, br;q=0.5'), 'gzip')
@@ -0,0 +1,123 @@
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from quiz.cache import LRUCache, shared_lock
+
+# key -> (tokens, time) as last seen in the shared bucket, refilled locally.
+# Only this process spends tokens from it, so it never holds fewer tokens
+# than the shared bucket and an empty local bucket answers without the cache.
+local_buckets = LRUCache(maxsize=getattr(settings, 'THROTTLE_LOCAL_MAXSIZE', 10_000))
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """`'5/min'` -> (5, 60), in the format of DRF's `DEFAULT_THROTTLE_RATES`."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class TokenBucket:
+    """
+    A token bucket of `capacity` tokens refilled at `rate` tokens per second,
+    shared through the Django cache.
+
+    The cache holds the tokens of the bucket and when they were counted.
+    They are read, refilled and spent under a `shared_lock` of the bucket,
+    so concurrent requests, in this process or another, cannot spend the
+    same token. A bucket idle for a whole refill period expires, which is
+    the same as a full one.
+    """
+
+    def __init__(self, key, capacity, rate):
+        self.key = key
+        self.capacity = capacity
+        self.rate = rate
+        self.timeout = math.ceil(capacity / rate) + 1
+
+    def local_tokens(self, now):
+        entry = local_buckets.get(self.key)
+        if entry is None:
+            return self.capacity
+        tokens, stamp = entry
+        return min(self.capacity, tokens + (now - stamp) * self.rate)
+
+    def shared_take(self, now):
+        """Spend a token from the shared bucket. Returns the tokens left, below 0 if there was none."""
+        with shared_lock(f'{self.key}:lock'):
+            tokens, stamp = cache.get(self.key, (self.capacity, now))
+            # another process may have counted them a moment later than `now`
+            tokens = min(self.capacity, tokens + max(0, now - stamp) * self.rate)
+            if tokens >= 1:
+                # only a granted request spends a token
+                cache.set(self.key, (tokens - 1, max(now, stamp)), self.timeout)
+            return tokens - 1
+
+    def take(self):
+        """Spend one token. Returns 0 on success, or the seconds until a token is available."""
+        now = time.time()
+        if self.local_tokens(now) < 1:
+            return (1 - self.local_tokens(now)) / self.rate
+        left = self.shared_take(now)
+        if left >= 0:
+            local_buckets.set(self.key, (left, now))
+            return 0
+        local_buckets.set(self.key, (left + 1, now))
+        return -left / self.rate
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token-bucket throttle for the view's `throttle_scope`. The rate of scope
+    `<view scope>_<key_name>` in `DEFAULT_THROTTLE_RATES`, e.g. `5/min`, is
+    both the burst size and how fast the bucket refills.
+    """
+    key_name = None
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(f'{scope}_{self.key_name}') if scope else None
+        key = self.get_key(request, view)
+        if rate is None or key is None:
+            return True
+        count, period = parse_rate(rate)
+        digest = hashlib.sha1(key.encode()).hexdigest()[:20]
+        bucket = TokenBucket(f'quiz:throttle:{scope}:{self.key_name}:{digest}', count, count / period)
+        self.wait_seconds = bucket.take()
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPThrottle(TokenBucketThrottle):
+    key_name = 'ip'
+
+    def get_key(self, request, view):
+        return self.get_ident(request)
+
+
+class UsernameThrottle(TokenBucketThrottle):
+    """Keyed by the `username` the request is for, or else by the authenticated user."""
+    key_name = 'username'
+
+    def get_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if isinstance(username, str) and username.strip():
+            return username.strip().lower()
+        if request.user and request.user.is_authenticated:
+            return request.user.get_username().lower()
+        return None
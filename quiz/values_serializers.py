@@ -0,0 +1,134 @@
+from collections import defaultdict
+
+from django.db.models.fields.files import FieldFile
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from quiz.metrics import timed
+from quiz.models import Option
+from quiz.search import RANK_ANNOTATION
+from quiz.serializers import SubjectsSerializer, TestsSerializer, QuestionsSerializer, ShopSerializer
+
+
+# DRF fields whose representation of a database value is a plain conversion
+CONVERTERS = {
+    serializers.CharField: str,
+    serializers.IntegerField: int,
+    serializers.FloatField: float,
+    serializers.BooleanField: bool,
+}
+
+
+class ValuesSerializer:
+    """
+    Read-only twin of a `ModelSerializer` for list endpoints.
+
+    Rows are read with `.values()` and turned into dicts directly, without
+    model instances or per-row field lookups, but with the same keys, order
+    and representations as `serializer_class`, so the rendered JSON is
+    identical. Fields listed in `related_fields` are filled in by
+    `add_related()` from one extra query per page.
+    """
+    serializer_class = None
+    related_fields = ()
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        self.columns = []
+        for name, field in self.serializer_class(context=self.context).fields.items():
+            if field.write_only:
+                continue
+            if name in self.related_fields:
+                self.columns.append((name, None, None))
+                continue
+            self.columns.append((name, field.source.replace('.', '__'), self.converter(field)))
+
+    def converter(self, field):
+        if isinstance(field, serializers.FileField):
+            model_field = self.serializer_class.Meta.model._meta.get_field(field.source)
+            return lambda name: field.to_representation(FieldFile(None, model_field, name))
+        for field_class, converter in CONVERTERS.items():
+            if type(field) is field_class:
+                return converter
+        return field.to_representation
+
+    def values(self, queryset, extra=()):
+        lookups = [lookup for _, lookup, _ in self.columns if lookup is not None]
+        return queryset.prefetch_related(None).values(*dict.fromkeys([*lookups, *extra]))
+
+    def values_for_view(self, queryset, view):
+        """`values()` with the columns the keyset pagination of `view` reads, too."""
+        extra = ['pk', *getattr(view, 'keyset_ordering_fields', ())]
+        if RANK_ANNOTATION in queryset.query.annotations:
+            extra.append(RANK_ANNOTATION)
+        return self.values(queryset, extra)
+
+    def related(self, rows):
+        """The query for the related rows of a page, or None."""
+        return None
+
+    def add_related(self, data, rows, related_rows):
+        pass
+
+    def represent(self, rows, related_rows=()):
+        with timed('serialize'):
+            data = [
+                {
+                    name: None if lookup is None or row[lookup] is None else convert(row[lookup])
+                    for name, lookup, convert in self.columns
+                }
+                for row in rows
+            ]
+            if self.related_fields:
+                self.add_related(data, rows, related_rows)
+        return data
+
+    def to_representation(self, rows):
+        related = self.related(rows)
+        return self.represent(rows, () if related is None else list(related))
+
+
+class SubjectsValuesSerializer(ValuesSerializer):
+    serializer_class = SubjectsSerializer
+
+
+class TestsValuesSerializer(ValuesSerializer):
+    serializer_class = TestsSerializer
+
+
+class ShopValuesSerializer(ValuesSerializer):
+    serializer_class = ShopSerializer
+
+
+class QuestionsValuesSerializer(ValuesSerializer):
+    serializer_class = QuestionsSerializer
+    related_fields = ('options', )
+
+    def related(self, rows):
+        return (
+            Option.objects.filter(question_id__in=[row['pk'] for row in rows])
+            .order_by('pk')
+            .values_list('question_id', 'name', 'is_true')
+        )
+
+    def add_related(self, data, rows, related_rows):
+        options = defaultdict(list)
+        for question_id, name, is_true in related_rows:
+            options[question_id].append({"name": name, "is_true": is_true})
+        for item, row in zip(data, rows):
+            item['options'] = options.get(row['pk'], [])
+
+
+class ValuesListMixin:
+    """Serve a `ListAPIView` through its `values_serializer_class`, if it has one."""
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if self.values_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+        serializer = self.values_serializer_class(context=self.get_serializer_context())
+        queryset = serializer.values_for_view(self.filter_queryset(self.get_queryset()), self)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(serializer.to_representation(queryset))
+        return self.get_paginated_response(serializer.to_representation(page))
@@ -0,0 +1,158 @@
+import atexit
+import secrets
+import threading
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connections
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+from quiz.models import User, UserConfirmation
+
+CODE_LENGTH = 4
+
+
+def new_code():
+    return ''.join(secrets.choice('0123456789') for _ in range(CODE_LENGTH))
+
+
+def code_ttl():
+    return getattr(settings, 'VERIFICATION_CODE_TTL', 300)
+
+
+class AuditLog:
+    """
+    Buffer of issued and consumed codes, written to `UserConfirmation` with
+    one `bulk_create` per `batch_size` entries, at most `interval` seconds
+    after the oldest buffered one, and when the process exits. A process
+    that is killed loses no more than `interval` seconds of entries.
+    Entries of users deleted in the meantime are dropped.
+    """
+
+    def __init__(self, batch_size=100, interval=5):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = []
+        self.timer = None
+
+    def record(self, user_id, code, expire_time, is_confirmed):
+        with self.lock:
+            self.pending.append(UserConfirmation(
+                user_id=user_id, code=int(code), expire_time=expire_time, is_confirmed=is_confirmed,
+            ))
+            if len(self.pending) < self.batch_size:
+                if self.timer is None:
+                    self.timer = threading.Timer(self.interval, self.flush_in_thread)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+            rows = self.take()
+        self.write(rows)
+
+    def take(self):
+        # called with the lock held
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        rows, self.pending = self.pending, []
+        return rows
+
+    def flush(self):
+        with self.lock:
+            rows = self.take()
+        self.write(rows)
+
+    def flush_in_thread(self):
+        try:
+            self.flush()
+        finally:
+            # the timer thread's own connection
+            connections.close_all()
+
+    @staticmethod
+    def write(rows):
+        if not rows:
+            return
+        try:
+            UserConfirmation.objects.bulk_create(rows)
+        except IntegrityError:
+            existing = set(User.objects.filter(pk__in={row.user_id for row in rows}).values_list('pk', flat=True))
+            UserConfirmation.objects.bulk_create([row for row in rows if row.user_id in existing])
+
+
+audit_log = AuditLog(
+    batch_size=getattr(settings, 'VERIFICATION_AUDIT_BATCH_SIZE', 100),
+    interval=getattr(settings, 'VERIFICATION_AUDIT_INTERVAL', 5),
+)
+atexit.register(audit_log.flush)
+
+
+class CodeStore:
+    """Issues verification codes and consumes each of them at most once before it expires."""
+
+    def issue(self, user_id):
+        """Create a new code for a user and return it."""
+        raise NotImplementedError
+
+    def consume(self, user_id, code):
+        """True if `code` is a live code of the user, which is then spent."""
+        raise NotImplementedError
+
+
+class CacheCodeStore(CodeStore):
+    """
+    Codes live in the Django cache under one key per (user, code) and expire
+    with the key; the default store. Consuming a code is a `delete()`, which only one caller
+    can win, so a code cannot be spent twice even by concurrent requests.
+    `VERIFICATION_CODE_AUDIT` keeps a record of codes in `UserConfirmation`.
+    """
+
+    @staticmethod
+    def key(user_id, code):
+        return f'quiz:verification:{user_id}:{code}'
+
+    def issue(self, user_id):
+        code = new_code()
+        expire_time = now() + timedelta(seconds=code_ttl())
+        # the deadline in the value guards backends that report expired keys as deleted
+        cache.set(self.key(user_id, code), expire_time.timestamp(), code_ttl())
+        if getattr(settings, 'VERIFICATION_CODE_AUDIT', False):
+            audit_log.record(user_id, code, expire_time, is_confirmed=False)
+        return code
+
+    def consume(self, user_id, code):
+        key = self.key(user_id, code)
+        deadline = cache.get(key)
+        if deadline is None or deadline < now().timestamp() or not cache.delete(key):
+            return False
+        if getattr(settings, 'VERIFICATION_CODE_AUDIT', False):
+            audit_log.record(user_id, code, datetime.fromtimestamp(deadline, timezone.utc), is_confirmed=True)
+        return True
+
+
+class DatabaseCodeStore(CodeStore):
+    """
+    Codes as `UserConfirmation` rows: they survive a flush of the cache, at
+    the cost of a row per code and `purge_verification_codes` to delete them.
+    """
+
+    def issue(self, user_id):
+        code = new_code()
+        UserConfirmation.objects.create(
+            user_id=user_id, code=int(code), expire_time=now() + timedelta(seconds=code_ttl()),
+        )
+        return code
+
+    def consume(self, user_id, code):
+        # one conditional update both checks and spends the code
+        return UserConfirmation.objects.filter(
+            user_id=user_id, code=int(code), is_confirmed=False, expire_time__gte=now(),
+        ).update(is_confirmed=True) > 0
+
+
+def code_store():
+    """The `CodeStore` named by `VERIFICATION_CODE_STORE`."""
+    return import_string(getattr(settings, 'VERIFICATION_CODE_STORE', 'quiz.verification.CacheCodeStore'))()
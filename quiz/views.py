@@ -1,23 +1,46 @@
 import datetime
-from django.utils.timezone import now
+import random
 from django.contrib.auth import authenticate
+from django.db import transaction
+from django.http import HttpResponse, Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import OpenApiExample, extend_schema
+from drf_spectacular.utils import OpenApiExample, OpenApiParameter, extend_schema
 from rest_framework import status, permissions, generics
 from rest_framework.exceptions import ValidationError
-from rest_framework.filters import SearchFilter
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from quiz import grading, question_pools, shop
+from quiz.answer_keys import get_answer_key
+from quiz.authentication import StatelessJWTAuthentication
+from quiz.bundles import get_test_bundle
+from quiz.cache import CatalogueCacheMixin, catalogue_cache
+from quiz.compression import CompressionMixin
+from quiz.export import FORMATS, export_stream
 from quiz.filters import TestFilter, SubjectFilter, QuestionsFilter
-from quiz.models import User, Subjects, Test, Question, Shop
+from quiz.jobs import enqueue
+from quiz.leaderboard import leaderboard
+from quiz.metrics import timed
+from quiz.models import User, Subjects, Test, Question, Option, Shop, Attempt
+from quiz.profiles import get_profile
+from quiz.search import FullTextSearchFilter
 from quiz.serializers import RegisterSerializer, LoginSerializer, RefreshTokenSerializer, ConfSerializer, \
     SubjectsSerializer, TestsSerializer, QuestionsSerializer, ShopSerializer, BuyItemInShopSerializer, \
-    ProfileUserSerializer, ChangePasswordSerializer
+    ProfileUserSerializer, ChangePasswordSerializer, TestBundleSerializer, SubmitAnswersSerializer, \
+    LeaderboardQuerySerializer, LeaderboardEntrySerializer, LeaderboardRankSerializer, RandomQuizQuerySerializer, \
+    RandomQuizSerializer, ProfileSerializer, ShopItemSerializer
+from quiz.throttling import IPThrottle, UsernameThrottle
+from quiz.values_serializers import ValuesListMixin, SubjectsValuesSerializer, TestsValuesSerializer, \
+    QuestionsValuesSerializer, ShopValuesSerializer
+from quiz.verification import code_store
 
 
 class RegisterAPIView(APIView):
+    throttle_classes = (IPThrottle, UsernameThrottle)
+    throttle_scope = 'register'
+
     @extend_schema(
         tags=["auth"],
         request=RegisterSerializer,
@@ -37,7 +60,8 @@ class RegisterAPIView(APIView):
         print(request.user)
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
+            with transaction.atomic():
+                user = serializer.save()
             refresh = RefreshToken.for_user(user)
             return Response({
                 "user": serializer.data,
@@ -48,6 +72,9 @@ class RegisterAPIView(APIView):
 
 
 class LoginAPIView(APIView):
+    throttle_classes = (IPThrottle, UsernameThrottle)
+    throttle_scope = 'login'
+
     @extend_schema(
         tags=["auth"],
         request=LoginSerializer,
@@ -128,19 +155,15 @@ class ConfirmUserAPIView(APIView):
 
     @staticmethod
     def verify_code(user, code):
-        verification = user.code.filter(
-            code=code,
-            is_confirmed=False,
-            expire_time__gte=now()
-        )
-        if not verification.exists():
+        if not code_store().consume(user.pk, code):
             raise ValidationError({
                 'status': 'Fail',
                 'message': 'Code is invalid or expired.'
             })
-        verification.update(is_confirmed=True)
-        user.is_verified = True
-        user.save()
+        with transaction.atomic():
+            user.is_verified = True
+            user.save(update_fields=['is_verified'])
+            enqueue('send_account_verified', user_id=user.pk)
         return user
 
 # Test Endpoints
@@ -148,12 +171,17 @@ class ConfirmUserAPIView(APIView):
 @extend_schema(
         request=SubjectsSerializer,
     )
-class SubjectsAPIView(generics.ListAPIView):
+class SubjectsAPIView(CompressionMixin, CatalogueCacheMixin, ValuesListMixin, generics.ListAPIView):
+    authentication_classes = (StatelessJWTAuthentication, )
+    cache_models = (Subjects, )
     queryset = Subjects.objects.all()
     serializer_class = SubjectsSerializer
+    values_serializer_class = SubjectsValuesSerializer
     permission_classes = (permissions.IsAuthenticated, )
-    filter_backends = (DjangoFilterBackend, SearchFilter)
+    filter_backends = (DjangoFilterBackend, FullTextSearchFilter)
     filterset_class = SubjectFilter
+    search_fields = ('name', )
+    keyset_ordering_fields = ('name', )
 
 
     # def get(self, request):
@@ -161,89 +189,323 @@ class SubjectsAPIView(generics.ListAPIView):
     #     serializer = SubjectsSerializer(subjects, many=True)
     #     return Response(serializer.data, status=status.HTTP_200_OK)
 
-class SubjectDetailAPIView(generics.RetrieveAPIView):
+class SubjectDetailAPIView(CatalogueCacheMixin, generics.RetrieveAPIView):
+    authentication_classes = (StatelessJWTAuthentication, )
+    cache_models = (Subjects, )
     permission_classes = (permissions.IsAuthenticated, )
     queryset = Subjects.objects.all()
     serializer_class = SubjectsSerializer
 
-class TestsAPIView(generics.ListAPIView):
-    queryset = Test.objects.all()
+class TestsAPIView(CompressionMixin, CatalogueCacheMixin, ValuesListMixin, generics.ListAPIView):
+    authentication_classes = (StatelessJWTAuthentication, )
+    cache_models = (Test, Subjects)
+    queryset = Test.objects.select_related('subject')
     serializer_class = TestsSerializer
+    values_serializer_class = TestsValuesSerializer
     permission_classes = (permissions.IsAuthenticated, )
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter]
     # filterset_fields = ['subject', ]
-    # search_fields = ['subject__name', ]
+    search_fields = ['name', ]
     filterset_class = TestFilter
+    keyset_ordering_fields = ('name', 'level', 'balls')
 
-class TestDetailAPIView(generics.RetrieveAPIView):
+class TestDetailAPIView(CatalogueCacheMixin, generics.RetrieveAPIView):
+    authentication_classes = (StatelessJWTAuthentication, )
+    cache_models = (Test, Subjects)
     permission_classes = (permissions.IsAuthenticated, )
-    queryset = Test.objects.all()
+    queryset = Test.objects.select_related('subject')
     serializer_class = TestsSerializer
 
-class QuestionsAPIView(generics.ListAPIView):
-    queryset = Question.objects.all()
+class TestBundleAPIView(APIView):
+    permission_classes = (permissions.IsAuthenticated, )
+
+    @extend_schema(responses=TestBundleSerializer)
+    def get(self, request, pk):
+        bundle = get_test_bundle(pk)
+        if bundle is None:
+            raise Http404
+        etag, body = bundle
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+class RandomQuizAPIView(APIView):
+    """
+    `n` random questions of a subject, of one `level` or of all of them.
+    Passing back the returned `seed` repeats the same draw.
+    """
+    permission_classes = (permissions.IsAuthenticated, )
+
+    @extend_schema(parameters=[RandomQuizQuerySerializer], responses=RandomQuizSerializer)
+    def get(self, request):
+        query = RandomQuizQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        subject = query.validated_data['subject']
+        lookup = {'pk': int(subject)} if subject.isdigit() else {'name': subject}
+        subject_id = Subjects.objects.filter(**lookup).values_list('pk', flat=True).first()
+        if subject_id is None:
+            raise Http404
+        level = query.validated_data.get('level')
+        levels = [level] if level else Test.LevelChoices.values
+        seed = query.validated_data.get('seed')
+        if seed is None:
+            seed = random.getrandbits(32)
+        ids = question_pools.draw(subject_id, levels, query.validated_data['n'], seed)
+        return Response(RandomQuizSerializer({
+            'seed': seed,
+            'questions': question_pools.load_questions(ids),
+        }).data)
+
+class TestSubmitAPIView(APIView):
+    permission_classes = (permissions.IsAuthenticated, )
+
+    @extend_schema(
+        request=SubmitAnswersSerializer,
+        examples=[
+            OpenApiExample(
+                name="Example of Submit Request",
+                value={
+                    'answers': [{'question': 1, 'option': 2}, {'question': 3, 'option': 5}]
+                },
+                description="All answers of a test, one option per question"
+            )
+        ]
+    )
+    def post(self, request, pk):
+        serializer = SubmitAnswersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            attempt, correct, balls = grading.submit(request.user, pk, serializer.validated_data['answers'])
+        except grading.TestNotFound:
+            raise Http404
+        return Response({
+            "attempt": attempt.pk,
+            "correct": attempt.correct,
+            "total": attempt.total,
+            "balls": balls,
+            "results": {
+                question: question in correct for question in serializer.validated_data['answers']
+            },
+        }, status=status.HTTP_201_CREATED)
+
+class AttemptReviewAPIView(APIView):
+    permission_classes = (permissions.IsAuthenticated, )
+
+    def get(self, request, pk):
+        attempt = Attempt.objects.filter(pk=pk, user=request.user).first()
+        if attempt is None:
+            raise Http404
+        key = get_answer_key(attempt.test_id)
+        review = []
+        for question in key.questions:
+            answer = attempt.answers.get(str(question))
+            correct_option = key.correct_option(question)
+            review.append({
+                "question": question,
+                "answer": answer,
+                "correct_option": correct_option,
+                "is_correct": answer is not None and answer == correct_option,
+            })
+        return Response({
+            "attempt": attempt.pk,
+            "test": attempt.test_id,
+            "correct": attempt.correct,
+            "total": attempt.total,
+            "balls": attempt.balls,
+            "created_at": attempt.created_at,
+            "questions": review,
+        })
+
+class QuestionsAPIView(CompressionMixin, CatalogueCacheMixin, ValuesListMixin, generics.ListAPIView):
+    cache_models = (Question, Option, Test)
+    queryset = Question.objects.select_related('test').prefetch_related('options')
     serializer_class = QuestionsSerializer
+    values_serializer_class = QuestionsValuesSerializer
     permission_classes = (permissions.IsAuthenticated, )
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter]
     filterset_class = QuestionsFilter
+    search_fields = ['about', ]
+    keyset_ordering_fields = ('test_id', )
 
 class QuestionDetailAPIView(generics.RetrieveAPIView):
-    queryset = Question.objects.all()
+    queryset = Question.objects.select_related('test').prefetch_related('options')
     serializer_class = QuestionsSerializer
     permission_classes = (permissions.IsAuthenticated, )
 
-class ShopGetItemsAPIView(APIView):
-    permission_classes = (permissions.IsAuthenticated, )
+class QuestionExportAPIView(APIView):
+    """
+    Stream the question bank, answers included, as NDJSON or CSV
+    (`?output=csv`) in the `import_questions` layout. `?gzip=1` compresses on the fly; the filters
+    of the question list apply.
+    """
+    permission_classes = (permissions.IsAdminUser, )
+
     @extend_schema(
-        request=ShopSerializer,
+        parameters=[
+            OpenApiParameter('output', enum=list(FORMATS), default='ndjson'),
+            OpenApiParameter('gzip', bool, default=False),
+        ],
+        responses={(200, 'application/x-ndjson'): bytes, (200, 'text/csv'): bytes},
     )
     def get(self, request):
-        shop = Shop.objects.all()
-        serializer = ShopSerializer(shop, many=True)
-        return Response(serializer.data)
+        # not `format`, which DRF reserves for picking a renderer
+        fmt = request.query_params.get('output', 'ndjson')
+        if fmt not in FORMATS:
+            raise ValidationError({'output': f'Choose one of: {", ".join(FORMATS)}.'})
+        filterset = QuestionsFilter(request.query_params, queryset=Question.objects.all(), request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        compress = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes')
+        _, content_type, extension = FORMATS[fmt]
+        filename = f'questions.{extension}'
+        if compress:
+            content_type, filename = 'application/gzip', f'{filename}.gz'
+        response = StreamingHttpResponse(export_stream(fmt, compress, queryset=filterset.qs), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class ShopGetItemsAPIView(CompressionMixin, CatalogueCacheMixin, ValuesListMixin, generics.ListAPIView):
+    authentication_classes = (StatelessJWTAuthentication, )
+    cache_models = (Shop, )
+    permission_classes = (permissions.IsAuthenticated, )
+    queryset = Shop.objects.all()
+    serializer_class = ShopSerializer
+    values_serializer_class = ShopValuesSerializer
+    keyset_ordering_fields = ('name', 'price')
 
-class ShopRetrieveAPIView(generics.RetrieveAPIView):
+class ShopRetrieveAPIView(CatalogueCacheMixin, generics.RetrieveAPIView):
+    authentication_classes = (StatelessJWTAuthentication, )
+    cache_models = (Shop, )
     permission_classes = (permissions.IsAuthenticated, )
     queryset = Shop.objects.all()
     serializer_class = ShopSerializer
 
+class CatalogueCacheStatsAPIView(APIView):
+    permission_classes = (permissions.IsAdminUser, )
+    def get(self, request):
+        return Response(catalogue_cache.stats())
+
 class ShopBuyItemAPIView(APIView):
     permission_classes = (permissions.IsAuthenticated, )
-    @extend_schema(request=BuyItemInShopSerializer)
+    @extend_schema(
+        request=BuyItemInShopSerializer,
+        parameters=[OpenApiParameter(
+            'Idempotency-Key', location=OpenApiParameter.HEADER, required=False,
+            description="Retrying a purchase with the same key returns the first result without charging again; "
+                        "reusing it for another item is refused with a 422. "
+                        f"At most {shop.IDEMPOTENCY_KEY_MAX_LENGTH} characters."
+        )]
+    )
     def post(self, request):
         user = request.user
         serializer = BuyItemInShopSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        shop_item = Shop.objects.filter(name=serializer.validated_data.get('name')).first()
-
-        if not shop_item:
-            return Response({"error": "Item not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        if user.balls < shop_item.price:
-            return Response({"error": "Not enough balls to buy the item."}, status=status.HTTP_400_BAD_REQUEST)
-
-        user.balls -= shop_item.price
-        user.save()
-        user.gifts.add(shop_item)
-
-        return Response({"message": "Item purchased successfully!"}, status=status.HTTP_200_OK)
+        item_id = serializer.validated_data.get('id')
+        if item_id is None:
+            item_id = Shop.objects.filter(name=serializer.validated_data['name']).values_list('pk', flat=True).first()
+
+        try:
+            purchase, created = shop.purchase(user, item_id, request.headers.get('Idempotency-Key'))
+        except shop.ItemNotFound as e:
+            return Response({"error": e.message}, status=status.HTTP_404_NOT_FOUND)
+        except shop.IdempotencyKeyReused as e:
+            return Response({"error": e.message}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except shop.PurchaseError as e:
+            return Response({"error": e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "message": "Item purchased successfully!",
+            "purchase": purchase.pk,
+            "item": purchase.item_id,
+            "price": purchase.price,
+        }, status=status.HTTP_200_OK)
 
 class ProfileUserGetUpdateAPIView(APIView):
+    """
+    The profile document of the current user, served from cached pieces;
+    gifts beyond the first `PROFILE_GIFTS` are paged at `gifts_next`.
+    """
     permission_classes = (permissions.IsAuthenticated, )
+
+    @extend_schema(responses=ProfileSerializer)
     def get(self, request):
-        user = request.user
-        serializer = ProfileUserSerializer(user)
-        return Response(serializer.data)
-    @extend_schema(request=ProfileUserSerializer)
+        etag, body = self.profile(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+    @extend_schema(request=ProfileUserSerializer, responses=ProfileSerializer)
     def put(self, request):
         user = request.user
         serializer = ProfileUserSerializer(user, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        return Response(serializer.data)
+        return HttpResponse(self.profile(request, refresh=True)[1], content_type='application/json')
+
+    @staticmethod
+    def profile(request, refresh=False):
+        with timed('serialize'):
+            profile = get_profile(request.user.pk, request.build_absolute_uri('/profile/gifts/'), refresh)
+        if profile is None:
+            raise Http404
+        return profile
+
+class ProfileGiftsAPIView(generics.ListAPIView):
+    """The gifts of the current user, a page at a time."""
+    serializer_class = ShopItemSerializer
+    permission_classes = (permissions.IsAuthenticated, )
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            # schema generation, with no user to filter by
+            return Shop.objects.none()
+        return Shop.objects.filter(gift=self.request.user)
+
+class LeaderboardAPIView(APIView):
+    """Top users by balls, overall or within one `level`."""
+    permission_classes = (permissions.IsAuthenticated, )
+
+    @extend_schema(parameters=[LeaderboardQuerySerializer], responses=LeaderboardEntrySerializer(many=True))
+    def get(self, request):
+        query = LeaderboardQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        level = query.validated_data.get('level')
+        users = User.objects.order_by('-balls', 'id')
+        if level:
+            users = users.filter(level=level)
+        top = list(users.values('id', 'username', 'level', 'balls')[:query.validated_data['limit']])
+        # users with equal balls share a rank
+        for entry, rank in zip(top, leaderboard.ranks([entry['balls'] for entry in top], level)):
+            entry['rank'] = rank
+        with timed('serialize'):
+            data = LeaderboardEntrySerializer(top, many=True).data
+        return Response(data)
+
+class LeaderboardRankAPIView(APIView):
+    """The rank of the current user, overall or among the users of one `level`."""
+    permission_classes = (permissions.IsAuthenticated, )
+
+    @extend_schema(parameters=[LeaderboardQuerySerializer], responses=LeaderboardRankSerializer)
+    def get(self, request):
+        query = LeaderboardQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        level = query.validated_data.get('level')
+        # the authenticated user may come from a cache; the rank needs current balls
+        balls = User.objects.filter(pk=request.user.pk).values_list('balls', flat=True).get()
+        return Response(LeaderboardRankSerializer({
+            'rank': leaderboard.rank(balls, level),
+            'balls': balls,
+            'total': leaderboard.size(level),
+        }).data)
 
 class ChangePasswordAPIView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
+    throttle_classes = (IPThrottle, UsernameThrottle)
+    throttle_scope = 'change_password'
     @extend_schema(request=ChangePasswordSerializer, tags=['auth'])
     def post(self, request):
         serializer = ChangePasswordSerializer(data=request.data, context={'request': request})
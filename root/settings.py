@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -40,6 +41,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so that it times the whole stack
+    'quiz.metrics.MetricsMiddleware',
+    'quiz.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,10 +81,42 @@ WSGI_APPLICATION = 'root.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # overridable so benchmark servers can be pointed at a seeded database
+        'NAME': os.environ.get('QUIZ_DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            # Every transaction takes the write lock when it starts, instead of
+            # failing with "database is locked" when a reader tries to upgrade.
+            # Transactions that only read wait for writers too. Keep reads out
+            # of atomic blocks, as the catalogue views do, and they run
+            # concurrently in WAL mode.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+            # In WAL mode, synchronous=NORMAL syncs at checkpoints, not on every
+            # commit. A crash of the application loses nothing, but a power
+            # failure or an OS crash may lose the last commits. Set
+            # QUIZ_SQLITE_SYNCHRONOUS=FULL where that is not acceptable.
+            'init_command': 'PRAGMA journal_mode=WAL; '
+                            f"PRAGMA synchronous={os.environ.get('QUIZ_SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        },
     }
 }
 
+# Read replicas of `default` for catalogue reads (quiz.routers), e.g.
+# QUIZ_REPLICA_DATABASE_NAMES=replica1.sqlite3,replica2.sqlite3 for SQLite
+# copies kept in sync by `manage.py sync_replicas --interval 1`.
+DATABASE_REPLICAS = []
+for index, name in enumerate(filter(None, os.environ.get('QUIZ_REPLICA_DATABASE_NAMES', '').split(','))):
+    DATABASE_REPLICAS.append(f'replica{index}')
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'NAME': name,
+        # tests read the rows they wrote to the test database
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['quiz.routers.ReplicaRouter']
+# seconds a replica may trail the primary
+REPLICA_LAG = float(os.environ.get('QUIZ_REPLICA_LAG', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -127,9 +163,20 @@ REST_FRAMEWORK = {
     # YOUR SETTINGS
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'quiz.authentication.CachedJWTAuthentication',
     ),
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_PAGINATION_CLASS': 'quiz.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
+    # token buckets of quiz.throttling: '<throttle_scope>_<ip|username>'
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_username': '5/min',
+        'register_ip': '10/min',
+        'register_username': '3/min',
+        'change_password_ip': '10/min',
+        'change_password_username': '5/min',
+    },
 }
 
 SPECTACULAR_SETTINGS = {
@@ -177,4 +224,52 @@ SIMPLE_JWT = {
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
-}
\ No newline at end of file
+}
+
+# Shared by the web processes and `run_workers`: catalogue versions, answer
+# keys, the leaderboard log, verification codes, throttle buckets, replica
+# pins and profiles. Version bumps, leaderboard sequence numbers and throttle
+# locks rely on add() and incr() being atomic across processes, which only
+# the Redis and Memcached backends guarantee; quiz.checks refuses the others.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('QUIZ_REDIS_URL', 'redis://127.0.0.1:6379/0'),
+        # lets several deployments, or benchmark servers, share one Redis
+        'KEY_PREFIX': os.environ.get('QUIZ_CACHE_KEY_PREFIX', ''),
+    },
+}
+
+# Read-through cache for subjects, tests and shop items (quiz.cache)
+CATALOGUE_CACHE_MAXSIZE = 1024  # entries kept per process
+CATALOGUE_CACHE_TIMEOUT = 300  # seconds in the shared cache
+
+# e.g. behind a gateway that already limits the auth endpoints
+if os.environ.get('QUIZ_THROTTLING', 'on') == 'off':
+    REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] = {}
+
+# Per-process token buckets in front of the shared ones (quiz.throttling)
+THROTTLE_LOCAL_MAXSIZE = 10000
+
+# Per-process cache of authenticated users (quiz.authentication)
+AUTH_USER_CACHE_MAXSIZE = 10000
+AUTH_USER_CACHE_TTL = 30  # seconds another process may serve a changed user
+
+# Verification codes (quiz.verification)
+# CacheCodeStore keeps codes in the shared cache, where they expire on their
+# own; DatabaseCodeStore keeps them as UserConfirmation rows instead
+VERIFICATION_CODE_STORE = 'quiz.verification.CacheCodeStore'
+VERIFICATION_CODE_TTL = 300  # seconds
+VERIFICATION_CODE_AUDIT = False  # CacheCodeStore: also record codes in UserConfirmation, in batches
+VERIFICATION_AUDIT_INTERVAL = 5  # seconds a batch may wait before it is written
+
+# Background jobs (quiz.jobs), run by `manage.py run_workers`
+JOB_LEASE = 300  # seconds a worker may hold a job
+JOB_RETRY_DELAY = 10  # seconds before the first retry, doubled on every further one
+
+EMAIL_BACKEND = os.environ.get('QUIZ_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+
+# Per-request instrumentation (quiz.metrics), exported on /metrics
+METRICS_SLOW_REQUEST_MS = 500  # log requests slower than this
+METRICS_SLOW_TOP_SQL = 5  # statements shown per slow request
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')  # clients that may scrape /metrics
@@ -2,9 +2,13 @@ from django.contrib import admin
 from django.urls import path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from quiz.async_views import AsyncReadView
+from quiz.metrics import metrics_view
 from quiz.views import RegisterAPIView, LoginAPIView, RefreshTokenAPIView, ConfirmUserAPIView, SubjectsAPIView, \
     TestsAPIView, SubjectDetailAPIView, TestDetailAPIView, QuestionsAPIView, QuestionDetailAPIView, ShopGetItemsAPIView, \
-    ShopBuyItemAPIView, ProfileUserGetUpdateAPIView, ShopRetrieveAPIView, ChangePasswordAPIView
+    ShopBuyItemAPIView, ProfileUserGetUpdateAPIView, ShopRetrieveAPIView, ChangePasswordAPIView, TestBundleAPIView, \
+    CatalogueCacheStatsAPIView, TestSubmitAPIView, AttemptReviewAPIView, QuestionExportAPIView, \
+    LeaderboardAPIView, LeaderboardRankAPIView, RandomQuizAPIView, ProfileGiftsAPIView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -23,13 +27,34 @@ urlpatterns = [
     # tests
     path('tests/', TestsAPIView.as_view()),
     path('tests/<int:pk>/', TestDetailAPIView.as_view()),
+    path('tests/<int:pk>/bundle/', TestBundleAPIView.as_view()),
+    path('tests/<int:pk>/submit/', TestSubmitAPIView.as_view()),
+    path('quiz/random/', RandomQuizAPIView.as_view()),
+    path('attempts/<int:pk>/', AttemptReviewAPIView.as_view()),
     # questions
     path('questions/', QuestionsAPIView.as_view()),
     path('questions/<int:pk>/', QuestionDetailAPIView.as_view()),
+    path('questions/export/', QuestionExportAPIView.as_view()),
     # shop
     path('shop/', ShopGetItemsAPIView.as_view()),
     path('shop/item/<int:pk>/', ShopRetrieveAPIView.as_view()),
     path('shop/buy/', ShopBuyItemAPIView.as_view()),
+    path('cache/stats/', CatalogueCacheStatsAPIView.as_view()),
+    # async twins of the read endpoints, for ASGI deployments
+    path('async/subjects/', AsyncReadView.as_view(sync_view=SubjectsAPIView)),
+    path('async/subjects/<int:pk>/', AsyncReadView.as_view(sync_view=SubjectDetailAPIView)),
+    path('async/tests/', AsyncReadView.as_view(sync_view=TestsAPIView)),
+    path('async/tests/<int:pk>/', AsyncReadView.as_view(sync_view=TestDetailAPIView)),
+    path('async/questions/', AsyncReadView.as_view(sync_view=QuestionsAPIView)),
+    path('async/questions/<int:pk>/', AsyncReadView.as_view(sync_view=QuestionDetailAPIView)),
+    path('async/shop/', AsyncReadView.as_view(sync_view=ShopGetItemsAPIView)),
+    path('async/shop/item/<int:pk>/', AsyncReadView.as_view(sync_view=ShopRetrieveAPIView)),
+    # leaderboard
+    path('leaderboard/', LeaderboardAPIView.as_view()),
+    path('leaderboard/me/', LeaderboardRankAPIView.as_view()),
     # profile
     path('profile/', ProfileUserGetUpdateAPIView.as_view()),
+    path('profile/gifts/', ProfileGiftsAPIView.as_view()),
+    # Prometheus scrape target
+    path('metrics', metrics_view),
 ]